@@ -8,6 +8,7 @@ import logging
 import asyncio
 from aiohttp import web
 from utils.config import HOST, PORT
+from utils.cache import flush_metadata
 from handlers.webapp_handler import create_api_app
 
 # Настройка логирования
@@ -36,9 +37,11 @@ async def main():
     logger.info(f"API Server started on http://{HOST}:{api_port}")
     logger.info("Available endpoints:")
     logger.info(f"  GET  /api/health - Health check")
-    logger.info(f"  GET  /api/feed?chat_id=<id> - Get video feed for chat")
+    logger.info(f"  GET  /api/feed?chat_id=<id>&limit=<n>&before=<cursor> - Get video feed page for chat")
     logger.info(f"  POST /api/react - Send reaction (like/comment)")
     logger.info(f"  GET  /api/video/<file_id> - Get video info")
+    logger.info(f"  GET  /api/video/<file_id>/stream - Stream video file (Range)")
+    logger.info(f"  GET  /api/video/<file_id>/poster|preview - Get feed thumbnails")
     logger.info(f"  GET  /api/stats - Get general statistics")
     
     try:
@@ -49,6 +52,7 @@ async def main():
         logger.info("API Server stopped by user")
     finally:
         await runner.cleanup()
+        flush_metadata()
 
 if __name__ == '__main__':
     try:
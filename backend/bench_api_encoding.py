@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сериализации и сжатия ответов API на ленте из 10k видео
+
+1. Полезная нагрузка из N видео: json.dumps (как web.json_response) против
+   orjson, затем размер и время gzip/brotli.
+2. Живой сервер с временной базой: вся лента чата постранично (limit=100)
+   без сжатия, с gzip и с brotli - байты по сети и время.
+
+Запуск: python bench_api_encoding.py [количество видео]
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+CHAT_ID = -100123
+
+# База и кеш медиа бенчмарка не должны трогать рабочее хранилище
+_storage = tempfile.mkdtemp(prefix='timoreel-bench-')
+os.environ['DATABASE_FILE'] = os.path.join(_storage, 'bench.db')
+os.environ['MEDIA_CACHE_DIR'] = os.path.join(_storage, 'media')
+
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from handlers.webapp_handler import create_api_app, response_cache, with_media_urls  # noqa: E402
+from utils import http_encoding  # noqa: E402
+from utils.database import transaction, flush, close  # noqa: E402
+
+
+def make_videos(count: int) -> list:
+    """Видео в формате ответа /api/feed"""
+    return [
+        with_media_urls({
+            "file_id": f"BAACAgIAAxkBAAI{index:08d}ZmVlZF92aWRlb19maWxlX2lk",
+            "user_id": 100000 + index % 37,
+            "username": f"пользователь_{index % 37}",
+            "timestamp": 1700000000 + index,
+            "has_poster": index % 3 != 0,
+            "has_preview": index % 5 == 0,
+        })
+        for index in range(count)
+    ]
+
+
+def best_ms(func, repeat: int = 5, number: int = 3) -> float:
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number * 1000
+
+
+def bench_payload(count: int):
+    videos = make_videos(count)
+    payload = {"videos": videos, "count": len(videos), "chat_id": CHAT_ID, "next_cursor": None, "has_more": False}
+
+    print(f"Payload: {count} videos")
+    stdlib_ms = best_ms(lambda: json.dumps(payload).encode('utf-8'))
+    print(f"  json.dumps           {stdlib_ms:8.2f} ms  {len(json.dumps(payload).encode('utf-8')):>10} bytes")
+
+    body = http_encoding.dumps_json(payload)
+    encoder = 'orjson' if http_encoding.orjson else 'json (compact)'
+    fast_ms = best_ms(lambda: http_encoding.dumps_json(payload))
+    print(f"  {encoder:<20} {fast_ms:8.2f} ms  {len(body):>10} bytes  x{stdlib_ms / fast_ms:.1f}")
+
+    for encoding in http_encoding.ENCODINGS:
+        compressed = http_encoding.compress(body, encoding)
+        ms = best_ms(lambda: http_encoding.compress(body, encoding), repeat=3, number=1)
+        print(f"  {encoding:<20} {ms:8.2f} ms  {len(compressed):>10} bytes  {len(compressed) / len(body):.1%}")
+
+
+def fill_database(count: int):
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT INTO videos (file_id, chat_id, user_id, username, timestamp) VALUES (?, ?, ?, ?, ?)',
+            [
+                (f"BAACAgIAAxkBAAI{index:08d}ZmVlZF92aWRlb19maWxlX2lk", CHAT_ID,
+                 100000 + index % 37, f"пользователь_{index % 37}", 1700000000 + index)
+                for index in range(count)
+            ]
+        )
+    flush()
+
+
+async def walk_feed(client: TestClient, accept_encoding: str) -> tuple:
+    """Проходит всю ленту; возвращает (видео, байт по сети, секунд)"""
+    videos = wire_bytes = 0
+    before = None
+    started = time.perf_counter()
+    while True:
+        params = {'chat_id': CHAT_ID, 'limit': 100}
+        if before:
+            params['before'] = before
+        response = await client.get('/api/feed', params=params, headers={'Accept-Encoding': accept_encoding})
+        wire_bytes += response.content_length or 0
+        data = await response.json()
+        videos += data['count']
+        before = data['next_cursor']
+        if not before:
+            break
+    return videos, wire_bytes, time.perf_counter() - started
+
+
+async def bench_server(count: int):
+    fill_database(count)
+
+    app = create_api_app()
+    app.on_startup.clear()
+    app.on_cleanup.clear()
+
+    print(f"\nServer: full feed of {count} videos, limit=100")
+    async with TestClient(TestServer(app)) as client:
+        for accept_encoding in ('identity', 'gzip', 'br'):
+            # Первый проход заполняет кеш ответов, второй отдает из него
+            for label in ('cold', 'cached'):
+                videos, wire_bytes, seconds = await walk_feed(client, accept_encoding)
+                print(f"  {accept_encoding:<8} {label:<6} {videos} videos  {wire_bytes:>10} bytes  {seconds * 1000:8.1f} ms")
+            response_cache.clear()
+
+
+if __name__ == '__main__':
+    bench_payload(COUNT)
+    try:
+        asyncio.run(bench_server(COUNT))
+    finally:
+        close()
+        shutil.rmtree(_storage, ignore_errors=True)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк памяти при выгрузке видео в Telegram
+
+Поднимает локальный фейковый Bot API сервер и выгружает файл
+несколькими параллельными запросами двумя способами: bot.send_video
+(python-telegram-bot, файл в памяти) и send_video_file (поток с диска).
+Печатает пик выделенной Python-памяти (tracemalloc) для каждого способа.
+
+Запуск: python bench_upload_memory.py [размер MB] [параллельных выгрузок]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from aiohttp import web
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from utils.telegram_upload import send_video_file, close_upload_session
+
+TOKEN = '123456:bench'
+
+FAKE_MESSAGE = {
+    'message_id': 1,
+    'date': 0,
+    'chat': {'id': 1, 'type': 'private'},
+    'video': {'file_id': 'bench', 'file_unique_id': 'bench', 'width': 1, 'height': 1, 'duration': 1},
+}
+
+
+async def fake_api(request: web.Request) -> web.Response:
+    """Принимает запрос Bot API, вычитывает тело и отвечает успехом"""
+    method = request.match_info['method']
+    # Тело читаем кусками, не накапливая (как настоящий сервер)
+    async for _ in request.content.iter_chunked(1 << 16):
+        pass
+
+    if method == 'getMe':
+        result = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+    else:
+        result = FAKE_MESSAGE
+    return web.json_response({'ok': True, 'result': result})
+
+
+async def measure(name: str, upload, count: int):
+    """Запускает count параллельных выгрузок и печатает время и пик памяти"""
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+
+    await asyncio.gather(*(upload() for _ in range(count)))
+
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    print(f"{name:14s} peak +{(peak - before) / 1024 / 1024:8.1f} MB  {elapsed:6.2f} s")
+
+
+async def main(size_mb: int, count: int):
+    app = web.Application(client_max_size=0)
+    app.router.add_post(f'/bot{TOKEN}/{{method}}', fake_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    bot = Bot(
+        TOKEN,
+        base_url=f'http://127.0.0.1:{port}/bot',
+        request=HTTPXRequest(connection_pool_size=count, write_timeout=60)
+    )
+    await bot.initialize()
+
+    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+        path = f.name
+
+    async def ptb_upload():
+        with open(path, 'rb') as video_file:
+            await bot.send_video(chat_id=1, video=video_file, supports_streaming=True)
+
+    async def streaming_upload():
+        await send_video_file(bot, 1, path, supports_streaming=True)
+
+    print(f"File: {size_mb} MB, {count} parallel uploads")
+    tracemalloc.start()
+    try:
+        await measure('bot.send_video', ptb_upload, count)
+        await measure('streaming', streaming_upload, count)
+    finally:
+        tracemalloc.stop()
+        os.remove(path)
+        await close_upload_session()
+        await bot.shutdown()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    parallel = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    asyncio.run(main(size, parallel))
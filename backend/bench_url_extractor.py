@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк поиска ссылок в сообщениях чата
+
+Сравнивает прежний поиск (каждый шаблон отдельно + общий проход по
+https?://) с одним combined-выражением реестра платформ.
+
+Запуск: python bench_url_extractor.py [количество сообщений]
+"""
+
+import random
+import re
+import sys
+import timeit
+
+from downloader.platforms import find_links
+
+LEGACY_PATTERNS = [
+    r'https?://(?:www\.)?instagram\.com/(?:p|reel|tv)/([A-Za-z0-9_-]+)/?',
+    r'https?://(?:www\.)?instagram\.com/stories/[^/]+/(\d+)/?',
+    r'https?://(?:www\.)?tiktok\.com/@[^/]+/video/(\d+)',
+    r'https?://(?:vm|vt)\.tiktok\.com/([A-Za-z0-9]+)/?',
+    r'https?://(?:www\.)?tiktok\.com/t/([A-Za-z0-9]+)/?',
+]
+
+LEGACY_DOMAINS = ['instagram.com', 'www.instagram.com', 'tiktok.com', 'www.tiktok.com', 'vm.tiktok.com', 'vt.tiktok.com']
+
+
+def legacy_extract(text: str) -> list:
+    """Прежняя реализация extract_urls_from_text (без дедупликации)"""
+    urls = [match.group(0) for pattern in LEGACY_PATTERNS for match in re.finditer(pattern, text, re.IGNORECASE)]
+    for match in re.finditer(r'https?://[^\s]+', text, re.IGNORECASE):
+        if any(domain in match.group(0).lower() for domain in LEGACY_DOMAINS):
+            urls.append(match.group(0))
+    return urls
+
+
+def make_corpus(size: int, seed: int = 42) -> list:
+    """Сообщения чата: в основном обычный текст, часть со ссылками"""
+    rng = random.Random(seed)
+    words = ['привет', 'как', 'дела', 'смотри', 'это', 'видео', 'огонь', 'ахах', 'завтра', 'встречаемся', 'ок']
+    links = [
+        'https://www.instagram.com/reel/C{}/?igsh=abc',
+        'https://vm.tiktok.com/ZM{}/',
+        'https://www.tiktok.com/@user/video/72{}',
+        'https://youtube.com/watch?v={}',
+        'https://example.com/article/{}',
+    ]
+
+    corpus = []
+    for _ in range(size):
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(2, 30)))
+        if rng.random() < 0.15:
+            text += ' ' + rng.choice(links).format(rng.randint(10000, 99999))
+        corpus.append(text)
+    return corpus
+
+
+def bench(name: str, func, corpus: list, repeat: int = 5):
+    """Печатает лучшее время обработки всего корпуса"""
+    best = min(timeit.repeat(lambda: [func(text) for text in corpus], number=1, repeat=repeat))
+    print(f"{name:10s} {best * 1000:8.2f} ms  ({best / len(corpus) * 1e6:.2f} us/message)")
+    return best
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    corpus = make_corpus(size)
+
+    print(f"Corpus: {size} messages")
+    legacy = bench('legacy', legacy_extract, corpus)
+    combined = bench('combined', find_links, corpus)
+    print(f"Speedup: {legacy / combined:.1f}x")
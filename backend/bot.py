@@ -14,8 +14,15 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-from utils.config import BOT_TOKEN, HOST, PORT, WEBHOOK_URL, WEBHOOK_PATH
+from utils.config import (
+    BOT_TOKEN, HOST, PORT, WEBHOOK_URL, WEBHOOK_PATH, MAX_VIDEO_SIZE_MB,
+    TELEGRAM_BASE_URL, TELEGRAM_BASE_FILE_URL, TELEGRAM_LOCAL_MODE
+)
+from utils.cache import flush_metadata
+from downloader.video_downloader import downloader
+from downloader.short_links import close_short_link_resolver
 from handlers.link_handler import handle_all_messages
+from handlers.download_worker import start_download_workers, stop_download_workers
 from handlers.pm_commands import mute_command, unmute_command, likes_command, status_command
 
 # Настройка логирования
@@ -73,7 +80,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
-    help_text = """
+    help_text = f"""
 🆘 Помощь по TimoReel Bot
 
 📋 Основные функции:
@@ -94,14 +101,14 @@ TikTok:
 • https://vt.tiktok.com/ABC123/
 
 ⚠️ Ограничения:
-• Максимальный размер видео: 50MB
+• Максимальный размер видео: {MAX_VIDEO_SIZE_MB}MB
 • Только публичные видео
 • Некоторые видео могут быть недоступны из-за настроек приватности
 
 ❓ Проблемы?
 Если видео не загружается, проверьте:
 1. Ссылка корректная и публичная
-2. Видео не превышает 50MB
+2. Видео не превышает {MAX_VIDEO_SIZE_MB}MB
 3. Аккаунт не заблокирован
 
 Просто отправьте ссылку в чат! 🎬
@@ -125,7 +132,23 @@ def create_application() -> Application:
         raise ValueError("BOT_TOKEN не установлен! Проверьте файл .env")
     
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    # concurrent_updates: пока одно сообщение ждет загрузку видео,
+    # остальные апдейты (команды, другие чаты) обрабатываются параллельно
+    # post_init/post_stop запускают воркеры очереди загрузок при run_polling/run_webhook
+    # post_shutdown закрывает HTTP сессию раскрытия коротких ссылок
+    # base_url/local_mode: свой сервер Bot API (TELEGRAM_API_URL), в local mode - файлы до 2GB
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_BASE_URL)
+        .base_file_url(TELEGRAM_BASE_FILE_URL)
+        .local_mode(TELEGRAM_LOCAL_MODE)
+        .concurrent_updates(True)
+        .post_init(start_download_workers)
+        .post_stop(stop_download_workers)
+        .post_shutdown(close_short_link_resolver)
+        .build()
+    )
     
     # Добавляем обработчики команд
     application.add_handler(CommandHandler("start", start_command))
@@ -168,6 +191,7 @@ async def main():
         logger.info("Starting polling...")
         async with application:
             await application.start()
+            await start_download_workers(application)
             await application.updater.start_polling(drop_pending_updates=True)
             
             # Ждем сигнала остановки
@@ -178,7 +202,11 @@ async def main():
                 logger.info("Bot stopped by user")
             finally:
                 await application.updater.stop()
+                await stop_download_workers(application)
                 await application.stop()
+                await close_short_link_resolver()
+                downloader.shutdown()
+                flush_metadata()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Кеш Telegram file_id по ID видео на платформе
+
+Если ссылку на то же видео прислали повторно (в любой чат), бот
+переотправляет уже загруженный в Telegram file_id - без скачивания
+и без повторной выгрузки файла.
+"""
+
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from utils.config import FILE_ID_CACHE_TTL, FILE_ID_CACHE_MAX_ENTRIES
+from utils.database import read_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdCache:
+    def __init__(self, ttl: int = FILE_ID_CACHE_TTL, max_entries: int = FILE_ID_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, video_key: str) -> Optional[Dict[str, Any]]:
+        """Возвращает {'file_id', 'title'} для видео или None (промах / истек TTL)"""
+        now = int(time.time())
+
+        with read_connection() as conn:
+            row = conn.execute(
+                'SELECT file_id, title, created_at FROM file_id_cache WHERE video_key = ?',
+                (video_key,)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        if self.ttl > 0 and row['created_at'] + self.ttl < now:
+            logger.debug(f"File id cache entry expired: {video_key}")
+            self.invalidate(video_key)
+            return None
+
+        with transaction() as conn:
+            conn.execute(
+                'UPDATE file_id_cache SET last_used = ? WHERE video_key = ?',
+                (now, video_key)
+            )
+
+        logger.info(f"File id cache hit: {video_key}")
+        return {'file_id': row['file_id'], 'title': row['title']}
+
+    def put(self, video_key: str, file_id: str, title: Optional[str] = None):
+        """Запоминает file_id видео и вытесняет давно не использованные записи"""
+        now = int(time.time())
+
+        with transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO file_id_cache (video_key, file_id, title, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (video_key, file_id, title, now, now)
+            )
+
+            if self.max_entries > 0:
+                conn.execute(
+                    'DELETE FROM file_id_cache WHERE video_key IN ('
+                    'SELECT video_key FROM file_id_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+
+        logger.debug(f"File id cached: {video_key} -> {file_id}")
+
+    def invalidate(self, video_key: str):
+        """Удаляет запись (например, если Telegram больше не принимает file_id)"""
+        with transaction() as conn:
+            conn.execute('DELETE FROM file_id_cache WHERE video_key = ?', (video_key,))
+
+
+# Глобальный экземпляр кеша
+file_id_cache = FileIdCache()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Выбор формата по оценке размера до загрузки
+
+TikTok/Instagram часто не отдают filesize, поэтому размер каждого
+формата оцениваем по filesize_approx или битрейту (tbr × duration) и
+выбираем лучший формат, который влезает в лимит Telegram.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(fmt: Dict[str, Any], duration: Optional[float]) -> Tuple[Optional[int], str]:
+    """Оценка размера формата в байтах и ее источник"""
+    if fmt.get('filesize'):
+        return int(fmt['filesize']), 'filesize'
+    if fmt.get('filesize_approx'):
+        return int(fmt['filesize_approx']), 'filesize_approx'
+
+    if duration:
+        # Битрейты в yt-dlp - кбит/с
+        kbps = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+        if kbps:
+            return int(kbps * 1000 / 8 * duration), 'tbr'
+
+    return None, 'unknown'
+
+
+def _is_playable(fmt: Dict[str, Any]) -> bool:
+    """Формат содержит видео и звук в одном файле (склейка не нужна)"""
+    return fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none'
+
+
+def select_format(info: Dict[str, Any], max_bytes: int) -> Optional[Dict[str, Any]]:
+    """
+    Выбирает формат для загрузки по оценке размера
+
+    Returns:
+        {'format_id', 'estimated_size', 'source', 'fits'} или None, если
+        размер ни одного формата оценить нельзя. fits=False - ни один формат
+        не влезает в лимит, выбран самый маленький.
+    """
+    duration = info.get('duration')
+    formats: List[Dict[str, Any]] = [
+        fmt for fmt in (info.get('formats') or [info])
+        if fmt.get('format_id') and _is_playable(fmt)
+    ]
+
+    # yt-dlp сортирует форматы от худшего к лучшему
+    estimated = []
+    for fmt in formats:
+        size, source = estimate_size(fmt, duration)
+        if size is not None:
+            estimated.append((fmt, size, source))
+
+    if not estimated:
+        logger.info(f"Format sizes unknown for {info.get('webpage_url') or info.get('id')}, using default selection")
+        return None
+
+    fitting = [item for item in estimated if item[1] <= max_bytes]
+    fmt, size, source = fitting[-1] if fitting else min(estimated, key=lambda item: item[1])
+
+    choice = {
+        'format_id': fmt['format_id'],
+        'estimated_size': size,
+        'source': source,
+        'fits': bool(fitting),
+    }
+
+    logger.info(
+        f"Format selected for {info.get('webpage_url') or info.get('id')}: {fmt['format_id']} "
+        f"({fmt.get('height') or '?'}p, ~{size / 1024 / 1024:.1f}MB by {source}), "
+        f"{len(fitting)}/{len(estimated)} of {len(formats)} formats fit {max_bytes} bytes"
+    )
+    return choice
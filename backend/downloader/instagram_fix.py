@@ -9,6 +9,7 @@ import random
 import time
 import logging
 from typing import Dict, List
+from .rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -64,9 +65,8 @@ def get_instagram_options() -> Dict[str, any]:
         options['proxy'] = proxy
         logger.info(f"Using proxy: {proxy}")
     
-    # Добавляем задержки для избежания rate-limit
-    options['sleep_interval'] = random.uniform(1, 3)
-    options['max_sleep_interval'] = 5
+    # Фиксированных задержек нет: частоту запросов ограничивает
+    # downloader/rate_limiter.py (ждем только при приближении к лимиту)
     
     return options
 
@@ -81,7 +81,6 @@ def get_fallback_options() -> List[Dict[str, any]]:
         'format': 'worst',
         'socket_timeout': 120,
         'retries': 10,
-        'sleep_interval': random.uniform(8, 15),
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_1_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1.1 Mobile/15E148 Safari/604.1',
             'Accept': '*/*',
@@ -100,7 +99,6 @@ def get_fallback_options() -> List[Dict[str, any]]:
         'format': 'worst[height<=480]',
         'socket_timeout': 150,
         'retries': 15,
-        'sleep_interval': random.uniform(10, 20),
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (Linux; Android 10; SM-G973F) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
@@ -117,7 +115,6 @@ def get_fallback_options() -> List[Dict[str, any]]:
         'format': 'worst',
         'socket_timeout': 180,
         'retries': 20,
-        'sleep_interval': random.uniform(15, 25),
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
@@ -141,7 +138,6 @@ def get_fallback_options() -> List[Dict[str, any]]:
         'format': 'worst[filesize<10M]',
         'socket_timeout': 200,
         'retries': 25,
-        'sleep_interval': random.uniform(20, 30),
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.1 Safari/605.1.15',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
@@ -157,10 +153,13 @@ def get_fallback_options() -> List[Dict[str, any]]:
     return fallback_configs
 
 def add_delay_between_requests():
-    """Добавляет случайную задержку между запросами"""
-    delay = random.uniform(2, 5)
-    logger.info(f"Adding delay: {delay:.2f} seconds")
-    time.sleep(delay)
+    """
+    Ждет разрешения Instagram rate limiter'а перед запросом
+
+    Блокирует текущий поток - вызывать только из пула воркеров,
+    в асинхронном коде используйте get_rate_limiter('instagram').acquire()
+    """
+    get_rate_limiter('instagram').acquire_sync()
 
 def is_rate_limited_error(error_msg: str) -> bool:
     """Проверяет, является ли ошибка rate-limit"""
@@ -191,10 +190,6 @@ def get_server_specific_config() -> Dict[str, any]:
             'socket_timeout': 120,  # Увеличено с 60
             'retries': 10,          # Увеличено с 5
             'fragment_retries': 10, # Увеличено с 5
-            'sleep_interval': random.uniform(5, 12),  # Увеличено с 3-6
-            'max_sleep_interval': 20,                 # Увеличено с 10
-            'sleep_interval_requests': random.uniform(2, 5),
-            'sleep_interval_subtitles': random.uniform(1, 3),
         })
         
         # Специальные заголовки для серверов (имитация мобильного браузера)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Персистентная очередь загрузок
+
+Задача проходит состояния queued -> downloading -> uploading -> done,
+при ошибке возвращается в queued с экспоненциальной задержкой или
+становится failed после JOB_MAX_ATTEMPTS попыток (или сразу, если ошибка
+окончательная: видео приватное, удалено, слишком большое). После перезапуска
+незавершенные задачи снова попадают в очередь.
+
+Задачи из одного сообщения (chat_id + message_id) образуют группу:
+они выполняются параллельно, но отправляются в порядке ссылок (ссылку,
+застрявшую в очереди, ждут не дольше JOB_TURN_TIMEOUT) и
+делят одно статусное сообщение.
+"""
+
+import time
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from utils.config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BASE_DELAY,
+    JOB_MAX_PENDING,
+    JOB_MAX_PENDING_PER_CHAT,
+    JOB_MAX_ACTIVE_PER_CHAT,
+    JOB_HISTORY_TTL
+)
+from utils.database import read_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Состояния задачи
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+UPLOADING = 'uploading'
+DONE = 'done'
+FAILED = 'failed'
+
+ACTIVE_STATES = (QUEUED, DOWNLOADING, UPLOADING)
+RUNNING_STATES = (DOWNLOADING, UPLOADING)
+
+
+class JobQueue:
+    def __init__(self, max_attempts: int = JOB_MAX_ATTEMPTS, retry_base_delay: int = JOB_RETRY_BASE_DELAY):
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+
+    def enqueue(self, chat_id: int, user_id: int, username: str, message_id: int, url: str) -> Optional[int]:
+        """
+        Добавляет задачу в очередь
+
+        Returns:
+            ID задачи или None, если очередь переполнена
+        """
+        now = int(time.time())
+
+        with transaction() as conn:
+            if JOB_MAX_PENDING > 0:
+                pending = conn.execute(
+                    'SELECT COUNT(*) FROM download_jobs WHERE state IN (?, ?, ?)',
+                    ACTIVE_STATES
+                ).fetchone()[0]
+                if pending >= JOB_MAX_PENDING:
+                    logger.warning(f"Download queue is full ({pending} jobs)")
+                    return None
+
+            if JOB_MAX_PENDING_PER_CHAT > 0:
+                pending = conn.execute(
+                    'SELECT COUNT(*) FROM download_jobs WHERE chat_id = ? AND state IN (?, ?, ?)',
+                    (chat_id, *ACTIVE_STATES)
+                ).fetchone()[0]
+                if pending >= JOB_MAX_PENDING_PER_CHAT:
+                    logger.warning(f"Download queue is full for chat {chat_id} ({pending} jobs)")
+                    return None
+
+            cursor = conn.execute(
+                'INSERT INTO download_jobs '
+                '(chat_id, user_id, username, message_id, url, state, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (chat_id, user_id, username, message_id, url, QUEUED, now, now)
+            )
+            job_id = cursor.lastrowid
+
+        logger.info(f"Enqueued download job {job_id}: {url}")
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Забирает следующую готовую к выполнению задачу (переводит в downloading)
+
+        Задачи чата, в котором уже выполняется JOB_MAX_ACTIVE_PER_CHAT
+        загрузок, пропускаются - один чат не занимает все воркеры.
+
+        Задачи одного сообщения забираются в порядке ссылок: более поздняя
+        ждет, пока не будет забрана каждая более ранняя (в том числе
+        ожидающая повтора). Поздние задачи сообщения, ждущие своей очереди
+        на отправку, не занимают место ранней в лимите чата - иначе они
+        ждали бы друг друга вечно.
+        """
+        now = int(time.time())
+        query = (
+            'SELECT * FROM download_jobs j WHERE state = ? AND next_attempt_at <= ? '
+            'AND NOT EXISTS (SELECT 1 FROM download_jobs e '
+            'WHERE e.chat_id = j.chat_id AND e.message_id = j.message_id AND e.id < j.id AND e.state = ?)'
+        )
+        params: List[Any] = [QUEUED, now, QUEUED]
+
+        if JOB_MAX_ACTIVE_PER_CHAT > 0:
+            query += (
+                ' AND (SELECT COUNT(*) FROM download_jobs a '
+                'WHERE a.chat_id = j.chat_id AND a.state IN (?, ?) '
+                'AND NOT (a.message_id = j.message_id AND a.id > j.id)) < ?'
+            )
+            params.extend([*RUNNING_STATES, JOB_MAX_ACTIVE_PER_CHAT])
+
+        with transaction() as conn:
+            row = conn.execute(query + ' ORDER BY next_attempt_at, id LIMIT 1', params).fetchone()
+            if not row:
+                return None
+
+            conn.execute(
+                'UPDATE download_jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                (DOWNLOADING, now, row['id'])
+            )
+
+        job = dict(row)
+        job['state'] = DOWNLOADING
+        job['attempts'] += 1
+        return job
+
+    def set_state(self, job_id: int, state: str, **fields):
+        """Обновляет состояние задачи и дополнительные поля (file_id, error, ...)"""
+        fields['state'] = state
+        self.update(job_id, **fields)
+
+    def update(self, job_id: int, **fields):
+        """Обновляет поля задачи"""
+        fields['updated_at'] = int(time.time())
+        columns = ', '.join(f"{name} = ?" for name in fields)
+
+        with transaction() as conn:
+            conn.execute(
+                f'UPDATE download_jobs SET {columns} WHERE id = ?',
+                (*fields.values(), job_id)
+            )
+
+    def get_group(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Задачи из того же сообщения, в порядке ссылок"""
+        with read_connection() as conn:
+            rows = conn.execute(
+                'SELECT id, url, state, attempts, status_message_id FROM download_jobs '
+                'WHERE chat_id = ? AND message_id = ? ORDER BY id',
+                (job['chat_id'], job['message_id'])
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def earlier_pending_states(self, job: Dict[str, Any]) -> Set[str]:
+        """Состояния незавершенных задач по более ранним ссылкам из того же сообщения"""
+        with read_connection() as conn:
+            rows = conn.execute(
+                'SELECT DISTINCT state FROM download_jobs WHERE chat_id = ? AND message_id = ? AND id < ? '
+                'AND state IN (?, ?, ?)',
+                (job['chat_id'], job['message_id'], job['id'], *ACTIVE_STATES)
+            ).fetchall()
+        return {row['state'] for row in rows}
+
+    def is_group_finished(self, job: Dict[str, Any]) -> bool:
+        """Завершены ли (done или failed) все задачи сообщения"""
+        with read_connection() as conn:
+            row = conn.execute(
+                'SELECT 1 FROM download_jobs WHERE chat_id = ? AND message_id = ? '
+                'AND state IN (?, ?, ?) LIMIT 1',
+                (job['chat_id'], job['message_id'], *ACTIVE_STATES)
+            ).fetchone()
+        return row is None
+
+    def set_group_status_message(self, job: Dict[str, Any], status_message_id: Optional[int]):
+        """Запоминает общее статусное сообщение для всех задач сообщения"""
+        with transaction() as conn:
+            conn.execute(
+                'UPDATE download_jobs SET status_message_id = ? WHERE chat_id = ? AND message_id = ?',
+                (status_message_id, job['chat_id'], job['message_id'])
+            )
+
+    def complete(self, job_id: int, file_id: Optional[str] = None):
+        """Отмечает задачу выполненной"""
+        self.set_state(job_id, DONE, file_id=file_id, error=None)
+        logger.info(f"Download job {job_id} done")
+
+    def fail(self, job: Dict[str, Any], error: str):
+        """Отмечает задачу окончательно неудавшейся, без повторов"""
+        self.set_state(job['id'], FAILED, error=error)
+        logger.warning(f"Download job {job['id']} failed permanently: {error}")
+
+    def retry(self, job: Dict[str, Any], error: str) -> Optional[int]:
+        """
+        Возвращает задачу в очередь с экспоненциальной задержкой
+
+        Returns:
+            задержку в секундах или None, если попытки исчерпаны (задача failed)
+        """
+        if job['attempts'] >= self.max_attempts:
+            self.set_state(job['id'], FAILED, error=error)
+            logger.warning(f"Download job {job['id']} failed after {job['attempts']} attempts: {error}")
+            return None
+
+        delay = self.retry_base_delay * 2 ** (job['attempts'] - 1)
+        self.set_state(
+            job['id'], QUEUED,
+            error=error,
+            next_attempt_at=int(time.time()) + delay
+        )
+        logger.info(f"Download job {job['id']} will retry in {delay}s: {error}")
+        return delay
+
+    def recover(self) -> int:
+        """
+        Возвращает в очередь задачи, прерванные перезапуском,
+        и удаляет старую историю выполненных задач
+        """
+        now = int(time.time())
+
+        with transaction() as conn:
+            recovered = conn.execute(
+                'UPDATE download_jobs SET state = ?, updated_at = ? WHERE state IN (?, ?)',
+                (QUEUED, now, DOWNLOADING, UPLOADING)
+            ).rowcount
+
+            if JOB_HISTORY_TTL > 0:
+                conn.execute(
+                    'DELETE FROM download_jobs WHERE state IN (?, ?) AND updated_at < ?',
+                    (DONE, FAILED, now - JOB_HISTORY_TTL)
+                )
+
+        if recovered:
+            logger.info(f"Recovered {recovered} interrupted download jobs")
+        return recovered
+
+    def seconds_until_next(self) -> Optional[int]:
+        """Через сколько секунд станет готова следующая задача (None - очередь пуста)"""
+        with read_connection() as conn:
+            row = conn.execute(
+                'SELECT MIN(next_attempt_at) FROM download_jobs WHERE state = ?',
+                (QUEUED,)
+            ).fetchone()
+
+        if row[0] is None:
+            return None
+        return max(0, row[0] - int(time.time()))
+
+
+# Глобальный экземпляр очереди
+job_queue = JobQueue()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Реестр поддерживаемых платформ и поиск ссылок на видео
+
+Шаблоны всех платформ собраны в одно скомпилированное регулярное
+выражение: текст сообщения проходится один раз. Новая платформа
+добавляется через register_platform().
+"""
+
+import re
+import logging
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class VideoLink(NamedTuple):
+    """Найденная ссылка: URL, платформа и ID видео (None - ссылка на платформу без ID)"""
+    url: str
+    platform: str
+    video_id: Optional[str]
+    key: Optional[str]
+
+
+class Platform:
+    def __init__(self, name: str, domains: Sequence[str], patterns: Sequence[Tuple[str, str]]):
+        """
+        Args:
+            name: имя платформы ('instagram', 'tiktok', ...)
+            domains: домены платформы (поддомены учитываются автоматически)
+            patterns: (префикс ключа видео, регулярное выражение с группой (?P<id>...))
+        """
+        self.name = name
+        self.domains = tuple(domains)
+        self.patterns = list(patterns)
+
+
+PLATFORMS: List[Platform] = [
+    Platform('instagram', ['instagram.com'], [
+        ('instagram', r'https?://(?:www\.)?instagram\.com/(?:p|reel|tv)/(?P<id>[A-Za-z0-9_-]+)/?'),
+        ('instagram', r'https?://(?:www\.)?instagram\.com/stories/[^/\s]+/(?P<id>\d+)/?'),
+    ]),
+    Platform('tiktok', ['tiktok.com'], [
+        ('tiktok', r'https?://(?:www\.)?tiktok\.com/@[^/\s]+/video/(?P<id>\d+)'),
+        # Короткие ссылки получают отдельный ключ - ID видео за ними неизвестен
+        ('tiktok-short', r'https?://(?:vm|vt)\.tiktok\.com/(?P<id>[A-Za-z0-9]+)/?'),
+        ('tiktok-short', r'https?://(?:www\.)?tiktok\.com/t/(?P<id>[A-Za-z0-9]+)/?'),
+    ]),
+]
+
+# Группа combined-выражения -> (платформа, префикс ключа)
+_groups = {}
+_combined: Optional[re.Pattern] = None
+
+
+def _build():
+    """Собирает одно выражение из шаблонов всех платформ"""
+    global _combined
+
+    alternatives = []
+    _groups.clear()
+
+    for platform in PLATFORMS:
+        for number, (key_prefix, pattern) in enumerate(platform.patterns):
+            group = f"{platform.name.replace('-', '_')}_{number}"
+            _groups[group] = (platform.name, key_prefix)
+            alternatives.append(f"(?P<{group}>{pattern.replace('(?P<id>', f'(?P<{group}_id>')})")
+
+    # Любая другая ссылка на домен платформы (профиль, музыка и т.п.) - без ID видео
+    domains = '|'.join(re.escape(domain) for platform in PLATFORMS for domain in platform.domains)
+    alternatives.append(rf"(?P<generic>https?://(?:[a-z0-9-]+\.)*(?:{domains})(?:[/?#]\S*)?)")
+
+    _combined = re.compile('|'.join(alternatives), re.IGNORECASE)
+
+
+def register_platform(platform: Platform):
+    """Добавляет платформу в реестр"""
+    PLATFORMS.append(platform)
+    _build()
+    logger.info(f"Registered platform: {platform.name}")
+
+
+def _to_link(match: re.Match) -> VideoLink:
+    """Превращает совпадение combined-выражения в VideoLink"""
+    group = match.lastgroup
+    url = match.group(0)
+
+    if group == 'generic':
+        return VideoLink(url, get_platform(url), None, None)
+
+    platform, key_prefix = _groups[group]
+    video_id = match.group(f'{group}_id')
+    return VideoLink(url, platform, video_id, f"{key_prefix}:{video_id}")
+
+
+def find_links(text: str) -> List[VideoLink]:
+    """Находит все ссылки на поддерживаемые платформы в тексте (в порядке появления)"""
+    # Быстрый отказ: в большинстве сообщений ссылок нет вовсе
+    if '://' not in text:
+        return []
+    return [_to_link(match) for match in _combined.finditer(text)]
+
+
+def match_url(url: str) -> Optional[VideoLink]:
+    """Разбирает одну ссылку, None - не ссылка на поддерживаемую платформу"""
+    match = _combined.match(url)
+    return _to_link(match) if match else None
+
+
+def get_platform(url: str) -> str:
+    """Определяет платформу по домену URL ('other' - неизвестная)"""
+    try:
+        host = (urlparse(url).hostname or '').lower()
+    except ValueError:
+        return 'other'
+
+    for platform in PLATFORMS:
+        if any(host == domain or host.endswith('.' + domain) for domain in platform.domains):
+            return platform.name
+    return 'other'
+
+
+def is_supported_url(url: str) -> bool:
+    """Ссылка ведет на поддерживаемую платформу"""
+    return get_platform(url) != 'other'
+
+
+_build()
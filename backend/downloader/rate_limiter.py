@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Ограничение частоты запросов к платформам (token bucket)
+
+Ждем только когда действительно близки к лимиту платформы. При ошибках
+rate-limit скорость снижается вдвое, после успешных запросов постепенно
+восстанавливается. Асинхронный acquire() не блокирует event loop,
+acquire_sync() предназначен для кода, выполняющегося в пуле воркеров.
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from typing import Dict
+
+from utils.config import RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+# Во сколько раз максимум можно замедлиться при ошибках rate-limit
+MAX_SLOWDOWN = 16
+# Ускорение после каждого успешного запроса
+RECOVERY_FACTOR = 1.25
+
+
+class TokenBucket:
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.base_rate = per_minute / 60  # токенов в секунду
+        self.rate = self.base_rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.penalties = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Забирает токен (возможно в долг), возвращает сколько ждать его появления"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    async def acquire(self):
+        """Ждет разрешения на запрос, не блокируя event loop"""
+        delay = self._reserve()
+        if delay > 0:
+            logger.info(f"Rate limiting {self.name}: waiting {delay:.2f} seconds")
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self):
+        """Ждет разрешения на запрос в текущем потоке (только вне event loop)"""
+        delay = self._reserve()
+        if delay > 0:
+            logger.info(f"Rate limiting {self.name}: waiting {delay:.2f} seconds")
+            time.sleep(delay)
+
+    def penalize(self):
+        """Платформа ответила rate-limit - снижаем скорость вдвое"""
+        with self._lock:
+            self.penalties += 1
+            self.rate = max(self.base_rate / MAX_SLOWDOWN, self.rate / 2)
+            # Сжигаем накопленный запас, чтобы следующий запрос подождал
+            self.tokens = min(self.tokens, 0.0)
+        logger.warning(f"Rate limit hit on {self.name}, slowing down to {self.rate * 60:.1f} req/min")
+
+    def reward(self):
+        """Успешный запрос - постепенно возвращаемся к базовой скорости"""
+        with self._lock:
+            if self.rate >= self.base_rate:
+                return
+            self.rate = min(self.base_rate, self.rate * RECOVERY_FACTOR)
+        logger.info(f"Rate limit on {self.name} recovering: {self.rate * 60:.1f} req/min")
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(platform: str) -> TokenBucket:
+    """Общий limiter платформы (instagram, tiktok, other)"""
+    with _limiters_lock:
+        if platform not in _limiters:
+            per_minute, burst = RATE_LIMITS.get(platform, RATE_LIMITS['other'])
+            _limiters[platform] = TokenBucket(platform, per_minute, burst)
+        return _limiters[platform]
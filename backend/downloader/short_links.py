@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Раскрытие коротких ссылок TikTok (vm.tiktok.com, vt.tiktok.com, tiktok.com/t/)
+
+Короткая ссылка раскрывается HEAD-запросом (редиректы до полной ссылки
+@user/video/<id>), результат хранится в таблице short_links. После
+раскрытия короткая и полная ссылки на одно видео дедуплицируются и
+попадают в кеш file_id под одним ключом.
+"""
+
+import asyncio
+import time
+import logging
+from typing import List, Optional
+
+import aiohttp
+from yarl import URL
+
+from utils.config import SHORT_LINK_TTL, SHORT_LINK_TIMEOUT
+from utils.database import read_connection, transaction
+from .platforms import VideoLink, match_url
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Префиксы ключей коротких ссылок, которые нужно раскрывать
+SHORT_KEY_PREFIXES = ('tiktok-short:',)
+
+# Максимум редиректов при раскрытии
+MAX_REDIRECTS = 5
+
+USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+
+
+class ShortLinkResolver:
+    def __init__(self, ttl: int = SHORT_LINK_TTL, timeout: float = SHORT_LINK_TIMEOUT):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._flights = SingleFlight()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия (keep-alive соединения) создается при первом обращении"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': USER_AGENT}
+            )
+        return self._session
+
+    async def close(self):
+        """Закрывает HTTP сессию"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_cached(self, short_key: str) -> Optional[VideoLink]:
+        """Раскрытая ссылка из кеша или None (нет / истек TTL)"""
+        with read_connection() as conn:
+            row = conn.execute(
+                'SELECT url, resolved_at FROM short_links WHERE short_key = ?',
+                (short_key,)
+            ).fetchone()
+
+        if not row or (self.ttl > 0 and row['resolved_at'] + self.ttl < time.time()):
+            return None
+        return match_url(row['url'])
+
+    async def resolve(self, link: VideoLink) -> VideoLink:
+        """Раскрывает короткую ссылку, остальные (и нераскрытые) возвращает как есть"""
+        if not link.key or not link.key.startswith(SHORT_KEY_PREFIXES):
+            return link
+
+        cached = self.get_cached(link.key)
+        if cached:
+            logger.debug(f"Short link cache hit: {link.key} -> {cached.key}")
+            return cached
+
+        # Одна и та же короткая ссылка раскрывается одним запросом
+        resolved, _ = await self._flights.run(link.key, lambda: self._fetch(link))
+        return resolved or link
+
+    async def resolve_all(self, links: List[VideoLink]) -> List[VideoLink]:
+        """Раскрывает короткие ссылки параллельно, сохраняя порядок"""
+        return list(await asyncio.gather(*(self.resolve(link) for link in links)))
+
+    async def _fetch(self, link: VideoLink) -> Optional[VideoLink]:
+        """
+        Следует редиректам короткой ссылки до полной ссылки на видео
+
+        Редиректы обрабатываем сами и останавливаемся на первой полной
+        ссылке - саму страницу видео не запрашиваем.
+        """
+        session = self._get_session()
+        final_url = link.url
+        try:
+            for _ in range(MAX_REDIRECTS):
+                async with session.head(final_url, allow_redirects=False) as response:
+                    status, location = response.status, response.headers.get('Location')
+                
+                # Некоторые короткие ссылки не отвечают на HEAD
+                if status == 405:
+                    async with session.get(final_url, allow_redirects=False) as response:
+                        status, location = response.status, response.headers.get('Location')
+                
+                if status not in (301, 302, 303, 307, 308) or not location:
+                    break
+                
+                final_url = str(response.url.join(URL(location)))
+                resolved = match_url(final_url)
+                if resolved and resolved.key and not resolved.key.startswith(SHORT_KEY_PREFIXES):
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not resolve short link {link.url}: {e}")
+            return None
+
+        resolved = match_url(final_url)
+        if not resolved or not resolved.key or resolved.key.startswith(SHORT_KEY_PREFIXES):
+            logger.warning(f"Short link {link.url} resolved to unsupported URL: {final_url}")
+            return None
+
+        # Запоминаем полную ссылку без параметров отслеживания
+        with transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO short_links (short_key, video_key, url, resolved_at) '
+                'VALUES (?, ?, ?, ?)',
+                (link.key, resolved.key, resolved.url, int(time.time()))
+            )
+
+        logger.info(f"Resolved short link {link.key} -> {resolved.key}")
+        return resolved
+
+
+# Глобальный экземпляр
+short_link_resolver = ShortLinkResolver()
+
+
+async def close_short_link_resolver(application=None):
+    """Закрывает HTTP сессию резолвера (post_shutdown приложения бота)"""
+    await short_link_resolver.close()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Объединение одновременных запросов (single-flight)
+
+Если несколько корутин одновременно запрашивают одно и то же видео,
+работу выполняет только первая, остальные ждут и получают ее результат.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """Выполняется ли сейчас запрос с этим ключом"""
+        return key in self._inflight
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Выполняет func один раз на ключ среди одновременных вызовов
+
+        Returns:
+            (результат, shared) - shared=True если результат получен
+            от уже выполнявшегося запроса
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            logger.info(f"Joining in-flight request: {key}")
+            # shield: отмена ожидающего не должна отменять общий запрос
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._inflight[key]
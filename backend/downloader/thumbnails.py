@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Постеры и превью видео для ленты WebApp
+
+После загрузки видео в фоне (ffmpeg) извлекается кадр-постер и
+короткое беззвучное превью. Оба файла лежат в кеше медиа рядом с
+видео, их URL отдаются в /api/feed.
+
+Как и перекодирование, ffmpeg не должен отнимать CPU у бота: число
+одновременных запусков ограничено THUMBNAIL_WORKERS, потоки -
+THUMBNAIL_THREADS, приоритет процесса понижен.
+"""
+
+import asyncio
+import os
+import shutil
+import logging
+from typing import List, Optional, Set
+
+from utils.config import (
+    FFMPEG_PATH, POSTER_WIDTH, PREVIEW_WIDTH, PREVIEW_SECONDS, THUMBNAIL_WORKERS, THUMBNAIL_THREADS
+)
+from utils.media_store import media_store
+
+logger = logging.getLogger(__name__)
+
+# Фоновые задачи генерации (ссылки держим, чтобы их не собрал GC)
+_tasks: Set[asyncio.Task] = set()
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def ffmpeg_available() -> bool:
+    """Проверяет, что ffmpeg установлен"""
+    return shutil.which(FFMPEG_PATH) is not None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Ограничение одновременных запусков ffmpeg"""
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, THUMBNAIL_WORKERS))
+    return _semaphore
+
+
+def _lower_priority():
+    """Выполняется в дочернем процессе перед запуском ffmpeg"""
+    os.nice(10)
+
+
+async def _run_ffmpeg(args: List[str], output_format: str, output_path: str) -> int:
+    """Запускает ffmpeg с выводом во временный файл, возвращает размер результата (0 - ошибка)"""
+    temp_path = output_path + '.part'
+    async with _get_semaphore():
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG_PATH, '-y', '-v', 'error', *args,
+            '-threads', str(max(1, THUMBNAIL_THREADS)), '-f', output_format, temp_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=_lower_priority if hasattr(os, 'nice') else None
+        )
+        _, stderr = await process.communicate()
+
+    if process.returncode != 0 or not os.path.exists(temp_path) or not os.path.getsize(temp_path):
+        logger.warning(f"ffmpeg failed for {output_path}: {stderr.decode(errors='ignore').strip()}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return 0
+
+    os.replace(temp_path, output_path)
+    return os.path.getsize(output_path)
+
+
+async def make_poster(video_path: str, poster_path: str) -> int:
+    """Извлекает кадр-постер (JPEG), возвращает размер файла"""
+    scale = f'scale={POSTER_WIDTH}:-2'
+
+    # Кадр на первой секунде, для совсем коротких видео - первый кадр
+    for offset in ('1', '0'):
+        size = await _run_ffmpeg(
+            ['-ss', offset, '-i', video_path, '-frames:v', '1', '-vf', scale, '-q:v', '5'],
+            'image2', poster_path
+        )
+        if size:
+            return size
+    return 0
+
+
+async def make_preview(video_path: str, preview_path: str) -> int:
+    """Создает короткое беззвучное превью (MP4), возвращает размер файла"""
+    return await _run_ffmpeg(
+        [
+            '-i', video_path, '-t', str(PREVIEW_SECONDS), '-an',
+            '-vf', f'scale={PREVIEW_WIDTH}:-2,fps=12',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '32',
+            '-pix_fmt', 'yuv420p', '-movflags', '+faststart'
+        ],
+        'mp4', preview_path
+    )
+
+
+async def generate_thumbnails(file_id: str):
+    """Создает постер и превью для видео из кеша медиа"""
+    video_path = media_store.get(file_id)
+    if not video_path:
+        logger.debug(f"No stored media for {file_id}, skipping thumbnails")
+        return
+
+    failed = []
+    for asset, make in (('poster', make_poster), ('preview', make_preview)):
+        if media_store.get_asset(file_id, asset):
+            continue
+        size = await make(video_path, media_store.asset_path_for(file_id, asset))
+        if size:
+            media_store.set_asset(file_id, asset, size)
+        else:
+            failed.append(asset)
+
+    if failed:
+        logger.warning(f"Could not generate {', '.join(failed)} for {file_id}")
+    else:
+        logger.info(f"Thumbnails generated for {file_id}")
+
+
+def schedule_thumbnails(file_id: str):
+    """Запускает генерацию постера и превью в фоне"""
+    if not ffmpeg_available():
+        logger.debug("ffmpeg not found, skipping thumbnails")
+        return
+
+    async def run():
+        try:
+            await generate_thumbnails(file_id)
+        except Exception as e:
+            logger.error(f"Error generating thumbnails for {file_id}: {e}")
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Перекодирование видео, превышающих MAX_VIDEO_SIZE
+
+Битрейт рассчитывается по длительности так, чтобы файл поместился в
+лимит. ffmpeg запускается из отдельного пула процессов с пониженным
+приоритетом: число одновременных перекодирований ограничено
+TRANSCODE_WORKERS, а потоки ffmpeg - TRANSCODE_THREADS.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from utils.config import (
+    FFMPEG_PATH, TRANSCODE_ENABLED, TRANSCODE_WORKERS, TRANSCODE_THREADS,
+    TRANSCODE_MIN_VIDEO_KBPS, TRANSCODE_AUDIO_KBPS
+)
+from utils.metrics import shared_metrics
+
+logger = logging.getLogger(__name__)
+
+# Запас под контейнер и неточность битрейта кодека
+SIZE_MARGIN = 0.92
+# Во сколько раз снижаем битрейт, если результат все равно не влез
+RETRY_FACTOR = 0.8
+MAX_ATTEMPTS = 2
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def is_available() -> bool:
+    """Перекодирование включено и ffmpeg установлен"""
+    return TRANSCODE_ENABLED and shutil.which(FFMPEG_PATH) is not None
+
+
+def target_video_kbps(duration: float, max_bytes: int) -> int:
+    """Битрейт видео (кбит/с), при котором файл длительностью duration влезет в max_bytes"""
+    total_kbps = max_bytes * 8 * SIZE_MARGIN / duration / 1000
+    return int(total_kbps - TRANSCODE_AUDIO_KBPS)
+
+
+def _scale_filter(video_kbps: int) -> str:
+    """Уменьшаем разрешение для низких битрейтов (иначе картинка разваливается)"""
+    if video_kbps < 500:
+        height = 480
+    elif video_kbps < 1000:
+        height = 720
+    else:
+        height = 1080
+    return f"scale=-2:'min({height},ih)'"
+
+
+def _lower_priority():
+    """Инициализатор процесса пула: ffmpeg не должен отнимать CPU у бота"""
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+def transcode_to_fit(input_path: str, duration: float, max_bytes: int) -> Optional[Dict[str, Any]]:
+    """
+    Перекодирует видео в H.264/AAC так, чтобы оно влезло в max_bytes (блокирующий вызов)
+
+    Returns:
+        {'path', 'input_size', 'output_size', 'seconds'} или None
+    """
+    video_kbps = target_video_kbps(duration, max_bytes)
+    if video_kbps < TRANSCODE_MIN_VIDEO_KBPS:
+        logger.warning(f"Video too long to fit {max_bytes} bytes: {duration}s -> {video_kbps} kbps")
+        return None
+
+    input_size = os.path.getsize(input_path)
+    output_path = os.path.splitext(input_path)[0] + '.fit.mp4'
+    started = time.monotonic()
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        command = [
+            FFMPEG_PATH, '-y', '-v', 'error', '-i', input_path,
+            '-vf', _scale_filter(video_kbps),
+            '-c:v', 'libx264', '-preset', 'veryfast',
+            '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k',
+            '-c:a', 'aac', '-b:a', f'{TRANSCODE_AUDIO_KBPS}k',
+            '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            '-threads', str(TRANSCODE_THREADS),
+            output_path
+        ]
+        process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        if process.returncode != 0:
+            logger.warning(f"ffmpeg transcode failed: {process.stderr.decode(errors='ignore').strip()}")
+            break
+
+        output_size = os.path.getsize(output_path)
+        if output_size <= max_bytes:
+            return {
+                'path': output_path,
+                'input_size': input_size,
+                'output_size': output_size,
+                'seconds': time.monotonic() - started
+            }
+
+        logger.info(f"Transcode attempt {attempt} still too large: {output_size} bytes at {video_kbps} kbps")
+        video_kbps = int(video_kbps * RETRY_FACTOR)
+        if video_kbps < TRANSCODE_MIN_VIDEO_KBPS:
+            break
+
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Создает пул перекодирования при первом обращении"""
+    global _executor
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=max(1, TRANSCODE_WORKERS),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_lower_priority
+        )
+        logger.info(f"Transcode pool started: {TRANSCODE_WORKERS} workers")
+    return _executor
+
+
+
+async def transcode_async(input_path: str, duration: float, max_bytes: int) -> Optional[str]:
+    """
+    Перекодирует видео в пуле процессов, возвращает путь к новому файлу или None
+
+    Исходный файл при успехе удаляется. Время и экономия размера попадают
+    в общие метрики (база), которые отдает /api/metrics.
+    """
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(_get_executor(), transcode_to_fit, input_path, duration, max_bytes)
+    return _finish(input_path, result)
+
+
+def transcode(input_path: str, duration: float, max_bytes: int) -> Optional[str]:
+    """Синхронная версия transcode_async (выполняется в текущем потоке)"""
+    return _finish(input_path, transcode_to_fit(input_path, duration, max_bytes))
+
+
+def _record_metrics(result: Optional[Dict[str, Any]]):
+    """Записывает метрики перекодирования в базу (ошибка записи не ломает загрузку)"""
+    try:
+        if not result:
+            shared_metrics.incr('transcode.failed')
+            return
+        shared_metrics.incr('transcode.success')
+        shared_metrics.incr('transcode.bytes_saved', result['input_size'] - result['output_size'])
+        shared_metrics.observe('transcode.seconds', result['seconds'])
+        shared_metrics.observe('transcode.ratio', result['output_size'] / result['input_size'])
+    except Exception as e:
+        logger.warning(f"Could not record transcode metrics: {e}")
+
+
+def _finish(input_path: str, result: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Удаляет исходный файл и записывает метрики перекодирования"""
+    _record_metrics(result)
+    if not result:
+        return None
+
+    os.remove(input_path)
+
+    saved = result['input_size'] - result['output_size']
+    logger.info(
+        f"Transcoded {input_path}: {result['input_size']} -> {result['output_size']} bytes "
+        f"(saved {saved}) in {result['seconds']:.1f}s"
+    )
+    return result['path']
+
+
+def shutdown():
+    """Останавливает пул перекодирования"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        logger.info("Transcode pool stopped")
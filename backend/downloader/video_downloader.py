@@ -1,11 +1,19 @@
 import yt_dlp
+import asyncio
+import multiprocessing
 import tempfile
 import os
+import shutil
 import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Optional, Dict, Any
-from utils.config import MAX_VIDEO_SIZE
+from utils.config import (
+    MAX_VIDEO_SIZE, MAX_VIDEO_SIZE_MB, DOWNLOAD_EXECUTOR, DOWNLOAD_WORKERS, PLATFORM_CONCURRENCY, TRANSCODE_MAX_INPUT_SIZE
+)
+from . import platforms, transcoder
+from .format_selector import select_format
+from .rate_limiter import get_rate_limiter, TokenBucket
 from .instagram_fix import (
-    get_instagram_options, 
     get_fallback_options, 
     get_server_specific_config,
     add_delay_between_requests,
@@ -16,11 +24,54 @@ from .instagram_fix import (
 
 logger = logging.getLogger(__name__)
 
+# Ошибки yt-dlp, которые не исправит повторная попытка
+PERMANENT_ERROR_INDICATORS = (
+    'private video',
+    'this video is private',
+    'video unavailable',
+    'this video is unavailable',
+    'unsupported url',
+    'has been removed',
+    'has been deleted',
+    'does not exist',
+    'no video formats found',
+)
+
+
+class PermanentDownloadError(Exception):
+    """Видео невозможно загрузить: повтор задачи не поможет"""
+
+
+class VideoTooLargeError(PermanentDownloadError):
+    """Видео превышает лимит размера и не может быть перекодировано"""
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Проверяет, является ли ошибка yt-dlp окончательной (видео приватное, удалено, ...)"""
+    if not isinstance(error, yt_dlp.utils.DownloadError):
+        return False
+    error_msg = str(error)
+    if is_rate_limited_error(error_msg):
+        return False
+    return any(indicator in error_msg.lower() for indicator in PERMANENT_ERROR_INDICATORS)
+
+def _run_in_worker(method: str, url: str):
+    """
+    Точка входа для пула процессов: вызывает метод загрузчика процесса-воркера
+
+    Возвращает (результат, число rate-limit ошибок), чтобы основной процесс
+    мог скорректировать свой limiter.
+    """
+    limiter = downloader.get_rate_limiter(url)
+    penalties = limiter.penalties
+    result = getattr(downloader, method)(url)
+    return result, limiter.penalties - penalties
+
 class VideoDownloader:
     def __init__(self):
         # Базовые настройки для yt-dlp
         self.ydl_opts = {
-            'format': 'best[filesize<50M]/best',  # Предпочитаем видео до 50MB
+            'format': f'best[filesize<{MAX_VIDEO_SIZE_MB}M]/best',  # Предпочитаем видео в пределах лимита
             'outtmpl': '%(title)s.%(ext)s',
             'noplaylist': True,
             'extractaudio': False,
@@ -44,7 +95,7 @@ class VideoDownloader:
         
         # Альтернативные настройки для проблемных сайтов
         self.fallback_opts = {
-            'format': 'worst[filesize<50M]/worst',  # Пробуем худшее качество
+            'format': f'worst[filesize<{MAX_VIDEO_SIZE_MB}M]/worst',  # Пробуем худшее качество
             'outtmpl': '%(title)s.%(ext)s',
             'noplaylist': True,
             'quiet': True,
@@ -56,25 +107,128 @@ class VideoDownloader:
             'max_sleep_interval': 5
         }
         
-        # Счетчик запросов для Instagram
-        self.instagram_request_count = 0
+        # Пул для блокирующих вызовов yt-dlp и лимиты по платформам
+        self._executor: Optional[Executor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
     
     def is_supported_url(self, url: str) -> bool:
         """Проверяет, поддерживается ли URL для загрузки"""
-        supported_domains = [
-            'instagram.com',
-            'www.instagram.com',
-            'tiktok.com',
-            'www.tiktok.com',
-            'vm.tiktok.com',
-            'vt.tiktok.com'
-        ]
-        
-        return any(domain in url.lower() for domain in supported_domains)
+        return platforms.is_supported_url(url)
     
     def is_instagram_url(self, url: str) -> bool:
         """Проверяет, является ли URL ссылкой на Instagram"""
-        return 'instagram.com' in url.lower()
+        return platforms.get_platform(url) == 'instagram'
+    
+    def get_platform(self, url: str) -> str:
+        """Определяет платформу по URL: instagram, tiktok или other"""
+        return platforms.get_platform(url)
+    
+    def get_rate_limiter(self, url: str) -> TokenBucket:
+        """Limiter частоты запросов к платформе URL"""
+        return get_rate_limiter(self.get_platform(url))
+    
+    def _report_result(self, url: str, error_msg: Optional[str] = None):
+        """Сообщает limiter'у платформы об успехе или rate-limit ошибке"""
+        if error_msg is None:
+            self.get_rate_limiter(url).reward()
+        elif is_rate_limited_error(error_msg):
+            self.get_rate_limiter(url).penalize()
+    
+    def _get_executor(self) -> Executor:
+        """Создает пул воркеров yt-dlp при первом обращении"""
+        if self._executor is None:
+            if DOWNLOAD_EXECUTOR == 'process':
+                # spawn: воркеры не наследуют соединение с базой и потоки бота
+                self._executor = ProcessPoolExecutor(
+                    max_workers=DOWNLOAD_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=DOWNLOAD_WORKERS,
+                    thread_name_prefix='yt-dlp'
+                )
+            logger.info(f"Download pool started: {DOWNLOAD_EXECUTOR} x {DOWNLOAD_WORKERS}")
+        return self._executor
+    
+    def _get_semaphore(self, platform: str) -> asyncio.Semaphore:
+        """Семафор, ограничивающий одновременные загрузки с платформы"""
+        if platform not in self._semaphores:
+            limit = PLATFORM_CONCURRENCY.get(platform, PLATFORM_CONCURRENCY['other'])
+            self._semaphores[platform] = asyncio.Semaphore(max(1, limit))
+        return self._semaphores[platform]
+    
+    async def _run_in_pool(self, method: str, url: str):
+        """
+        Выполняет блокирующий метод в пуле, не блокируя event loop
+
+        Разрешение rate limiter'а на первый запрос получаем здесь
+        асинхронно, чтобы не занимать воркер ожиданием.
+        """
+        platform = self.get_platform(url)
+        limiter = self.get_rate_limiter(url)
+        loop = asyncio.get_running_loop()
+        
+        async with self._get_semaphore(platform):
+            await limiter.acquire()
+            
+            if isinstance(self._get_executor(), ProcessPoolExecutor):
+                result, penalties = await loop.run_in_executor(self._executor, _run_in_worker, method, url)
+                # Переносим сигналы rate-limit из процесса-воркера
+                for _ in range(penalties):
+                    limiter.penalize()
+                if result and not penalties:
+                    limiter.reward()
+                return result
+            return await loop.run_in_executor(self._executor, getattr(self, method), url)
+    
+    async def extract_info_async(self, url: str) -> Optional[Dict[str, Any]]:
+        """Асинхронная версия extract_info (выполняется в пуле воркеров)"""
+        return await self._run_in_pool('_extract_info', url)
+    
+    async def download_video_async(self, url: str) -> Optional[str]:
+        """Асинхронная версия download_video (выполняется в пуле воркеров)"""
+        try:
+            result = await self.download_async(url)
+        except PermanentDownloadError as e:
+            logger.warning(f"Could not download {url}: {e}")
+            return None
+        return result['path'] if result else None
+    
+    async def download_async(self, url: str) -> Optional[Dict[str, Any]]:
+        """Асинхронная версия download (выполняется в пуле воркеров)"""
+        result = await self._run_in_pool('_download', url)
+        
+        # Слишком большое видео перекодируем в отдельном пуле процессов
+        if result and result.pop('oversized', False):
+            path = await transcoder.transcode_async(result['path'], result['info']['duration'], MAX_VIDEO_SIZE)
+            return self._apply_transcode(result, path)
+        return result
+    
+    def shutdown(self):
+        """Останавливает пул воркеров и пул перекодирования"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Download pool stopped")
+        transcoder.shutdown()
+    
+    @property
+    def max_download_size(self) -> int:
+        """Максимальный размер загружаемого файла (больше лимита - если его можно перекодировать)"""
+        if transcoder.is_available():
+            return max(MAX_VIDEO_SIZE, TRANSCODE_MAX_INPUT_SIZE)
+        return MAX_VIDEO_SIZE
+    
+    def _apply_transcode(self, result: Dict[str, Any], path: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Подставляет перекодированный файл в результат загрузки"""
+        if not path:
+            logger.warning(f"Could not shrink {result['path']} under {MAX_VIDEO_SIZE} bytes")
+            self.cleanup_file(result['path'])
+            raise VideoTooLargeError(f"Video too large: could not shrink under {MAX_VIDEO_SIZE} bytes")
+        
+        result['path'] = path
+        return result
     
     def get_instagram_download_options(self, url: str) -> Dict[str, Any]:
         """Получает оптимальные опции для загрузки Instagram видео"""
@@ -99,8 +253,26 @@ class VideoDownloader:
         
         return options
 
+    def _summarize_info(self, info: Dict[str, Any], url: str,
+                        default_title: str = 'Unknown',
+                        default_uploader: str = 'Unknown') -> Dict[str, Any]:
+        """Оставляет из info dict yt-dlp только поля, нужные боту"""
+        return {
+            'title': info.get('title') or default_title,
+            'duration': info.get('duration') or 0,
+            'uploader': info.get('uploader') or default_uploader,
+            'filesize': info.get('filesize') or 0,
+            'ext': info.get('ext', 'mp4'),
+            'url': url
+        }
+
     def extract_info(self, url: str) -> Optional[Dict[str, Any]]:
         """Извлекает информацию о видео без загрузки"""
+        self.get_rate_limiter(url).acquire_sync()
+        return self._extract_info(url)
+    
+    def _extract_info(self, url: str) -> Optional[Dict[str, Any]]:
+        """Извлекает информацию о видео (разрешение limiter'а уже получено)"""
         
         # Для Instagram используем специальные настройки
         if self.is_instagram_url(url):
@@ -109,29 +281,18 @@ class VideoDownloader:
         try:
             with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
                 info = ydl.extract_info(url, download=False)
-                return {
-                    'title': info.get('title', 'Unknown'),
-                    'duration': info.get('duration', 0),
-                    'uploader': info.get('uploader', 'Unknown'),
-                    'filesize': info.get('filesize', 0),
-                    'ext': info.get('ext', 'mp4'),
-                    'url': url
-                }
+                self._report_result(url)
+                return self._summarize_info(info, url)
         except Exception as e:
             logger.warning(f"Primary extraction failed for {url}: {e}")
+            self._report_result(url, str(e))
+            self.get_rate_limiter(url).acquire_sync()
             
             # Пробуем с fallback настройками
             try:
                 with yt_dlp.YoutubeDL(self.fallback_opts) as ydl:
                     info = ydl.extract_info(url, download=False)
-                    return {
-                        'title': info.get('title', 'Unknown Video'),
-                        'duration': info.get('duration', 0),
-                        'uploader': info.get('uploader', 'Unknown'),
-                        'filesize': info.get('filesize', 0),
-                        'ext': info.get('ext', 'mp4'),
-                        'url': url
-                    }
+                    return self._summarize_info(info, url, default_title='Unknown Video')
             except Exception as e2:
                 logger.error(f"Fallback extraction also failed for {url}: {e2}")
                 return None
@@ -139,12 +300,6 @@ class VideoDownloader:
     def _extract_instagram_info(self, url: str) -> Optional[Dict[str, Any]]:
         """Извлекает информацию о Instagram видео с улучшенной обработкой"""
         
-        # Добавляем задержку между запросами
-        if self.instagram_request_count > 0:
-            add_delay_between_requests()
-        
-        self.instagram_request_count += 1
-        
         # Пробуем основные настройки
         options = self.get_instagram_download_options(url)
         
@@ -152,20 +307,15 @@ class VideoDownloader:
             with yt_dlp.YoutubeDL(options) as ydl:
                 info = ydl.extract_info(url, download=False)
                 if info:  # Проверяем что info не None
-                    return {
-                        'title': info.get('title', 'Instagram Video'),
-                        'duration': info.get('duration', 0),
-                        'uploader': info.get('uploader', 'Instagram User'),
-                        'filesize': info.get('filesize', 0),
-                        'ext': info.get('ext', 'mp4'),
-                        'url': url
-                    }
+                    self._report_result(url)
+                    return self._summarize_info(info, url, 'Instagram Video', 'Instagram User')
                 else:
                     logger.warning(f"Instagram returned empty info for {url}")
                     return None
         except Exception as e:
             error_msg = str(e)
             log_instagram_error(url, error_msg)
+            self._report_result(url, error_msg)
             
             # Пробуем fallback конфигурации
             if is_rate_limited_error(error_msg):
@@ -195,29 +345,40 @@ class VideoDownloader:
                 with yt_dlp.YoutubeDL(config) as ydl:
                     info = ydl.extract_info(url, download=False)
                     logger.info(f"Instagram fallback config {i+1} succeeded")
-                    return {
-                        'title': info.get('title', 'Instagram Video'),
-                        'duration': info.get('duration', 0),
-                        'uploader': info.get('uploader', 'Instagram User'),
-                        'filesize': info.get('filesize', 0),
-                        'ext': info.get('ext', 'mp4'),
-                        'url': url
-                    }
+                    self._report_result(url)
+                    return self._summarize_info(info, url, 'Instagram Video', 'Instagram User')
                     
             except Exception as e:
                 logger.warning(f"Instagram fallback config {i+1} failed: {e}")
+                self._report_result(url, str(e))
                 continue
         
         logger.error(f"All Instagram fallback configs failed for {url}")
         return None
 
-    def download_video(self, url: str) -> Optional[str]:
+    def download(self, url: str) -> Optional[Dict[str, Any]]:
         """
-        Загружает видео во временный файл и возвращает путь к нему
-        Возвращает None в случае ошибки
+        Загружает видео за один проход: одно извлечение информации,
+        проверка размера по info dict и загрузка из того же info
+
+        Returns:
+            {'path': путь к файлу, 'info': метаданные для подписи} или None
+
+        Raises:
+            PermanentDownloadError: видео недоступно или слишком большое
         """
+        self.get_rate_limiter(url).acquire_sync()
+        result = self._download(url)
+        
+        if result and result.pop('oversized', False):
+            path = transcoder.transcode(result['path'], result['info']['duration'], MAX_VIDEO_SIZE)
+            return self._apply_transcode(result, path)
+        return result
+    
+    def _download(self, url: str) -> Optional[Dict[str, Any]]:
+        """Загружает видео (разрешение limiter'а на первый запрос уже получено)"""
         temp_dir = None
-        success = False
+        result = None
         
         try:
             # Создаем временную директорию
@@ -225,56 +386,121 @@ class VideoDownloader:
             
             # Для Instagram используем специальную логику
             if self.is_instagram_url(url):
-                success = self._download_instagram_video(url, temp_dir)
+                result = self._download_instagram_video(url, temp_dir)
             else:
                 # Пробуем основные настройки
-                success = self._try_download(url, temp_dir, self.ydl_opts, "primary")
+                result = self._try_download(url, temp_dir, self.ydl_opts, "primary")
                 
-                if not success:
+                if not result:
                     # Пробуем fallback настройки
                     logger.info(f"Trying fallback method for {url}")
-                    success = self._try_download(url, temp_dir, self.fallback_opts, "fallback")
+                    self.get_rate_limiter(url).acquire_sync()
+                    # Fallback скачивает формат из своих настроек ('worst'), а не выбранный по размеру
+                    result = self._try_download(url, temp_dir, self.fallback_opts, "fallback", force_format=False)
             
-            if success:
-                # Находим загруженный файл
-                for file in os.listdir(temp_dir):
-                    if file.endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')):
-                        file_path = os.path.join(temp_dir, file)
-                        
-                        # Проверяем размер загруженного файла
-                        if os.path.getsize(file_path) > MAX_VIDEO_SIZE:
-                            logger.warning(f"Downloaded file too large: {file_path}")
-                            os.remove(file_path)
-                            return None
-                        
-                        logger.info(f"Successfully downloaded: {file_path}")
-                        return file_path
-                
-                logger.error(f"No video file found after download from {url}")
+            if not result:
                 return None
-            else:
+            
+            if not result['path']:
+                logger.error(f"No video file found after download from {url}")
+                result = None
                 return None
+            
+            # Проверяем размер загруженного файла
+            file_size = os.path.getsize(result['path'])
+            if file_size > MAX_VIDEO_SIZE:
+                # Вместо отказа - перекодирование (его выполняет вызывающий код)
+                if file_size <= self.max_download_size and result['info'].get('duration'):
+                    logger.info(f"Downloaded file too large ({file_size} bytes), will transcode: {result['path']}")
+                    result['oversized'] = True
+                    return result
                 
+                logger.warning(f"Downloaded file too large: {result['path']}")
+                result = None
+                raise VideoTooLargeError(f"Video too large: {file_size} bytes > {self.max_download_size}")
+            
+            logger.info(f"Successfully downloaded: {result['path']}")
+            return result
+        
+        except PermanentDownloadError:
+            raise
         except Exception as e:
             logger.error(f"Unexpected error downloading video from {url}: {e}")
+            result = None
             return None
         finally:
             # Очищаем временную директорию если загрузка не удалась
-            if temp_dir and not success:
-                try:
-                    import shutil
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-                except:
-                    pass
+            if temp_dir and not result:
+                shutil.rmtree(temp_dir, ignore_errors=True)
     
-    def _download_instagram_video(self, url: str, temp_dir: str) -> bool:
-        """Загружает Instagram видео с улучшенной обработкой"""
+    def download_video(self, url: str) -> Optional[str]:
+        """
+        Загружает видео во временный файл и возвращает путь к нему
+        Возвращает None в случае ошибки
+        """
+        try:
+            result = self.download(url)
+        except PermanentDownloadError as e:
+            logger.warning(f"Could not download {url}: {e}")
+            return None
+        return result['path'] if result else None
+    
+    def _find_downloaded_file(self, info: Dict[str, Any], temp_dir: str) -> Optional[str]:
+        """Находит файл, загруженный yt-dlp"""
+        for requested in info.get('requested_downloads') or []:
+            filepath = requested.get('filepath')
+            if filepath and os.path.exists(filepath):
+                return filepath
         
-        # Добавляем задержку между запросами
-        if self.instagram_request_count > 0:
-            add_delay_between_requests()
+        for file in os.listdir(temp_dir):
+            if file.endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')):
+                return os.path.join(temp_dir, file)
         
-        self.instagram_request_count += 1
+        return None
+    
+    def _download_with_info(self, ydl: yt_dlp.YoutubeDL, url: str, temp_dir: str,
+                            method: str, default_title: str = 'Unknown',
+                            default_uploader: str = 'Unknown',
+                            force_format: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Одно извлечение, проверка размера и загрузка из полученного info
+
+        force_format=False - формат выбирает 'format' из настроек (fallback
+        настройки с 'worst'), выбранный по размеру формат только проверяет лимит.
+        """
+        info = ydl.extract_info(url, download=False)
+        if not info:
+            logger.warning(f"Empty info ({method}) for {url}")
+            return None
+        
+        # Выбираем лучший формат, который влезает в лимит, до загрузки
+        choice = select_format(info, MAX_VIDEO_SIZE)
+        if choice:
+            # Не влезает ни один формат - загружаем только если потом можно перекодировать
+            if not choice['fits'] and choice['estimated_size'] > self.max_download_size:
+                raise VideoTooLargeError(
+                    f"Video too large ({method}): ~{choice['estimated_size']} bytes > {self.max_download_size}"
+                )
+            if force_format:
+                ydl.format_selector = ydl.build_format_selector(choice['format_id'])
+        else:
+            # Размер неизвестен - проверяем то, что есть (до лимита перекодирования)
+            filesize = info.get('filesize', 0)
+            if filesize and filesize > self.max_download_size:
+                raise VideoTooLargeError(f"Video too large ({method}): {filesize} bytes > {self.max_download_size}")
+        
+        # Загружаем из уже извлеченного info - без повторного запроса к платформе
+        downloaded = ydl.process_ie_result(info, download=True)
+        logger.info(f"Download successful with {method} method")
+        self._report_result(url)
+        
+        return {
+            'path': self._find_downloaded_file(downloaded or info, temp_dir),
+            'info': self._summarize_info(info, url, default_title, default_uploader)
+        }
+    
+    def _download_instagram_video(self, url: str, temp_dir: str) -> Optional[Dict[str, Any]]:
+        """Загружает Instagram видео с улучшенной обработкой"""
         
         # Пробуем основную конфигурацию
         options = self.get_instagram_download_options(url)
@@ -282,32 +508,27 @@ class VideoDownloader:
         
         try:
             with yt_dlp.YoutubeDL(options) as ydl:
-                # Сначала получаем информацию
-                info = ydl.extract_info(url, download=False)
-                
-                # Проверяем размер файла
-                filesize = info.get('filesize', 0)
-                if filesize and filesize > MAX_VIDEO_SIZE:
-                    logger.warning(f"Instagram video too large: {filesize} bytes > {MAX_VIDEO_SIZE}")
-                    return False
-                
-                # Загружаем видео
-                ydl.download([url])
-                logger.info(f"Instagram download successful")
-                return True
+                return self._download_with_info(
+                    ydl, url, temp_dir, "instagram", 'Instagram Video', 'Instagram User'
+                )
                 
+        except PermanentDownloadError:
+            raise
         except Exception as e:
             error_msg = str(e)
             log_instagram_error(url, error_msg)
+            self._report_result(url, error_msg)
+            if is_permanent_error(e):
+                raise PermanentDownloadError(error_msg) from e
             
             # Пробуем fallback конфигурации
             if is_rate_limited_error(error_msg):
                 logger.info("Rate limit detected, trying Instagram fallback configurations...")
                 return self._try_instagram_download_fallbacks(url, temp_dir)
             
-            return False
+            return None
     
-    def _try_instagram_download_fallbacks(self, url: str, temp_dir: str) -> bool:
+    def _try_instagram_download_fallbacks(self, url: str, temp_dir: str) -> Optional[Dict[str, Any]]:
         """Пробует fallback конфигурации для загрузки Instagram видео"""
         
         fallback_configs = get_fallback_options()
@@ -322,28 +543,27 @@ class VideoDownloader:
                 config['outtmpl'] = os.path.join(temp_dir, '%(title)s.%(ext)s')
                 
                 with yt_dlp.YoutubeDL(config) as ydl:
-                    # Сначала получаем информацию
-                    info = ydl.extract_info(url, download=False)
-                    
-                    # Проверяем размер файла
-                    filesize = info.get('filesize', 0)
-                    if filesize and filesize > MAX_VIDEO_SIZE:
-                        logger.warning(f"Instagram video too large (fallback {i+1}): {filesize} bytes > {MAX_VIDEO_SIZE}")
-                        continue
-                    
-                    # Загружаем видео
-                    ydl.download([url])
-                    logger.info(f"Instagram download fallback config {i+1} succeeded")
-                    return True
+                    result = self._download_with_info(
+                        ydl, url, temp_dir, f"instagram fallback {i+1}",
+                        'Instagram Video', 'Instagram User', force_format=False
+                    )
+                    if result:
+                        return result
                     
+            except PermanentDownloadError:
+                raise
             except Exception as e:
                 logger.warning(f"Instagram download fallback config {i+1} failed: {e}")
+                self._report_result(url, str(e))
+                if is_permanent_error(e):
+                    raise PermanentDownloadError(str(e)) from e
                 continue
         
         logger.error(f"All Instagram download fallback configs failed for {url}")
-        return False
+        return None
     
-    def _try_download(self, url: str, temp_dir: str, opts: dict, method: str) -> bool:
+    def _try_download(self, url: str, temp_dir: str, opts: dict, method: str,
+                      force_format: bool = True) -> Optional[Dict[str, Any]]:
         """Пробует загрузить видео с заданными настройками"""
         try:
             # Настройки для загрузки
@@ -351,34 +571,29 @@ class VideoDownloader:
             download_opts['outtmpl'] = os.path.join(temp_dir, '%(title)s.%(ext)s')
             
             with yt_dlp.YoutubeDL(download_opts) as ydl:
-                # Сначала получаем информацию
-                info = ydl.extract_info(url, download=False)
-                
-                # Проверяем размер файла
-                filesize = info.get('filesize', 0)
-                if filesize and filesize > MAX_VIDEO_SIZE:
-                    logger.warning(f"Video too large ({method}): {filesize} bytes > {MAX_VIDEO_SIZE}")
-                    return False
-                
-                # Загружаем видео
-                ydl.download([url])
-                logger.info(f"Download successful with {method} method")
-                return True
+                return self._download_with_info(ydl, url, temp_dir, method, force_format=force_format)
                 
+        except PermanentDownloadError:
+            raise
         except Exception as e:
             logger.warning(f"Download failed with {method} method for {url}: {e}")
-            return False
+            self._report_result(url, str(e))
+            # Приватное или удаленное видео не загрузят и fallback настройки
+            if is_permanent_error(e):
+                raise PermanentDownloadError(str(e)) from e
+            return None
 
     def cleanup_file(self, file_path: str):
         """Удаляет временный файл и его директорию"""
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                # Удаляем временную директорию если она пустая
-                temp_dir = os.path.dirname(file_path)
-                if os.path.exists(temp_dir) and not os.listdir(temp_dir):
-                    os.rmdir(temp_dir)
-                logger.debug(f"Cleaned up: {file_path}")
+            # Удаляем временную директорию если она пустая
+            # (файл мог быть уже перемещен в кеш медиа)
+            temp_dir = os.path.dirname(file_path)
+            if os.path.exists(temp_dir) and not os.listdir(temp_dir):
+                os.rmdir(temp_dir)
+            logger.debug(f"Cleaned up: {file_path}")
         except Exception as e:
             logger.error(f"Error cleaning up file {file_path}: {e}")
 
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+Воркеры очереди загрузок - скачивают видео и отправляют их в чаты
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from telegram import Bot
+from telegram.constants import ChatAction
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import Application
+from downloader.video_downloader import downloader, PermanentDownloadError, VideoTooLargeError
+from downloader.file_id_cache import file_id_cache
+from downloader.job_queue import job_queue, QUEUED, DOWNLOADING, UPLOADING, DONE, FAILED
+from downloader.singleflight import SingleFlight
+from downloader.thumbnails import schedule_thumbnails
+from handlers.link_handler import get_video_key, normalize_url
+from utils.cache import add_video_metadata
+from utils.config import JOB_WORKERS, JOB_TURN_TIMEOUT, MAX_VIDEO_SIZE_MB
+from utils.media_store import media_store
+from utils.telegram_upload import send_video_file, close_upload_session
+
+logger = logging.getLogger(__name__)
+
+# Загрузки, выполняющиеся прямо сейчас (ключ - ID видео или нормализованный URL)
+video_flights = SingleFlight()
+
+# Как часто воркер проверяет очередь, если его не разбудили
+IDLE_POLL_INTERVAL = 5
+
+# Как часто готовое видео проверяет, отправлены ли предыдущие ссылки сообщения
+TURN_POLL_INTERVAL = 0.5
+
+# Значки задач в общем статусе сообщения с несколькими ссылками
+STATE_ICONS = {
+    QUEUED: '⏳',
+    DOWNLOADING: '⬇️',
+    UPLOADING: '📤',
+    DONE: '✅',
+    FAILED: '❌',
+}
+
+# Блокировки общих статусных сообщений: (chat_id, message_id) -> Lock
+_status_locks: Dict[Tuple[int, int], asyncio.Lock] = {}
+
+def get_download_error_message(url: str) -> str:
+    """Формирует сообщение об ошибке загрузки с учетом платформы"""
+    if 'instagram.com' in url:
+        return (
+            f"❌ Не удалось загрузить видео из Instagram\n\n"
+            f"🔒 Возможные причины:\n"
+            f"• Видео приватное или удалено\n"
+            f"• Instagram блокирует автоматические запросы\n"
+            f"• Аккаунт заблокирован или требует входа\n"
+            f"• Видео превышает {MAX_VIDEO_SIZE_MB}MB\n\n"
+            f"💡 Попробуйте:\n"
+            f"• Убедиться, что видео публичное\n"
+            f"• Попробовать другую ссылку\n"
+            f"• Повторить попытку через несколько минут"
+        )
+    elif 'tiktok.com' in url or 'vm.tiktok.com' in url:
+        return (
+            f"❌ Не удалось загрузить видео из TikTok\n\n"
+            f"🔒 Возможные причины:\n"
+            f"• Видео приватное или удалено\n"
+            f"• Географические ограничения\n"
+            f"• Временная блокировка TikTok\n"
+            f"• Видео превышает {MAX_VIDEO_SIZE_MB}MB\n\n"
+            f"💡 Попробуйте другую ссылку или повторите позже"
+        )
+    return (
+        f"❌ Не удалось загрузить видео\n\n"
+        f"🔍 Проверьте:\n"
+        f"• Видео не превышает {MAX_VIDEO_SIZE_MB}MB\n"
+        f"• Ссылка корректная и публичная\n"
+        f"• Видео не удалено автором\n\n"
+        f"💡 Попробуйте другую ссылку или повторите позже"
+    )
+
+
+def get_error_message(error: str) -> str:
+    """Формирует сообщение для пользователя по тексту исключения"""
+    if "File too large" in error or "too large" in error.lower():
+        return (
+            f"❌ Видео слишком большое (>{MAX_VIDEO_SIZE_MB}MB)\n\n"
+            f"📏 Ограничения Telegram:\n"
+            f"• Максимальный размер: {MAX_VIDEO_SIZE_MB}MB\n"
+            f"• Попробуйте найти видео меньшего размера"
+        )
+    elif "Network" in error or "timeout" in error.lower():
+        return (
+            f"❌ Проблема с сетью\n\n"
+            f"🌐 Проверьте подключение к интернету\n"
+            f"🔄 Попробуйте еще раз через минуту"
+        )
+    return (
+        f"❌ Произошла ошибка при обработке видео\n\n"
+        f"🔧 Попробуйте:\n"
+        f"• Проверить ссылку\n"
+        f"• Повторить попытку\n"
+        f"• Использовать другую ссылку"
+    )
+
+def render_group_status(group: List[Dict[str, Any]]) -> str:
+    """Текст общего статуса для сообщения с несколькими ссылками"""
+    items = []
+    for number, item in enumerate(group, start=1):
+        icon = STATE_ICONS.get(item['state'], '⏳')
+        if item['state'] == QUEUED and item['attempts']:
+            icon = '🔁'
+        items.append(f"{number} {icon}")
+    
+    sent = sum(1 for item in group if item['state'] == DONE)
+    failed = sum(1 for item in group if item['state'] == FAILED)
+    text = f"📥 Видео из сообщения: {sent}/{len(group)} отправлено\n\n" + " · ".join(items)
+    
+    if failed and sent + failed == len(group):
+        text += f"\n\n❌ Не удалось загрузить {failed} из {len(group)} видео"
+    return text
+
+async def _show_status(bot: Bot, job: Dict[str, Any], status_message_id: Optional[int], text: str) -> int:
+    """Редактирует статусное сообщение или создает его ответом на сообщение со ссылкой"""
+    if status_message_id:
+        try:
+            await bot.edit_message_text(
+                chat_id=job['chat_id'],
+                message_id=status_message_id,
+                text=text
+            )
+        except BadRequest as e:
+            # Текст не изменился или сообщение удалено
+            logger.debug(f"Could not edit status of job {job['id']}: {e}")
+        return status_message_id
+    
+    status_message = await bot.send_message(
+        chat_id=job['chat_id'],
+        text=text,
+        reply_to_message_id=job['message_id'],
+        allow_sending_without_reply=True
+    )
+    return status_message.message_id
+
+def _status_lock(job: Dict[str, Any]) -> asyncio.Lock:
+    """Блокировка общего статуса сообщения (одно сообщение на все его ссылки)"""
+    return _status_locks.setdefault((job['chat_id'], job['message_id']), asyncio.Lock())
+
+async def set_status(bot: Bot, job: Dict[str, Any], text: str):
+    """
+    Показывает статус задачи
+
+    Для сообщения с несколькими ссылками вместо text показывается общий
+    статус всех его задач в одном сообщении.
+    """
+    group = job_queue.get_group(job)
+    if len(group) <= 1:
+        status_message_id = await _show_status(bot, job, job.get('status_message_id'), text)
+        if status_message_id != job.get('status_message_id'):
+            job['status_message_id'] = status_message_id
+            job_queue.update(job['id'], status_message_id=status_message_id)
+        return
+    
+    async with _status_lock(job):
+        # Перечитываем группу: статус мог создать другой воркер
+        group = job_queue.get_group(job)
+        current = next((item['status_message_id'] for item in group if item['status_message_id']), None)
+        
+        status_message_id = await _show_status(bot, job, current, render_group_status(group))
+        if status_message_id != current:
+            job_queue.set_group_status_message(job, status_message_id)
+        job['status_message_id'] = status_message_id
+
+async def clear_status(bot: Bot, job: Dict[str, Any]):
+    """Удаляет статусное сообщение задачи (общее - когда отправлены все видео сообщения)"""
+    group = job_queue.get_group(job)
+    if len(group) > 1:
+        if not all(item['state'] == DONE for item in group):
+            await set_status(bot, job, '')
+            return
+        
+        job['status_message_id'] = next(
+            (item['status_message_id'] for item in group if item['status_message_id']), None
+        )
+    
+    if not job.get('status_message_id'):
+        return
+    
+    try:
+        await bot.delete_message(chat_id=job['chat_id'], message_id=job['status_message_id'])
+    except TelegramError as e:
+        logger.debug(f"Could not delete status of job {job['id']}: {e}")
+    
+    job['status_message_id'] = None
+    job_queue.set_group_status_message(job, None)
+
+def release_status_lock(job: Dict[str, Any]):
+    """Удаляет блокировку общего статуса, когда все задачи сообщения завершены"""
+    key = (job['chat_id'], job['message_id'])
+    if key in _status_locks and job_queue.is_group_finished(job):
+        del _status_locks[key]
+
+async def wait_for_turn(job: Dict[str, Any]):
+    """
+    Ждет, пока завершатся задачи по более ранним ссылкам того же сообщения
+
+    Пока ранние задачи выполняются, ждем их. Ранняя задача в очереди
+    (ждет повтора или места в лимите чата) может не получить воркер,
+    пока все они заняты ожидающими - поэтому ее ждем не дольше
+    JOB_TURN_TIMEOUT и затем отправляем видео вне очереди.
+    """
+    queued_since = None
+    while True:
+        states = job_queue.earlier_pending_states(job)
+        if not states:
+            return
+        
+        if QUEUED in states:
+            queued_since = queued_since or time.monotonic()
+            if time.monotonic() - queued_since >= JOB_TURN_TIMEOUT:
+                logger.info(f"Job {job['id']} stopped waiting for earlier queued links, posting out of order")
+                return
+        else:
+            queued_since = None
+        
+        await asyncio.sleep(TURN_POLL_INTERVAL)
+
+async def send_video_by_file_id(bot: Bot, job: Dict[str, Any], file_id: str, title: str):
+    """Отправляет уже загруженное в Telegram видео по file_id и сохраняет метаданные"""
+    # Видео из одного сообщения публикуются в порядке ссылок
+    await wait_for_turn(job)
+    
+    sent_message = await bot.send_video(
+        chat_id=job['chat_id'],
+        video=file_id,
+        caption=f"🎬 {title}\n👤 @{job['username']}",
+        reply_to_message_id=job['message_id'],
+        allow_sending_without_reply=True,
+        supports_streaming=True
+    )
+    
+    if sent_message.video:
+        add_video_metadata(
+            file_id=sent_message.video.file_id,
+            chat_id=job['chat_id'],
+            user_id=job['user_id'],
+            username=job['username']
+        )
+        # Новый file_id того же файла - к файлу в кеше медиа, если он там есть
+        media_store.link_unique_id(sent_message.video.file_id, sent_message.video.file_unique_id)
+    
+    return sent_message
+
+async def send_cached_video(bot: Bot, job: Dict[str, Any], video_key: str) -> Optional[dict]:
+    """
+    Переотправляет видео по file_id из кеша, без загрузки и выгрузки файла
+    
+    Returns:
+        {'file_id', 'title'} если видео отправлено, None если в кеше его нет
+    """
+    cached = file_id_cache.get(video_key)
+    if not cached:
+        return None
+    
+    try:
+        await send_video_by_file_id(bot, job, cached['file_id'], cached['title'])
+    except BadRequest as e:
+        # file_id больше недействителен - забываем его и загружаем заново
+        logger.warning(f"Cached file_id rejected for {video_key}: {e}")
+        file_id_cache.invalidate(video_key)
+        return None
+    
+    logger.info(f"Re-sent cached video {video_key} to chat {job['chat_id']}")
+    return cached
+
+async def download_and_send(bot: Bot, job: Dict[str, Any], video_key: Optional[str]) -> Optional[dict]:
+    """
+    Загружает видео, отправляет его в чат и сохраняет метаданные
+    
+    Returns:
+        {'file_id', 'title'} отправленного видео или None при ошибке
+    """
+    url = job['url']
+    chat_id = job['chat_id']
+    
+    # Показываем, что бот печатает
+    await bot.send_chat_action(chat_id=chat_id, action=ChatAction.UPLOAD_VIDEO)
+    await set_status(bot, job, "⬇️ Загружаю видео...")
+    
+    # Файл уже есть в локальном кеше медиа - выгружаем его без yt-dlp
+    stored = media_store.get_by_key(video_key) if video_key else None
+    if stored:
+        video_path = stored['path']
+        video_info = {'title': stored['title'] or 'Video', 'duration': stored['duration']}
+        logger.info(f"Using stored media for {video_key}: {video_path}")
+    else:
+        # Загружаем видео за один проход (в пуле воркеров, event loop не блокируется)
+        result = await downloader.download_async(url)
+        if not result:
+            logger.warning(f"Could not download video from URL: {url}")
+            return None
+        
+        video_path = result['path']
+        video_info = result['info']
+        logger.info(f"Downloaded video: {video_info['title']} from {url}")
+    
+    try:
+        # Видео из одного сообщения публикуются в порядке ссылок
+        await wait_for_turn(job)
+        
+        # Обновляем статус
+        job_queue.set_state(job['id'], UPLOADING)
+        await set_status(bot, job, "📤 Отправляю видео...")
+        
+        # Отправляем видео в чат (файл читается с диска потоком, не целиком в память)
+        sent_message = await send_video_file(
+            bot,
+            chat_id,
+            video_path,
+            caption=f"🎬 {video_info['title']}\n👤 @{job['username']}",
+            reply_to_message_id=job['message_id'],
+            allow_sending_without_reply=True,
+            supports_streaming=True
+        )
+        
+        if not sent_message.video:
+            return None
+        
+        # Сохраняем метаданные
+        file_id = sent_message.video.file_id
+        add_video_metadata(
+            file_id=file_id,
+            chat_id=chat_id,
+            user_id=job['user_id'],
+            username=job['username']
+        )
+        logger.info(f"Video saved with file_id: {file_id}")
+        
+        if video_key:
+            file_id_cache.put(video_key, file_id, video_info['title'])
+        
+        # Оставляем файл в кеше медиа (стриминг в WebApp, повторная отправка)
+        if stored:
+            media_store.add_file_id(video_path, file_id)
+        else:
+            try:
+                media_store.put_file(
+                    file_id, video_path,
+                    unique_id=sent_message.video.file_unique_id,
+                    video_key=video_key,
+                    title=video_info['title'],
+                    duration=video_info.get('duration') or 0
+                )
+            except OSError as e:
+                logger.warning(f"Could not store media for {file_id}: {e}")
+        
+        # Постер и превью для ленты готовим в фоне, не задерживая задачу
+        schedule_thumbnails(file_id)
+        
+        return {'file_id': file_id, 'title': video_info['title']}
+        
+    finally:
+        # Очищаем временный файл (если он не перемещен в кеш медиа)
+        if not stored:
+            downloader.cleanup_file(video_path)
+
+async def deliver(bot: Bot, job: Dict[str, Any]) -> Optional[dict]:
+    """
+    Доставляет в чат видео по ссылке из задачи
+    
+    Returns:
+        {'file_id', 'title'} отправленного видео или None при ошибке загрузки
+    """
+    video_key = get_video_key(job['url'])
+    
+    # Видео уже загружалось в Telegram - переотправляем по file_id
+    if video_key:
+        cached = await send_cached_video(bot, job, video_key)
+        if cached:
+            return cached
+    
+    # Одновременные запросы того же видео ждут одну загрузку
+    flight_key = video_key or normalize_url(job['url'])
+    if video_flights.in_flight(flight_key):
+        await set_status(bot, job, "⏳ Это видео уже загружается, подождите...")
+    
+    delivered, shared = await video_flights.run(
+        flight_key,
+        lambda: download_and_send(bot, job, video_key)
+    )
+    
+    # Загрузку выполнил другой запрос - переотправляем полученный file_id
+    if shared and delivered:
+        await send_video_by_file_id(bot, job, delivered['file_id'], delivered['title'])
+    
+    return delivered
+
+
+class DownloadWorkerPool:
+    """Пул asyncio-воркеров, разбирающих персистентную очередь загрузок"""
+    
+    def __init__(self, bot: Bot, workers: int = JOB_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+    
+    def start(self):
+        """Возвращает в очередь прерванные задачи и запускает воркеры"""
+        job_queue.recover()
+        
+        for number in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(number + 1)))
+        
+        logger.info(f"Started {self.workers} download workers")
+    
+    async def stop(self):
+        """Останавливает воркеры (незавершенные задачи продолжатся после перезапуска)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        logger.info("Download workers stopped")
+    
+    def wake(self):
+        """Будит воркеры после добавления задачи"""
+        self._wakeup.set()
+    
+    async def _wait_for_work(self):
+        """Ждет новую задачу или наступление времени повтора"""
+        delay = job_queue.seconds_until_next()
+        timeout = IDLE_POLL_INTERVAL if delay is None else min(max(delay, 0.1), IDLE_POLL_INTERVAL)
+        
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+    
+    async def _worker(self, number: int):
+        """Цикл воркера: забирает задачу из очереди и выполняет ее"""
+        while True:
+            try:
+                job = job_queue.claim()
+                if not job:
+                    await self._wait_for_work()
+                    continue
+                
+                logger.info(f"Worker {number} took job {job['id']} (attempt {job['attempts']})")
+                await self._process(job)
+                
+                # Освободилось место для задач этого чата - будим остальные воркеры
+                self.wake()
+                
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Download worker {number} error: {e}")
+                await asyncio.sleep(1)
+    
+    async def _process(self, job: Dict[str, Any]):
+        """Выполняет задачу и обновляет ее состояние"""
+        try:
+            await self._run_job(job)
+        finally:
+            # Блокировка статуса больше не нужна - в том числе когда часть ссылок не загрузилась
+            release_status_lock(job)
+    
+    async def _run_job(self, job: Dict[str, Any]):
+        """Доставляет видео задачи: готово, повтор или окончательная ошибка"""
+        error = None
+        try:
+            delivered = await deliver(self.bot, job)
+        except asyncio.CancelledError:
+            raise
+        except PermanentDownloadError as e:
+            # Повтор не поможет - сообщаем пользователю один раз
+            job_queue.fail(job, str(e))
+            if isinstance(e, VideoTooLargeError):
+                await set_status(self.bot, job, get_error_message(str(e)))
+            else:
+                await set_status(self.bot, job, get_download_error_message(job['url']))
+            return
+        except Exception as e:
+            logger.error(f"Error processing URL {job['url']}: {e}")
+            delivered = None
+            error = str(e)
+        
+        if delivered:
+            job_queue.complete(job['id'], delivered['file_id'])
+            await clear_status(self.bot, job)
+            return
+        
+        retry_in = job_queue.retry(job, error or "download failed")
+        if retry_in is not None:
+            await set_status(self.bot, job, f"🔁 Не получилось загрузить видео, повторю через {retry_in} с...")
+            self.wake()
+        elif error:
+            await set_status(self.bot, job, get_error_message(error))
+        else:
+            await set_status(self.bot, job, get_download_error_message(job['url']))
+
+
+async def start_download_workers(application: Application) -> DownloadWorkerPool:
+    """Запускает воркеры очереди загрузок и сохраняет пул в bot_data"""
+    # Сверяем индекс кеша медиа с диском
+    media_store.scan()
+    
+    pool = DownloadWorkerPool(application.bot)
+    application.bot_data['download_workers'] = pool
+    pool.start()
+    return pool
+
+async def stop_download_workers(application: Application):
+    """Останавливает воркеры очереди загрузок"""
+    pool = application.bot_data.pop('download_workers', None)
+    if pool:
+        await pool.stop()
+    await close_upload_session()
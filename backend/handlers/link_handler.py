@@ -1,26 +1,14 @@
-import re
 import logging
-from urllib.parse import urlparse, parse_qs
+from typing import List, Optional
+from urllib.parse import urlparse
 from telegram import Update
 from telegram.ext import ContextTypes
-from telegram.constants import ChatAction
-from downloader.video_downloader import downloader
-from utils.cache import add_video_metadata
+from downloader.platforms import VideoLink, find_links, match_url
+from downloader.short_links import short_link_resolver
+from downloader.job_queue import job_queue
 
 logger = logging.getLogger(__name__)
 
-# Регулярные выражения для поиска ссылок
-URL_PATTERNS = [
-    # Instagram
-    r'https?://(?:www\.)?instagram\.com/(?:p|reel|tv)/([A-Za-z0-9_-]+)/?',
-    r'https?://(?:www\.)?instagram\.com/stories/[^/]+/(\d+)/?',
-    
-    # TikTok
-    r'https?://(?:www\.)?tiktok\.com/@[^/]+/video/(\d+)',
-    r'https?://(?:vm|vt)\.tiktok\.com/([A-Za-z0-9]+)/?',
-    r'https?://(?:www\.)?tiktok\.com/t/([A-Za-z0-9]+)/?',
-]
-
 def normalize_url(url: str) -> str:
     """Нормализует URL, убирая параметры запроса и лишние символы"""
     try:
@@ -34,39 +22,40 @@ def normalize_url(url: str) -> str:
     except:
         return url
 
-def extract_urls_from_text(text: str) -> list[str]:
-    """Извлекает все поддерживаемые URL из текста с дедупликацией"""
-    urls = []
-    normalized_urls = set()  # Для отслеживания уже найденных URL
-    
-    for pattern in URL_PATTERNS:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            url = match.group(0)
-            normalized = normalize_url(url)
-            
-            # Добавляем только если еще не встречали такой URL
-            if normalized not in normalized_urls:
-                urls.append(url)
-                normalized_urls.add(normalized)
-    
-    # Также ищем любые URL, содержащие поддерживаемые домены
-    general_url_pattern = r'https?://[^\s]+'
-    general_matches = re.finditer(general_url_pattern, text, re.IGNORECASE)
+def get_video_key(url: str) -> Optional[str]:
+    """
+    Возвращает канонический ключ видео на платформе, например
+    'instagram:Cx1AbC' или 'tiktok:7234567890'. Короткие ссылки TikTok
+    получают отдельный ключ 'tiktok-short:<код>'.
+    """
+    link = match_url(url)
+    return link.key if link else None
+
+def dedupe_links(links: List[VideoLink]) -> List[VideoLink]:
+    """Убирает повторы по ID видео (или нормализованному URL), сохраняя порядок"""
+    unique = []
+    seen = set()  # Для отслеживания уже найденных видео/URL
     
-    for match in general_matches:
-        url = match.group(0)
-        normalized = normalize_url(url)
+    for link in links:
+        key = link.key or normalize_url(link.url)
         
-        if (downloader.is_supported_url(url) and 
-            normalized not in normalized_urls):
-            urls.append(url)
-            normalized_urls.add(normalized)
+        # Добавляем только если еще не встречали такое видео
+        if key not in seen:
+            unique.append(link)
+            seen.add(key)
     
-    return urls
+    return unique
+
+def extract_links_from_text(text: str) -> List[VideoLink]:
+    """Извлекает ссылки на видео из текста (один проход) с дедупликацией"""
+    return dedupe_links(find_links(text))
+
+def extract_urls_from_text(text: str) -> list[str]:
+    """Извлекает все поддерживаемые URL из текста с дедупликацией"""
+    return [link.url for link in extract_links_from_text(text)]
 
 async def handle_message_with_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает сообщения, содержащие ссылки на видео"""
+    """Ставит в очередь загрузки ссылки на видео из сообщения"""
     if not update.message or not update.message.text:
         return
     
@@ -75,145 +64,38 @@ async def handle_message_with_links(update: Update, context: ContextTypes.DEFAUL
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name
     
-    # Извлекаем URL из сообщения с дедупликацией
-    urls = extract_urls_from_text(message.text)
+    # Извлекаем ссылки из сообщения с дедупликацией (по ID видео и нормализованному URL)
+    links = extract_links_from_text(message.text)
     
-    if not urls:
+    if not links:
         return
     
-    logger.info(f"Found {len(urls)} unique video URLs in message from user {user_id}")
+    # Короткие ссылки раскрываем до полных - повтор одного видео в двух
+    # формах отсеивается, а кеш file_id находит видео по его ID
+    links = dedupe_links(await short_link_resolver.resolve_all(links))
     
-    # Дополнительная проверка на дубликаты по нормализованным URL
-    processed_urls = set()
+    logger.info(f"Found {len(links)} unique video URLs in message from user {user_id}")
     
-    for url in urls:
-        normalized_url = normalize_url(url)
-        
-        # Пропускаем если уже обрабатывали такой URL
-        if normalized_url in processed_urls:
-            logger.info(f"Skipping duplicate URL: {url}")
-            continue
-        
-        processed_urls.add(normalized_url)
-        
-        try:
-            # Показываем, что бот печатает
-            await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.UPLOAD_VIDEO)
-            
-            # Сначала проверяем информацию о видео
-            video_info = downloader.extract_info(url)
-            if not video_info:
-                logger.warning(f"Could not extract info from URL: {url}")
-                
-                # Определяем тип ошибки по платформе
-                if 'instagram.com' in url:
-                    error_msg = (
-                        f"❌ Не удалось загрузить видео из Instagram\n\n"
-                        f"🔒 Возможные причины:\n"
-                        f"• Видео приватное или удалено\n"
-                        f"• Instagram блокирует автоматические запросы\n"
-                        f"• Аккаунт заблокирован или требует входа\n\n"
-                        f"💡 Попробуйте:\n"
-                        f"• Убедиться, что видео публичное\n"
-                        f"• Попробовать другую ссылку\n"
-                        f"• Повторить попытку через несколько минут"
-                    )
-                elif 'tiktok.com' in url or 'vm.tiktok.com' in url:
-                    error_msg = (
-                        f"❌ Не удалось загрузить видео из TikTok\n\n"
-                        f"🔒 Возможные причины:\n"
-                        f"• Видео приватное или удалено\n"
-                        f"• Географические ограничения\n"
-                        f"• Временная блокировка TikTok\n\n"
-                        f"💡 Попробуйте другую ссылку или повторите позже"
-                    )
-                else:
-                    error_msg = f"❌ Не удалось загрузить видео из {url}\nПопробуйте другую ссылку"
-                
-                await message.reply_text(error_msg)
-                continue
-            
-            logger.info(f"Downloading video: {video_info['title']} from {url}")
-            
-            # Отправляем сообщение о начале загрузки
-            status_message = await message.reply_text(
-                f"⬇️ Загружаю видео...\n"
-                f"📹 {video_info['title'][:50]}{'...' if len(video_info['title']) > 50 else ''}\n"
-                f"👤 {video_info['uploader']}"
+    for link in links:
+        # Загрузку выполнят воркеры очереди (см. handlers/download_worker.py)
+        job_id = job_queue.enqueue(
+            chat_id=chat_id,
+            user_id=user_id,
+            username=username,
+            message_id=message.message_id,
+            url=link.url
+        )
+        if job_id is None:
+            await message.reply_text(
+                "⏳ Сейчас слишком много видео в очереди на загрузку\n"
+                "Попробуйте отправить ссылку через несколько минут"
             )
-            
-            # Загружаем видео
-            video_path = downloader.download_video(url)
-            if not video_path:
-                await status_message.edit_text(
-                    f"❌ Не удалось загрузить видео\n\n"
-                    f"🔍 Проверьте:\n"
-                    f"• Видео не превышает 50MB\n"
-                    f"• Ссылка корректная и публичная\n"
-                    f"• Видео не удалено автором\n\n"
-                    f"💡 Попробуйте другую ссылку или повторите позже"
-                )
-                continue
-            
-            try:
-                # Обновляем статус
-                await status_message.edit_text("📤 Отправляю видео...")
-                
-                # Отправляем видео в чат
-                with open(video_path, 'rb') as video_file:
-                    sent_message = await context.bot.send_video(
-                        chat_id=chat_id,
-                        video=video_file,
-                        caption=f"🎬 {video_info['title']}\n👤 @{username}",
-                        reply_to_message_id=message.message_id,
-                        supports_streaming=True
-                    )
-                
-                # Удаляем статусное сообщение
-                await status_message.delete()
-                
-                # Сохраняем метаданные
-                if sent_message.video:
-                    file_id = sent_message.video.file_id
-                    add_video_metadata(
-                        file_id=file_id,
-                        chat_id=chat_id,
-                        user_id=user_id,
-                        username=username
-                    )
-                    logger.info(f"Video saved with file_id: {file_id}")
-                
-            finally:
-                # Очищаем временный файл
-                downloader.cleanup_file(video_path)
-                
-        except Exception as e:
-            logger.error(f"Error processing URL {url}: {e}")
-            
-            # Определяем тип ошибки для пользователя
-            if "File too large" in str(e) or "too large" in str(e).lower():
-                error_msg = (
-                    f"❌ Видео слишком большое (>50MB)\n\n"
-                    f"📏 Ограничения Telegram:\n"
-                    f"• Максимальный размер: 50MB\n"
-                    f"• Попробуйте найти видео меньшего размера"
-                )
-            elif "Network" in str(e) or "timeout" in str(e).lower():
-                error_msg = (
-                    f"❌ Проблема с сетью\n\n"
-                    f"🌐 Проверьте подключение к интернету\n"
-                    f"🔄 Попробуйте еще раз через минуту"
-                )
-            else:
-                error_msg = (
-                    f"❌ Произошла ошибка при обработке видео\n\n"
-                    f"🔧 Попробуйте:\n"
-                    f"• Проверить ссылку\n"
-                    f"• Повторить попытку\n"
-                    f"• Использовать другую ссылку"
-                )
-            
-            await message.reply_text(error_msg)
+            break
+    
+    # Будим воркеры, чтобы они сразу взяли новые задачи
+    workers = context.bot_data.get('download_workers')
+    if workers:
+        workers.wake()
 
 async def handle_all_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик всех текстовых сообщений для поиска ссылок"""
@@ -3,14 +3,59 @@
 Обработчик реакций - отправка уведомлений авторам видео
 """
 
+import asyncio
+import html
 import logging
-from telegram import Bot
+from typing import Dict, List, Tuple
 from telegram.error import TelegramError
-from utils.cache import get_video_author, is_user_muted, add_reaction
-from utils.config import BOT_TOKEN
+from utils.cache import (
+    get_video_author, is_user_muted, add_reaction, add_reactions, get_video_authors, get_muted_users
+)
+from utils.telegram_client import get_bot
 
 logger = logging.getLogger(__name__)
 
+# Строк реакций в одном сводном уведомлении (лимит сообщения Telegram - 4096 символов)
+NOTIFICATION_MAX_LINES = 20
+
+def describe_reaction(reaction_type: str) -> Tuple[str, str]:
+    """Эмодзи и действие для текста уведомления"""
+    if reaction_type == 'like':
+        return "❤️", "поставил лайк"
+    if reaction_type == 'comment':
+        return "💬", "прокомментировал"
+    return "👍", f"отреагировал ({html.escape(reaction_type)})"
+
+def format_reactions_notification(author_username: str, reactions: List[Tuple[str, str]]) -> str:
+    """Текст уведомления автору о реакциях (reactor_username, type), разметка HTML"""
+    # Имена приходят от клиента WebApp и из Telegram - экранируем для parse_mode='HTML'
+    author_username = html.escape(str(author_username))
+    reactions = [(html.escape(str(reactor_username)), reaction_type) for reactor_username, reaction_type in reactions]
+
+    if len(reactions) == 1:
+        reactor_username, reaction_type = reactions[0]
+        emoji, action = describe_reaction(reaction_type)
+        return (
+            f"{emoji} Новая реакция на ваше видео!\n\n"
+            f"👤 @{reactor_username} {action} ваше видео\n"
+            f"🎬 Автор: @{author_username}\n\n"
+            f"💡 Чтобы отключить уведомления, используйте /mute"
+        )
+    
+    lines = []
+    for reactor_username, reaction_type in reactions[:NOTIFICATION_MAX_LINES]:
+        emoji, action = describe_reaction(reaction_type)
+        lines.append(f"{emoji} @{reactor_username} {action} ваше видео")
+    if len(reactions) > NOTIFICATION_MAX_LINES:
+        lines.append(f"...и еще {len(reactions) - NOTIFICATION_MAX_LINES}")
+    
+    return (
+        f"🔥 Новые реакции на ваши видео!\n\n"
+        + "\n".join(lines) +
+        f"\n🎬 Автор: @{author_username}\n\n"
+        f"💡 Чтобы отключить уведомления, используйте /mute"
+    )
+
 async def send_reaction_notification(user_id: int, file_id: str, reaction_type: str, reactor_username: str):
     """
     Отправляет уведомление автору видео о новой реакции
@@ -45,25 +90,12 @@ async def send_reaction_notification(user_id: int, file_id: str, reaction_type:
         add_reaction(user_id, file_id, reaction_type)
         
         # Формируем сообщение уведомления
-        if reaction_type == 'like':
-            emoji = "❤️"
-            action = "поставил лайк"
-        elif reaction_type == 'comment':
-            emoji = "💬"
-            action = "прокомментировал"
-        else:
-            emoji = "👍"
-            action = f"отреагировал ({reaction_type})"
-        
-        notification_text = (
-            f"{emoji} Новая реакция на ваше видео!\n\n"
-            f"👤 @{reactor_username} {action} ваше видео\n"
-            f"🎬 Автор: @{author_username}\n\n"
-            f"💡 Чтобы отключить уведомления, используйте /mute"
+        notification_text = format_reactions_notification(
+            author_username, [(reactor_username, reaction_type)]
         )
         
         # Отправляем уведомление автору видео
-        bot = Bot(token=BOT_TOKEN)
+        bot = await get_bot()
         await bot.send_message(
             chat_id=author_id,
             text=notification_text,
@@ -115,4 +147,91 @@ async def process_reaction(user_id: int, file_id: str, reaction_type: str, usern
         
     except Exception as e:
         logger.error(f"Error processing reaction: {e}")
-        return False 
\ No newline at end of file
+        return False 
+
+async def send_grouped_notification(author_id: int, text: str) -> bool:
+    """Отправляет автору сводное уведомление, False при ошибке Telegram"""
+    try:
+        bot = await get_bot()
+        await bot.send_message(chat_id=author_id, text=text, parse_mode='HTML')
+        return True
+    except TelegramError as e:
+        if "chat not found" in str(e).lower() or "user not found" in str(e).lower():
+            logger.warning(f"Cannot send notification to user {author_id}: user not accessible")
+        else:
+            logger.error(f"Telegram error sending notification to {author_id}: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Error sending grouped notification to {author_id}: {e}")
+        return False
+
+async def process_reactions(reactions: List[dict]) -> List[bool]:
+    """
+    Обрабатывает пачку реакций: одна запись в базу и одно уведомление на автора
+
+    Правила те же, что у process_reaction: реакции на свое видео и авторам
+    с отключенными уведомлениями не сохраняются. Одинаковые реакции
+    (пользователь, видео, тип) внутри пачки учитываются один раз.
+
+    Args:
+        reactions: [{user_id, file_id, type, username}]
+
+    Returns:
+        Успех обработки каждой реакции (в порядке входного списка)
+    """
+    authors = get_video_authors(reaction['file_id'] for reaction in reactions)
+    muted = get_muted_users(author['user_id'] for author in authors.values())
+    
+    # Индекс первого вхождения каждой реакции (повторы разделяют его результат)
+    origin: List[int] = []
+    seen: Dict[Tuple[int, str, str], int] = {}
+    status: Dict[int, bool] = {}
+    to_store: List[Tuple[int, str, str]] = []
+    # Автор -> индексы реакций, вошедших в его уведомление
+    by_author: Dict[int, List[int]] = {}
+    
+    for index, reaction in enumerate(reactions):
+        key = (reaction['user_id'], reaction['file_id'], reaction['type'])
+        if key in seen:
+            origin.append(seen[key])
+            continue
+        seen[key] = index
+        origin.append(index)
+        
+        author = authors.get(reaction['file_id'])
+        if not author:
+            logger.warning(f"Video author not found for file_id: {reaction['file_id']}")
+            status[index] = False
+            continue
+        
+        status[index] = True
+        if reaction['user_id'] == author['user_id'] or author['user_id'] in muted:
+            continue
+        
+        to_store.append(key)
+        by_author.setdefault(author['user_id'], []).append(index)
+    
+    if to_store:
+        add_reactions(to_store)
+    
+    # Одно уведомление на автора, все авторы параллельно
+    notifications = []
+    for author_id, indexes in by_author.items():
+        author_username = authors[reactions[indexes[0]]['file_id']]['username']
+        items = [
+            (reactions[index].get('username') or f"user_{reactions[index]['user_id']}", reactions[index]['type'])
+            for index in indexes
+        ]
+        notifications.append(send_grouped_notification(
+            author_id, format_reactions_notification(author_username, items)
+        ))
+    sent = await asyncio.gather(*notifications)
+    
+    for indexes, ok in zip(by_author.values(), sent):
+        if not ok:
+            for index in indexes:
+                status[index] = False
+    
+    logger.info(f"Processed reaction batch: {len(reactions)} reactions, "
+                f"{len(to_store)} stored, {len(by_author)} notifications")
+    return [status[index] for index in origin]
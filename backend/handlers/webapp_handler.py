@@ -3,30 +3,161 @@
 Обработчик запросов от WebApp
 """
 
+import asyncio
+import hashlib
 import json
 import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Tuple
+from urllib.parse import quote
 from aiohttp import web, web_request
 from aiohttp.web_response import Response
-from utils.cache import get_videos_for_chat, get_stats
-from handlers.reaction_handler import process_reaction
+from utils.cache import (
+    get_videos_page, decode_feed_cursor, get_stats, get_video_author, get_data_version,
+    get_feed_events, get_last_feed_event_id, get_feed_events_floor
+)
+from utils.config import API_RESPONSE_CACHE_SIZE, FEED_STREAM_HEARTBEAT, TELEGRAM_GET_FILE_MAX_MB
+from utils.feed_events import feed_events
+from utils.media_store import media_store, MediaTooLargeError
+from utils.metrics import metrics, shared_metrics
+from utils.http_encoding import (
+    json_response, dumps_json, response_encoding, compress, encoded_etag, response_middleware
+)
+from handlers.reaction_handler import process_reaction, process_reactions
+from utils.telegram_client import get_bot, close_bot
 
 logger = logging.getLogger(__name__)
 
+# Пагинация ленты
+FEED_DEFAULT_LIMIT = 20
+FEED_MAX_LIMIT = 100
+
+# Реакции
+VALID_REACTION_TYPES = ['like', 'comment']
+REACTION_BATCH_MAX = 100
+
+# События, читаемые из базы за один запрос потока ленты
+FEED_STREAM_BATCH = 100
+# Пауза перед переподключением EventSource, мс
+FEED_STREAM_RETRY_MS = 3000
+
+class CachedResponse(NamedTuple):
+    version: int
+    body: bytes
+    etag: str
+    # Сжатые варианты тела: Content-Encoding -> байты
+    encoded: Dict[str, bytes]
+
+class ResponseCache:
+    """
+    Кеш сериализованных ответов API
+
+    Запись действительна, пока не изменилась версия данных (get_data_version),
+    поэтому явная инвалидация не нужна. Старые ключи вытесняются по LRU.
+    """
+
+    def __init__(self, max_entries: int = API_RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: int) -> Optional[CachedResponse]:
+        """Ответ для ключа, если он построен по той же версии данных"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, version: int, payload: Any) -> CachedResponse:
+        """Сериализует ответ и сохраняет его вместе с ETag"""
+        body = dumps_json(payload)
+        entry = CachedResponse(version, body, make_etag(body), {})
+        if self.max_entries <= 0:
+            return entry
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+response_cache = ResponseCache()
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому ответа"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(request: web_request.Request, etag: str) -> bool:
+    """Проверяет If-None-Match (список ETag или '*')"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [item.strip() for item in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+def cached_json_response(request: web_request.Request, entry: CachedResponse) -> Response:
+    """
+    Ответ с ETag; 304 без тела, если у клиента та же версия
+
+    Сжатое тело сохраняется в записи кеша и не пересчитывается до смены версии.
+    """
+    encoding = response_encoding(request, entry.body)
+    etag = encoded_etag(entry.etag, encoding)
+    headers = {
+        'ETag': etag,
+        # Клиент хранит ответ, но каждый раз сверяет его с сервером
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding'
+    }
+    if etag_matches(request, etag):
+        return web.Response(status=304, headers=headers)
+    
+    body = entry.body
+    if encoding:
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = entry.encoded[encoding] = compress(entry.body, encoding)
+        headers['Content-Encoding'] = encoding
+    return web.Response(body=body, content_type='application/json', headers=headers)
+
 async def health_check(request: web_request.Request) -> Response:
     """Health check endpoint"""
-    return web.json_response({
+    return json_response({
         "status": "healthy",
         "service": "TimoReel API",
         "version": "1.0.0",
         "stage": "5 - Reaction Notifications"
     })
 
+def with_media_urls(video: dict) -> dict:
+    """Заменяет флаги готовности постера/превью их URL (None - еще не готовы)"""
+    file_id = quote(video['file_id'], safe='')
+    has_poster = video.pop('has_poster', False)
+    has_preview = video.pop('has_preview', False)
+    
+    video['poster_url'] = f"/api/video/{file_id}/poster" if has_poster else None
+    video['preview_url'] = f"/api/video/{file_id}/preview" if has_preview else None
+    return video
+
 async def get_video_feed(request: web_request.Request) -> Response:
-    """Получает ленту видео для указанного чата"""
+    """
+    Получает страницу ленты видео для указанного чата
+
+    Query параметры: chat_id, limit (по умолчанию 20, максимум 100),
+    before - курсор next_cursor из предыдущего ответа
+    """
     try:
         chat_id = request.query.get('chat_id')
         if not chat_id:
-            return web.json_response(
+            return json_response(
                 {"error": "chat_id parameter is required"}, 
                 status=400
             )
@@ -34,83 +165,209 @@ async def get_video_feed(request: web_request.Request) -> Response:
         try:
             chat_id = int(chat_id)
         except ValueError:
-            return web.json_response(
+            return json_response(
                 {"error": "chat_id must be a valid integer"}, 
                 status=400
             )
         
-        # Получаем видео для чата
-        videos = get_videos_for_chat(chat_id)
+        try:
+            limit = int(request.query.get('limit', FEED_DEFAULT_LIMIT))
+        except ValueError:
+            return json_response(
+                {"error": "limit must be a valid integer"}, 
+                status=400
+            )
+        if limit < 1 or limit > FEED_MAX_LIMIT:
+            return json_response(
+                {"error": f"limit must be between 1 and {FEED_MAX_LIMIT}"}, 
+                status=400
+            )
         
-        logger.info(f"Feed requested for chat {chat_id}: {len(videos)} videos")
+        before = request.query.get('before') or None
+        if before:
+            try:
+                decode_feed_cursor(before)
+            except ValueError:
+                return json_response(
+                    {"error": "before must be a cursor returned as next_cursor"}, 
+                    status=400
+                )
         
-        return web.json_response({
-            "videos": videos,
-            "count": len(videos),
-            "chat_id": chat_id
-        })
+        # Страница пересобирается только после изменения ленты этого чата
+        key = ('feed', chat_id, limit, before)
+        version = get_data_version(f'feed:{chat_id}')
+        entry = response_cache.get(key, version)
+        
+        if entry is None:
+            page = get_videos_page(chat_id, limit=limit, before=before)
+            videos = [with_media_urls(video) for video in page["videos"]]
+            entry = response_cache.put(key, version, {
+                "videos": videos,
+                "count": len(videos),
+                "chat_id": chat_id,
+                "next_cursor": page["next_cursor"],
+                "has_more": page["next_cursor"] is not None
+            })
+            logger.info(f"Feed requested for chat {chat_id}: {len(videos)} videos")
+        else:
+            logger.debug(f"Feed for chat {chat_id} served from cache (version {version})")
+        
+        return cached_json_response(request, entry)
         
     except Exception as e:
         logger.error(f"Error getting video feed: {e}")
-        return web.json_response(
+        return json_response(
             {"error": "Internal server error"}, 
             status=500
         )
 
+def format_sse(event: str, payload: dict, event_id: Optional[int] = None) -> bytes:
+    """Сообщение Server-Sent Events (JSON в одну строку data)"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: ".encode('utf-8') + dumps_json(payload) + b"\n\n"
+
+async def stream_feed(request: web_request.Request) -> web.StreamResponse:
+    """
+    Live-обновления ленты чата (Server-Sent Events)
+
+    События: ready (поток открыт), video_added, video_removed, video_updated,
+    reaction, reset (пропущенные события уже удалены - нужно перечитать ленту).
+    Продолжение после переподключения - по заголовку Last-Event-ID
+    (или параметру last_event_id).
+    """
+    chat_id = request.query.get('chat_id')
+    try:
+        chat_id = int(chat_id)
+    except (TypeError, ValueError):
+        return json_response(
+            {"error": "chat_id must be a valid integer"}, 
+            status=400
+        )
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    if last_event_id:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return json_response(
+                {"error": "Last-Event-ID must be a valid integer"}, 
+                status=400
+            )
+    
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        # Отключает буферизацию в nginx
+        'X-Accel-Buffering': 'no',
+        # CORS middleware добавляет заголовки уже после отправки потока
+        'Access-Control-Allow-Origin': '*'
+    })
+    wake = feed_events.subscribe(chat_id)
+    
+    try:
+        await response.prepare(request)
+        await response.write(f"retry: {FEED_STREAM_RETRY_MS}\n\n".encode('utf-8'))
+        
+        if not last_event_id:
+            last_id = get_last_feed_event_id()
+            await response.write(format_sse('ready', {"chat_id": chat_id}, last_id))
+        elif last_event_id < get_feed_events_floor():
+            last_id = get_last_feed_event_id()
+            await response.write(format_sse('reset', {"chat_id": chat_id}, last_id))
+        else:
+            last_id = last_event_id
+        
+        logger.info(f"Feed stream opened for chat {chat_id} from event {last_id}")
+        
+        while not feed_events.closed:
+            wake.clear()
+            
+            # Все накопившиеся события чата, пачками
+            while True:
+                events = get_feed_events(chat_id, last_id, limit=FEED_STREAM_BATCH)
+                for event in events:
+                    last_id = event.pop('id')
+                    if event.get('video'):
+                        event['video'] = with_media_urls(event['video'])
+                    await response.write(format_sse(event.pop('type'), event, last_id))
+                if len(events) < FEED_STREAM_BATCH:
+                    break
+            
+            try:
+                await asyncio.wait_for(wake.wait(), FEED_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Комментарий держит соединение и выявляет отключившихся клиентов
+                await response.write(b": ping\n\n")
+        
+    except ConnectionResetError:
+        logger.debug(f"Feed stream client disconnected (chat {chat_id})")
+    finally:
+        feed_events.unsubscribe(chat_id, wake)
+    
+    return response
+
+def validate_reaction(data: Any) -> Tuple[Optional[dict], Optional[str]]:
+    """Проверяет реакцию из запроса: (реакция, None) или (None, текст ошибки)"""
+    if not isinstance(data, dict):
+        return None, "Reaction must be a JSON object"
+    
+    # Валидация обязательных полей
+    required_fields = ['user_id', 'file_id', 'type']
+    for field in required_fields:
+        if field not in data:
+            return None, f"Missing required field: {field}"
+    
+    file_id = data['file_id']
+    reaction_type = data['type']
+    
+    # Валидация типов данных
+    try:
+        user_id = int(data['user_id'])
+    except (ValueError, TypeError):
+        return None, "user_id must be a valid integer"
+    
+    if not isinstance(file_id, str) or not file_id.strip():
+        return None, "file_id must be a non-empty string"
+    
+    # Валидация типа реакции
+    if reaction_type not in VALID_REACTION_TYPES:
+        return None, f"Invalid reaction type. Must be one of: {VALID_REACTION_TYPES}"
+    
+    return {
+        "user_id": user_id,
+        "file_id": file_id,
+        "type": reaction_type,
+        "username": data.get('username')  # Опционально
+    }, None
+
 async def send_reaction(request: web_request.Request) -> Response:
     """Обрабатывает реакцию пользователя"""
     try:
         # Получаем данные из запроса
         data = await request.json()
         
-        # Валидация обязательных полей
-        required_fields = ['user_id', 'file_id', 'type']
-        for field in required_fields:
-            if field not in data:
-                return web.json_response(
-                    {"error": f"Missing required field: {field}"}, 
-                    status=400
-                )
-        
-        user_id = data['user_id']
-        file_id = data['file_id']
-        reaction_type = data['type']
-        username = data.get('username')  # Опционально
-        
-        # Валидация типов данных
-        try:
-            user_id = int(user_id)
-        except (ValueError, TypeError):
-            return web.json_response(
-                {"error": "user_id must be a valid integer"}, 
-                status=400
-            )
-        
-        if not isinstance(file_id, str) or not file_id.strip():
-            return web.json_response(
-                {"error": "file_id must be a non-empty string"}, 
+        reaction, error = validate_reaction(data)
+        if error:
+            return json_response(
+                {"error": error}, 
                 status=400
             )
         
-        # Валидация типа реакции
-        valid_types = ['like', 'comment']
-        if reaction_type not in valid_types:
-            return web.json_response(
-                {"error": f"Invalid reaction type. Must be one of: {valid_types}"}, 
-                status=400
-            )
+        user_id = reaction['user_id']
+        file_id = reaction['file_id']
+        reaction_type = reaction['type']
         
         # Обрабатываем реакцию
         success = await process_reaction(
             user_id=user_id,
             file_id=file_id,
             reaction_type=reaction_type,
-            username=username
+            username=reaction['username']
         )
         
         if success:
             logger.info(f"Reaction processed: {user_id} {reaction_type} {file_id}")
-            return web.json_response({
+            return json_response({
                 "success": True,
                 "message": f"Reaction '{reaction_type}' processed successfully",
                 "user_id": user_id,
@@ -119,19 +376,74 @@ async def send_reaction(request: web_request.Request) -> Response:
             })
         else:
             logger.warning(f"Failed to process reaction: {user_id} {reaction_type} {file_id}")
-            return web.json_response(
+            return json_response(
                 {"error": "Failed to process reaction"}, 
                 status=500
             )
         
     except json.JSONDecodeError:
-        return web.json_response(
+        return json_response(
             {"error": "Invalid JSON in request body"}, 
             status=400
         )
     except Exception as e:
         logger.error(f"Error processing reaction: {e}")
-        return web.json_response(
+        return json_response(
+            {"error": "Internal server error"}, 
+            status=500
+        )
+
+async def send_reaction_batch(request: web_request.Request) -> Response:
+    """
+    Обрабатывает пачку реакций одним запросом
+
+    Тело: {"reactions": [{user_id, file_id, type, username}, ...]} или сам список.
+    Пачка проверяется целиком до обработки: при ошибке не сохраняется ничего.
+    В ответе results - успех каждой реакции в порядке запроса.
+    """
+    try:
+        data = await request.json()
+        items = data.get('reactions') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return json_response(
+                {"error": "reactions must be a non-empty array"}, 
+                status=400
+            )
+        if len(items) > REACTION_BATCH_MAX:
+            return json_response(
+                {"error": f"Too many reactions in batch (max {REACTION_BATCH_MAX})"}, 
+                status=400
+            )
+        
+        reactions = []
+        for index, item in enumerate(items):
+            reaction, error = validate_reaction(item)
+            if error:
+                return json_response(
+                    {"error": error, "index": index}, 
+                    status=400
+                )
+            reactions.append(reaction)
+        
+        results = await process_reactions(reactions)
+        processed = sum(results)
+        
+        logger.info(f"Reaction batch processed: {processed}/{len(results)}")
+        return json_response({
+            "success": processed == len(results),
+            "processed": processed,
+            "results": results
+        })
+        
+    except json.JSONDecodeError:
+        return json_response(
+            {"error": "Invalid JSON in request body"}, 
+            status=400
+        )
+    except Exception as e:
+        logger.error(f"Error processing reaction batch: {e}")
+        return json_response(
             {"error": "Internal server error"}, 
             status=500
         )
@@ -141,21 +453,87 @@ async def get_video_info(request: web_request.Request) -> Response:
     try:
         file_id = request.match_info.get('file_id')
         if not file_id:
-            return web.json_response(
+            return json_response(
                 {"error": "file_id is required"}, 
                 status=400
             )
         
         # Здесь можно добавить логику получения детальной информации о видео
         # Пока возвращаем базовую информацию
-        return web.json_response({
+        return json_response({
             "file_id": file_id,
             "message": "Video info endpoint - to be implemented"
         })
         
     except Exception as e:
         logger.error(f"Error getting video info: {e}")
-        return web.json_response(
+        return json_response(
+            {"error": "Internal server error"}, 
+            status=500
+        )
+
+async def stream_video(request: web_request.Request) -> web.StreamResponse:
+    """
+    Отдает файл видео для плеера WebApp
+
+    Поддерживает Range (перемотка), ETag/Last-Modified и передачу через sendfile.
+    """
+    try:
+        file_id = request.match_info.get('file_id')
+        
+        # Отдаем только видео из ленты
+        if not file_id or not get_video_author(file_id):
+            return json_response(
+                {"error": "Video not found"}, 
+                status=404
+            )
+        
+        try:
+            path = await media_store.ensure(file_id)
+        except MediaTooLargeError:
+            return json_response(
+                {"error": f"Video is larger than {TELEGRAM_GET_FILE_MAX_MB}MB and cannot be fetched from Telegram"},
+                status=404
+            )
+        if not path:
+            return json_response(
+                {"error": "Video file is not available"}, 
+                status=404
+            )
+        
+        return web.FileResponse(path, headers={
+            'Content-Type': 'video/mp4',
+            'Cache-Control': 'public, max-age=86400'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error streaming video: {e}")
+        return json_response(
+            {"error": "Internal server error"}, 
+            status=500
+        )
+
+async def get_thumbnail(request: web_request.Request) -> web.StreamResponse:
+    """Отдает постер (JPEG) или превью (MP4) видео из кеша медиа"""
+    try:
+        file_id = request.match_info.get('file_id')
+        asset = request.match_info.get('asset')
+        
+        path = media_store.get_asset(file_id, asset) if file_id else None
+        if not path:
+            return json_response(
+                {"error": f"{asset.capitalize()} not found"}, 
+                status=404
+            )
+        
+        return web.FileResponse(path, headers={
+            'Content-Type': 'image/jpeg' if asset == 'poster' else 'video/mp4',
+            'Cache-Control': 'public, max-age=604800'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting thumbnail: {e}")
+        return json_response(
             {"error": "Internal server error"}, 
             status=500
         )
@@ -163,29 +541,75 @@ async def get_video_info(request: web_request.Request) -> Response:
 async def get_statistics(request: web_request.Request) -> Response:
     """Получает общую статистику"""
     try:
-        stats = get_stats()
+        version = get_data_version('stats')
+        entry = response_cache.get('stats', version)
+        if entry is None:
+            entry = response_cache.put('stats', version, get_stats())
         
-        logger.info(f"Statistics requested: {stats}")
+        logger.debug(f"Statistics requested (version {version})")
         
-        return web.json_response(stats)
+        return cached_json_response(request, entry)
         
     except Exception as e:
         logger.error(f"Error getting statistics: {e}")
-        return web.json_response(
+        return json_response(
             {"error": "Internal server error"}, 
             status=500
         )
 
+async def get_metrics(request: web_request.Request) -> Response:
+    """
+    Метрики без кеширования: process - процесса API (время ответов по маршрутам),
+    shared - общие для всех процессов (перекодирование в боте)
+    """
+    try:
+        shared = shared_metrics.snapshot()
+    except Exception as e:
+        logger.error(f"Error reading shared metrics: {e}")
+        shared = None
+    return json_response(
+        {"process": metrics.snapshot(), "shared": shared},
+        headers={'Cache-Control': 'no-store'}
+    )
+
 def setup_routes(app: web.Application):
     """Настраивает маршруты для API"""
     app.router.add_get('/api/health', health_check)
     app.router.add_get('/api/feed', get_video_feed)
+    app.router.add_get('/api/feed/stream', stream_feed)
     app.router.add_post('/api/react', send_reaction)
+    app.router.add_post('/api/react/batch', send_reaction_batch)
     app.router.add_get('/api/video/{file_id}', get_video_info)
+    app.router.add_get('/api/video/{file_id}/stream', stream_video)
+    app.router.add_get('/api/video/{file_id}/{asset:poster|preview}', get_thumbnail)
     app.router.add_get('/api/stats', get_statistics)
+    app.router.add_get('/api/metrics', get_metrics)
     
     logger.info("API routes configured")
 
+async def init_bot_client(app: web.Application):
+    """Заранее инициализирует клиент Bot API (соединение готово к первой реакции)"""
+    try:
+        await get_bot()
+    except Exception as e:
+        logger.warning(f"Bot API client not initialized: {e}")
+
+async def scan_media_store(app: web.Application):
+    """Сверяет индекс кеша медиа с диском при запуске"""
+    media_store.scan()
+
+async def start_feed_events(app: web.Application):
+    """Запускает опрос событий ленты для live-обновлений"""
+    feed_events.start()
+
+async def stop_feed_events(app: web.Application):
+    """Закрывает открытые потоки ленты до остановки сервера"""
+    await feed_events.stop()
+
+async def close_bot_client(app: web.Application):
+    """Закрывает клиент Bot API при остановке сервера"""
+    await close_bot()
+
 def create_api_app() -> web.Application:
     """Создает и настраивает API приложение"""
     app = web.Application()
@@ -202,7 +626,9 @@ def create_api_app() -> web.Application:
             # Добавляем CORS заголовки
             response.headers['Access-Control-Allow-Origin'] = '*'
             response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Range, If-None-Match'
+            response.headers['Access-Control-Expose-Headers'] = 'Content-Range, Accept-Ranges, ETag'
+            response.headers['Timing-Allow-Origin'] = '*'
             response.headers['Access-Control-Max-Age'] = '86400'
             
             return response
@@ -210,8 +636,17 @@ def create_api_app() -> web.Application:
     
     # Добавляем CORS middleware
     app.middlewares.append(cors_handler)
+    # Сжатие ответов и Server-Timing (внутри CORS)
+    app.middlewares.append(response_middleware)
     
     # Настраиваем маршруты
     setup_routes(app)
     
+    # Клиент Bot API для уведомлений живет вместе с приложением
+    app.on_startup.append(init_bot_client)
+    app.on_startup.append(scan_media_store)
+    app.on_startup.append(start_feed_events)
+    app.on_shutdown.append(stop_feed_events)
+    app.on_cleanup.append(close_bot_client)
+    
     return app 
\ No newline at end of file
@@ -14,7 +14,12 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.config import BOT_TOKEN
+from utils.cache import flush_metadata
+from downloader.video_downloader import downloader
 from bot import create_application
+from handlers.download_worker import start_download_workers, stop_download_workers
+from utils.telegram_client import set_shared_bot
+from downloader.short_links import close_short_link_resolver
 from api_server import create_api_app
 from aiohttp import web
 
@@ -68,7 +73,10 @@ async def start_telegram_bot():
         # Запускаем polling
         logger.info("✅ Starting Telegram Bot with polling...")
         await application.initialize()
+        # API сервер отправляет уведомления через тот же клиент и пул соединений
+        set_shared_bot(application.bot)
         await application.start()
+        await start_download_workers(application)
         await application.updater.start_polling(
             allowed_updates=['message', 'callback_query'],
             drop_pending_updates=True
@@ -89,12 +97,12 @@ async def main():
         return
     
     try:
+        # Запускаем Telegram бота (до API сервера - его клиент общий)
+        bot_app = await start_telegram_bot()
+        
         # Запускаем API сервер
         api_runner = await start_api_server()
         
-        # Запускаем Telegram бота
-        bot_app = await start_telegram_bot()
-        
         logger.info("🎉 TimoReel System started successfully!")
         logger.info("📱 Bot is ready to receive messages")
         logger.info("🌐 API Server: http://localhost:8001")
@@ -109,15 +117,21 @@ async def main():
         except KeyboardInterrupt:
             logger.info("🛑 Stopping TimoReel System...")
             
+            # Останавливаем API сервер (использует клиент бота)
+            await api_runner.cleanup()
+            
             # Останавливаем бота
             await bot_app.updater.stop()
+            await stop_download_workers(bot_app)
             await bot_app.stop()
             await bot_app.shutdown()
-            
-            # Останавливаем API сервер
-            await api_runner.cleanup()
+            await close_short_link_resolver()
+            downloader.shutdown()
             
             logger.info("✅ TimoReel System stopped")
+        finally:
+            # Записываем накопленные изменения метаданных на диск
+            flush_metadata()
             
     except Exception as e:
         logger.error(f"❌ Fatal error: {e}")
@@ -5,19 +5,21 @@
 
 import json
 import os
+import re
 import time
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Set, Tuple
+
+from utils.config import MAX_METADATA_ENTRIES, MAX_REACTIONS_PER_USER
+from utils.database import read_connection, transaction, defer, flush
 
 logger = logging.getLogger(__name__)
 
-# Путь к файлу метаданных
+# Путь к директории хранилища
 STORAGE_DIR = os.path.join(os.path.dirname(__file__), '..', 'storage')
-METADATA_FILE = os.path.join(STORAGE_DIR, 'metadata.json')
 
-# Ограничения
-MAX_VIDEOS = 500
-MAX_REACTIONS_PER_USER = 100
+# Ограничения (0 - без ограничения на количество видео)
+MAX_VIDEOS = MAX_METADATA_ENTRIES
 
 def ensure_storage_dir():
     """Создает директорию storage если её нет"""
@@ -25,185 +27,381 @@ def ensure_storage_dir():
         os.makedirs(STORAGE_DIR)
         logger.info(f"Created storage directory: {STORAGE_DIR}")
 
+def flush_metadata():
+    """Переносит WAL в основной файл базы (изменения уже зафиксированы)"""
+    flush()
+
 def load_metadata() -> Dict[str, Any]:
-    """Загружает метаданные из JSON файла"""
-    ensure_storage_dir()
-    
-    if not os.path.exists(METADATA_FILE):
-        # Создаем пустой файл с базовой структурой
-        default_data = {
-            "videos": {},
-            "reactions": {},
-            "user_settings": {},
-            "stats": {
-                "total_videos": 0,
-                "total_reactions": 0,
-                "created_at": int(time.time())
+    """
+    Выгружает все метаданные в формате старого metadata.json
+
+    Читает всю базу целиком - только для экспорта и отладки.
+    """
+    with read_connection() as conn:
+        videos = {
+            row['file_id']: {
+                "chat_id": row['chat_id'],
+                "user_id": row['user_id'],
+                "username": row['username'],
+                "timestamp": row['timestamp']
             }
+            for row in conn.execute('SELECT * FROM videos ORDER BY timestamp, id')
         }
-        save_metadata(default_data)
-        return default_data
-    
-    try:
-        with open(METADATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        # Проверяем структуру и добавляем недостающие поля
-        if "user_settings" not in data:
-            data["user_settings"] = {}
-        if "stats" not in data:
-            data["stats"] = {
-                "total_videos": len(data.get("videos", {})),
-                "total_reactions": sum(len(reactions) for reactions in data.get("reactions", {}).values()),
-                "created_at": int(time.time())
-            }
-            
-        return data
-        
-    except Exception as e:
-        logger.error(f"Error loading metadata: {e}")
-        # Возвращаем пустую структуру в случае ошибки
-        return {
-            "videos": {},
-            "reactions": {},
-            "user_settings": {},
-            "stats": {"total_videos": 0, "total_reactions": 0, "created_at": int(time.time())}
+
+        reactions: Dict[str, List[Dict[str, Any]]] = {}
+        for row in conn.execute('SELECT * FROM reactions ORDER BY timestamp, id'):
+            reactions.setdefault(str(row['user_id']), []).append({
+                "file_id": row['file_id'],
+                "type": row['type'],
+                "timestamp": row['timestamp']
+            })
+
+        user_settings = {
+            str(row['user_id']): json.loads(row['settings'])
+            for row in conn.execute('SELECT * FROM user_settings')
         }
 
-def save_metadata(data: Dict[str, Any]):
-    """Сохраняет метаданные в JSON файл"""
-    ensure_storage_dir()
-    
-    try:
-        # Ограничиваем размер данных
-        if "videos" in data and len(data["videos"]) > MAX_VIDEOS:
-            # Удаляем старые видео
-            videos_items = list(data["videos"].items())
-            videos_items.sort(key=lambda x: x[1].get("timestamp", 0))
-            data["videos"] = dict(videos_items[-MAX_VIDEOS:])
-            logger.info(f"Trimmed videos to {MAX_VIDEOS} entries")
-        
-        # Ограничиваем реакции на пользователя
-        if "reactions" in data:
-            for user_id, reactions in data["reactions"].items():
-                if len(reactions) > MAX_REACTIONS_PER_USER:
-                    reactions.sort(key=lambda x: x.get("timestamp", 0))
-                    data["reactions"][user_id] = reactions[-MAX_REACTIONS_PER_USER:]
-        
-        # Обновляем статистику
-        data["stats"] = {
-            "total_videos": len(data.get("videos", {})),
-            "total_reactions": sum(len(reactions) for reactions in data.get("reactions", {}).values()),
+    return {
+        "videos": videos,
+        "reactions": reactions,
+        "user_settings": user_settings,
+        "stats": {
+            "total_videos": len(videos),
+            "total_reactions": sum(len(items) for items in reactions.values()),
             "last_updated": int(time.time())
         }
-        
-        with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            
-        logger.debug(f"Metadata saved: {len(data.get('videos', {}))} videos, {data['stats']['total_reactions']} reactions")
-        
-    except Exception as e:
-        logger.error(f"Error saving metadata: {e}")
+    }
+
+def _trim_videos(conn):
+    """Удаляет самые старые видео сверх лимита MAX_VIDEOS"""
+    if MAX_VIDEOS <= 0:
+        return
+
+    overflow = conn.execute(
+        'SELECT 1 FROM videos ORDER BY timestamp DESC LIMIT 1 OFFSET ?',
+        (MAX_VIDEOS,)
+    ).fetchone()
+    if overflow:
+        conn.execute(
+            'DELETE FROM videos WHERE id IN ('
+            'SELECT id FROM videos ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?)',
+            (MAX_VIDEOS,)
+        )
+        logger.info(f"Trimmed videos to {MAX_VIDEOS} entries")
+
+def _trim_user_reactions(conn, user_id: int):
+    """Оставляет только последние MAX_REACTIONS_PER_USER реакций пользователя"""
+    overflow = conn.execute(
+        'SELECT 1 FROM reactions WHERE user_id = ? ORDER BY timestamp DESC LIMIT 1 OFFSET ?',
+        (user_id, MAX_REACTIONS_PER_USER)
+    ).fetchone()
+    if overflow:
+        conn.execute(
+            'DELETE FROM reactions WHERE id IN ('
+            'SELECT id FROM reactions WHERE user_id = ? '
+            'ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?)',
+            (user_id, MAX_REACTIONS_PER_USER)
+        )
 
 def add_video_metadata(file_id: str, chat_id: int, user_id: int, username: str):
-    """Добавляет метаданные нового видео"""
-    data = load_metadata()
-    
-    data["videos"][file_id] = {
-        "chat_id": chat_id,
-        "user_id": user_id,
-        "username": username,
-        "timestamp": int(time.time())
-    }
-    
-    save_metadata(data)
+    """
+    Добавляет метаданные нового видео
+
+    Один file_id может быть в нескольких чатах (переотправка из кеша) -
+    у каждого чата своя строка. Повтор в том же чате поднимает видео в ленте.
+    Запись отложенная (см. defer): видео появится в ленте с задержкой
+    не больше FLUSH_INTERVAL_MS.
+    """
+    now = int(time.time())
+
+    def mutation(conn):
+        conn.execute(
+            'INSERT INTO videos (file_id, chat_id, user_id, username, timestamp) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(chat_id, file_id) DO UPDATE SET '
+            'user_id = excluded.user_id, '
+            'username = excluded.username, timestamp = excluded.timestamp',
+            (file_id, chat_id, user_id, username, now)
+        )
+        _trim_videos(conn)
+
+    defer(mutation)
+
     logger.info(f"Added video metadata: {file_id} from user {user_id}")
 
+def encode_feed_cursor(timestamp: int, video_id: int) -> str:
+    """Формирует курсор ленты из позиции последнего видео на странице"""
+    return f"{timestamp}_{video_id}"
+
+FEED_CURSOR_RE = re.compile(r'(\d+)_(\d+)', re.ASCII)
+
+def decode_feed_cursor(cursor: str) -> Tuple[int, int]:
+    """Разбирает курсор ленты, ValueError при неверном формате"""
+    match = FEED_CURSOR_RE.fullmatch(cursor)
+    if not match:
+        raise ValueError(f"Invalid feed cursor: {cursor!r}")
+    return int(match.group(1)), int(match.group(2))
+
+def get_videos_page(chat_id: int, limit: int, before: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Получает страницу ленты чата (новые сначала)
+
+    Args:
+        chat_id: ID чата
+        limit: размер страницы
+        before: курсор из next_cursor предыдущей страницы
+
+    Returns:
+        {"videos": [...], "next_cursor": str или None}
+    """
+    # Постер/превью из кеша медиа, если они уже готовы
+    query = (
+        'SELECT v.id, v.file_id, v.user_id, v.username, v.timestamp, '
+        'COALESCE(m.poster, 0) > 0 AS has_poster, COALESCE(m.preview, 0) > 0 AS has_preview '
+        'FROM videos v LEFT JOIN media_aliases a ON a.file_id = v.file_id '
+        'LEFT JOIN media_files m ON m.name = a.name '
+        'WHERE v.chat_id = ?'
+    )
+    params: List[Any] = [chat_id]
+
+    if before:
+        query += ' AND (v.timestamp, v.id) < (?, ?)'
+        params.extend(decode_feed_cursor(before))
+
+    # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+    query += ' ORDER BY v.timestamp DESC, v.id DESC LIMIT ?'
+    params.append(limit + 1)
+
+    with read_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_feed_cursor(rows[-1]['timestamp'], rows[-1]['id'])
+
+    videos = [
+        {
+            "file_id": row['file_id'],
+            "user_id": row['user_id'],
+            "username": row['username'],
+            "timestamp": row['timestamp'],
+            "has_poster": bool(row['has_poster']),
+            "has_preview": bool(row['has_preview'])
+        }
+        for row in rows
+    ]
+
+    logger.debug(f"Feed page for chat {chat_id}: {len(videos)} videos, next={next_cursor}")
+    return {"videos": videos, "next_cursor": next_cursor}
+
+def get_feed_events(chat_id: int, after_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    События ленты чата после after_id (для live-обновлений WebApp)
+
+    Видео и счетчики реакций берутся на момент чтения. video_added и
+    video_updated для уже удаленных видео приходят с video = None.
+    """
+    with read_connection() as conn:
+        rows = conn.execute(
+            'SELECT e.id, e.type, e.file_id, e.detail, '
+            'v.id AS video_id, v.user_id, v.username, v.timestamp, '
+            'COALESCE(m.poster, 0) > 0 AS has_poster, COALESCE(m.preview, 0) > 0 AS has_preview, '
+            'COALESCE(likes.value, 0) AS likes_count, COALESCE(comments.value, 0) AS comments_count '
+            'FROM feed_events e '
+            'LEFT JOIN videos v ON v.file_id = e.file_id AND v.chat_id = e.chat_id '
+            'LEFT JOIN media_aliases a ON a.file_id = e.file_id '
+            'LEFT JOIN media_files m ON m.name = a.name '
+            "LEFT JOIN counters likes ON likes.scope = 'video:' || e.file_id AND likes.name = 'like' "
+            "LEFT JOIN counters comments ON comments.scope = 'video:' || e.file_id AND comments.name = 'comment' "
+            'WHERE e.chat_id = ? AND e.id > ? ORDER BY e.id LIMIT ?',
+            (chat_id, after_id, limit)
+        ).fetchall()
+
+    events = []
+    for row in rows:
+        event = {"id": row['id'], "type": row['type'], "file_id": row['file_id']}
+        if row['type'] == 'reaction':
+            event["reaction"] = row['detail']
+            event["likes_count"] = row['likes_count']
+            event["comments_count"] = row['comments_count']
+        elif row['type'] in ('video_added', 'video_updated'):
+            event["video"] = {
+                "file_id": row['file_id'],
+                "user_id": row['user_id'],
+                "username": row['username'],
+                "timestamp": row['timestamp'],
+                "has_poster": bool(row['has_poster']),
+                "has_preview": bool(row['has_preview'])
+            } if row['video_id'] is not None else None
+        events.append(event)
+
+    return events
+
+def get_last_feed_event_id() -> int:
+    """ID последнего события ленты (0 - событий не было)"""
+    with read_connection() as conn:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'feed_events'").fetchone()
+
+    return row['seq'] if row else 0
+
+def get_changed_feed_chats(after_id: int) -> Tuple[int, List[int]]:
+    """Чаты с событиями после after_id и ID последнего из этих событий"""
+    with read_connection() as conn:
+        rows = conn.execute(
+            'SELECT chat_id, MAX(id) AS last_id FROM feed_events WHERE id > ? GROUP BY chat_id',
+            (after_id,)
+        ).fetchall()
+
+    last_id = max((row['last_id'] for row in rows), default=after_id)
+    return last_id, [row['chat_id'] for row in rows]
+
+def get_feed_events_floor() -> int:
+    """ID, до которого (включительно) события удалены; продолжение раньше него невозможно"""
+    with read_connection() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'feed_events_trimmed_id'").fetchone()
+
+    return int(row['value']) if row else 0
+
+def trim_feed_events(max_age: int) -> int:
+    """Удаляет события старше max_age секунд, возвращает количество удаленных"""
+    with transaction() as conn:
+        row = conn.execute(
+            'SELECT MAX(id) FROM feed_events WHERE created_at < ?',
+            (int(time.time()) - max_age,)
+        ).fetchone()
+        trimmed_id = row[0]
+        if trimmed_id is None:
+            return 0
+
+        deleted = conn.execute('DELETE FROM feed_events WHERE id <= ?', (trimmed_id,)).rowcount
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('feed_events_trimmed_id', ?)",
+            (str(trimmed_id),)
+        )
+
+    logger.info(f"Trimmed {deleted} feed events up to {trimmed_id}")
+    return deleted
+
 def get_videos_for_chat(chat_id: int) -> List[Dict[str, Any]]:
     """Получает все видео для указанного чата"""
-    data = load_metadata()
-    videos = []
-    
-    for file_id, video_info in data["videos"].items():
-        if video_info["chat_id"] == chat_id:
-            videos.append({
-                "file_id": file_id,
-                "user_id": video_info["user_id"],
-                "username": video_info["username"],
-                "timestamp": video_info["timestamp"]
-            })
-    
-    # Сортируем по времени (новые сначала)
-    videos.sort(key=lambda x: x["timestamp"], reverse=True)
-    
+    with read_connection() as conn:
+        rows = conn.execute(
+            'SELECT file_id, user_id, username, timestamp FROM videos '
+            'WHERE chat_id = ? ORDER BY timestamp DESC, id DESC',
+            (chat_id,)
+        ).fetchall()
+
+    # Новые сначала
+    videos = [dict(row) for row in rows]
+
     logger.debug(f"Found {len(videos)} videos for chat {chat_id}")
     return videos
 
 def add_reaction(user_id: int, file_id: str, reaction_type: str):
-    """Добавляет реакцию пользователя"""
-    data = load_metadata()
-    
-    if "reactions" not in data:
-        data["reactions"] = {}
-    
-    user_id_str = str(user_id)
-    if user_id_str not in data["reactions"]:
-        data["reactions"][user_id_str] = []
-    
-    # Добавляем новую реакцию
-    reaction = {
-        "file_id": file_id,
-        "type": reaction_type,
-        "timestamp": int(time.time())
-    }
-    
-    data["reactions"][user_id_str].append(reaction)
-    
-    save_metadata(data)
+    """Добавляет реакцию пользователя (отложенная запись, см. defer)"""
+    now = int(time.time())
+
+    def mutation(conn):
+        conn.execute(
+            'INSERT INTO reactions (user_id, file_id, type, timestamp) VALUES (?, ?, ?, ?)',
+            (user_id, file_id, reaction_type, now)
+        )
+        _trim_user_reactions(conn, user_id)
+
+    defer(mutation)
+
     logger.info(f"Added reaction: user {user_id} {reaction_type} video {file_id}")
 
+def add_reactions(reactions: List[Tuple[int, str, str]]):
+    """Добавляет пачку реакций (user_id, file_id, type) одной отложенной записью"""
+    now = int(time.time())
+
+    def mutation(conn):
+        conn.executemany(
+            'INSERT INTO reactions (user_id, file_id, type, timestamp) VALUES (?, ?, ?, ?)',
+            [(user_id, file_id, reaction_type, now) for user_id, file_id, reaction_type in reactions]
+        )
+        for user_id in {user_id for user_id, _, _ in reactions}:
+            _trim_user_reactions(conn, user_id)
+
+    defer(mutation)
+
+    logger.info(f"Added {len(reactions)} reactions in batch")
+
 def get_video_author(file_id: str) -> dict:
-    """Получает информацию об авторе видео"""
-    metadata = load_metadata()
-    videos = metadata.get('videos', {})
-    
-    video_info = videos.get(file_id)
-    if not video_info:
+    """Получает информацию об авторе видео (видео в нескольких чатах - первый, кто его прислал)"""
+    with read_connection() as conn:
+        row = conn.execute(
+            'SELECT user_id, username FROM videos WHERE file_id = ? ORDER BY id LIMIT 1',
+            (file_id,)
+        ).fetchone()
+
+    if not row:
         return None
-    
+
     return {
-        'user_id': video_info.get('user_id'),
-        'username': video_info.get('username')
+        'user_id': row['user_id'],
+        'username': row['username']
+    }
+
+def get_video_authors(file_ids: Iterable[str]) -> Dict[str, dict]:
+    """Авторы нескольких видео одним запросом: file_id -> {user_id, username}"""
+    file_ids = list(set(file_ids))
+    if not file_ids:
+        return {}
+
+    placeholders = ', '.join('?' * len(file_ids))
+    with read_connection() as conn:
+        rows = conn.execute(
+            f'SELECT file_id, user_id, username FROM videos WHERE file_id IN ({placeholders}) '
+            'ORDER BY id DESC',
+            file_ids
+        ).fetchall()
+
+    # Для видео в нескольких чатах остается первая (самая ранняя) строка
+    return {
+        row['file_id']: {'user_id': row['user_id'], 'username': row['username']}
+        for row in rows
     }
 
 def get_user_reactions(user_id: int) -> List[Dict[str, Any]]:
     """Получает все реакции пользователя"""
-    data = load_metadata()
-    user_id_str = str(user_id)
-    
-    return data.get("reactions", {}).get(user_id_str, [])
+    with read_connection() as conn:
+        rows = conn.execute(
+            'SELECT file_id, type, timestamp FROM reactions '
+            'WHERE user_id = ? ORDER BY timestamp, id',
+            (user_id,)
+        ).fetchall()
+
+    return [dict(row) for row in rows]
 
 def get_user_settings(user_id: int) -> dict:
     """Получает настройки пользователя"""
-    metadata = load_metadata()
-    user_settings = metadata.get('user_settings', {})
-    return user_settings.get(str(user_id), {})
+    with read_connection() as conn:
+        row = conn.execute(
+            'SELECT settings FROM user_settings WHERE user_id = ?',
+            (user_id,)
+        ).fetchone()
+
+    return json.loads(row['settings']) if row else {}
 
 def update_user_settings(user_id: int, settings: dict):
     """Обновляет настройки пользователя"""
-    metadata = load_metadata()
-    
-    if 'user_settings' not in metadata:
-        metadata['user_settings'] = {}
-    
-    user_key = str(user_id)
-    if user_key not in metadata['user_settings']:
-        metadata['user_settings'][user_key] = {}
-    
-    # Обновляем настройки
-    metadata['user_settings'][user_key].update(settings)
-    
-    save_metadata(metadata)
+    with transaction() as conn:
+        row = conn.execute(
+            'SELECT settings FROM user_settings WHERE user_id = ?',
+            (user_id,)
+        ).fetchone()
+
+        current = json.loads(row['settings']) if row else {}
+        current.update(settings)
+
+        conn.execute(
+            'INSERT OR REPLACE INTO user_settings (user_id, settings) VALUES (?, ?)',
+            (user_id, json.dumps(current, ensure_ascii=False))
+        )
+
     logger.info(f"Updated settings for user {user_id}: {settings}")
 
 def is_user_muted(user_id: int) -> bool:
@@ -211,39 +409,58 @@ def is_user_muted(user_id: int) -> bool:
     settings = get_user_settings(user_id)
     return settings.get('muted', False)
 
+def get_muted_users(user_ids: Iterable[int]) -> Set[int]:
+    """Пользователи из списка, у которых отключены уведомления"""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return set()
+
+    placeholders = ', '.join('?' * len(user_ids))
+    with read_connection() as conn:
+        rows = conn.execute(
+            f'SELECT user_id FROM user_settings WHERE user_id IN ({placeholders}) '
+            "AND json_extract(settings, '$.muted')",
+            user_ids
+        ).fetchall()
+
+    return {row['user_id'] for row in rows}
+
 def set_user_mute_status(user_id: int, muted: bool):
     """Устанавливает статус уведомлений для пользователя"""
     settings = {'muted': muted}
     update_user_settings(user_id, settings)
     logger.info(f"Set mute status for user {user_id}: {muted}")
 
+def get_data_version(scope: str) -> int:
+    """
+    Текущая версия данных ('feed:<chat_id>' или 'stats')
+
+    Увеличивается триггерами базы при каждом изменении, влияющем на ответ API.
+    """
+    with read_connection() as conn:
+        row = conn.execute('SELECT version FROM data_versions WHERE scope = ?', (scope,)).fetchone()
+
+    return row['version'] if row else 0
+
+def get_counters(scope: str = 'global') -> Dict[str, int]:
+    """
+    Счетчики области ('global', 'chat:<id>', 'user:<id>', 'video:<file_id>')
+
+    Поддерживаются триггерами базы, чтение не зависит от объема данных.
+    """
+    with read_connection() as conn:
+        rows = conn.execute('SELECT name, value FROM counters WHERE scope = ?', (scope,)).fetchall()
+
+    return {row['name']: row['value'] for row in rows}
+
 def get_stats() -> dict:
     """Получает общую статистику системы"""
-    metadata = load_metadata()
-    
-    # Считаем статистику
-    total_videos = len(metadata.get('videos', {}))
-    total_reactions = sum(
-        len(reactions) 
-        for reactions in metadata.get('reactions', {}).values()
-    )
-    total_users = len(metadata.get('user_settings', {}))
-    
-    # Считаем реакции по типам
-    likes_count = 0
-    comments_count = 0
-    
-    for user_reactions in metadata.get('reactions', {}).values():
-        for reaction in user_reactions:
-            if reaction.get('type') == 'like':
-                likes_count += 1
-            elif reaction.get('type') == 'comment':
-                comments_count += 1
-    
+    counters = get_counters('global')
+
     return {
-        'total_videos': total_videos,
-        'total_reactions': total_reactions,
-        'total_users': total_users,
-        'likes_count': likes_count,
-        'comments_count': comments_count
-    } 
\ No newline at end of file
+        'total_videos': counters.get('videos', 0),
+        'total_reactions': counters.get('reactions', 0),
+        'total_users': counters.get('users', 0),
+        'likes_count': counters.get('like', 0),
+        'comments_count': counters.get('comment', 0)
+    }
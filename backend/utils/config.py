@@ -6,9 +6,24 @@ load_dotenv()
 # Telegram Bot Token
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
+# Свой сервер Bot API (telegram-bot-api), например http://localhost:8081
+# Пусто - публичный api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '').rstrip('/')
+# Сервер запущен с --local и видит файлы бота по тем же путям: выгрузка по пути к файлу
+TELEGRAM_LOCAL_MODE = bool(TELEGRAM_API_URL) and os.getenv('TELEGRAM_LOCAL_MODE', 'false').lower() in ('1', 'true', 'yes')
+TELEGRAM_BASE_URL = f"{TELEGRAM_API_URL or 'https://api.telegram.org'}/bot"
+TELEGRAM_BASE_FILE_URL = f"{TELEGRAM_API_URL or 'https://api.telegram.org'}/file/bot"
+
 # Paths
 STORAGE_PATH = os.path.join(os.path.dirname(__file__), '..', 'storage')
 METADATA_FILE = os.path.join(STORAGE_PATH, 'metadata.json')
+DATABASE_FILE = os.getenv('DATABASE_FILE', os.path.join(STORAGE_PATH, 'timoreel.db'))
+
+# Отложенная запись реакций и метаданных видео: изменения применяются пакетом
+# раз в FLUSH_INTERVAL_MS или каждые FLUSH_MAX_MUTATIONS изменений (0 - сразу).
+# Блокировка базы держится только на время записи пакета
+FLUSH_INTERVAL_MS = int(os.getenv('FLUSH_INTERVAL_MS', 50))
+FLUSH_MAX_MUTATIONS = int(os.getenv('FLUSH_MAX_MUTATIONS', 100))
 
 # Server settings
 HOST = os.getenv('HOST', '0.0.0.0')
@@ -19,5 +34,90 @@ WEBHOOK_URL = os.getenv('WEBHOOK_URL')
 WEBHOOK_PATH = '/webhook'
 
 # Video settings
-MAX_VIDEO_SIZE = 50 * 1024 * 1024  # 50MB
-MAX_METADATA_ENTRIES = 500  # Максимальное количество записей в metadata.json 
\ No newline at end of file
+# Лимит выгрузки: 2000MB только у своего сервера в local mode, иначе 50MB
+MAX_VIDEO_SIZE_MB = int(os.getenv('MAX_VIDEO_SIZE_MB', 2000 if TELEGRAM_LOCAL_MODE else 50))
+MAX_VIDEO_SIZE = MAX_VIDEO_SIZE_MB * 1024 * 1024
+MAX_METADATA_ENTRIES = int(os.getenv('MAX_VIDEOS', 0))  # Лимит видео в базе (0 - без ограничений)
+MAX_REACTIONS_PER_USER = 100
+ 
+
+# Пул загрузок yt-dlp: 'thread' или 'process'
+DOWNLOAD_EXECUTOR = os.getenv('DOWNLOAD_EXECUTOR', 'thread')
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 4))
+
+# Лимиты запросов к платформам (token bucket): запросов в минуту и размер всплеска
+RATE_LIMITS = {
+    'instagram': (float(os.getenv('INSTAGRAM_RATE_PER_MINUTE', 12)), int(os.getenv('INSTAGRAM_BURST', 3))),
+    'tiktok': (float(os.getenv('TIKTOK_RATE_PER_MINUTE', 60)), int(os.getenv('TIKTOK_BURST', 10))),
+    'other': (float(os.getenv('OTHER_RATE_PER_MINUTE', 60)), int(os.getenv('OTHER_BURST', 10))),
+}
+
+# Максимум одновременных загрузок на платформу
+PLATFORM_CONCURRENCY = {
+    'instagram': int(os.getenv('INSTAGRAM_CONCURRENCY', 1)),
+    'tiktok': int(os.getenv('TIKTOK_CONCURRENCY', 3)),
+    'other': int(os.getenv('OTHER_CONCURRENCY', 2)),
+}
+
+# Кеш Telegram file_id по ID видео на платформе (повторные ссылки без загрузки)
+FILE_ID_CACHE_TTL = int(os.getenv('FILE_ID_CACHE_TTL', 30 * 24 * 3600))  # секунды
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv('FILE_ID_CACHE_MAX_ENTRIES', 10000))
+
+# Раскрытие коротких ссылок (vm.tiktok.com и т.п.) в полные ссылки на видео
+SHORT_LINK_TTL = int(os.getenv('SHORT_LINK_TTL', 30 * 24 * 3600))  # секунды
+SHORT_LINK_TIMEOUT = float(os.getenv('SHORT_LINK_TIMEOUT', 5))
+
+# Очередь загрузок: воркеры, повторные попытки и ограничение очереди
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BASE_DELAY = int(os.getenv('JOB_RETRY_BASE_DELAY', 30))  # секунды, удваивается с каждой попыткой
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 200))  # 0 - без ограничения
+JOB_MAX_PENDING_PER_CHAT = int(os.getenv('JOB_MAX_PENDING_PER_CHAT', 20))
+JOB_MAX_ACTIVE_PER_CHAT = int(os.getenv('JOB_MAX_ACTIVE_PER_CHAT', 2))  # одновременных загрузок в одном чате
+JOB_TURN_TIMEOUT = int(os.getenv('JOB_TURN_TIMEOUT', 20))  # сколько готовое видео ждет ссылки сообщения, стоящие в очереди
+JOB_HISTORY_TTL = int(os.getenv('JOB_HISTORY_TTL', 7 * 24 * 3600))  # хранение завершенных задач
+
+# Кеш сериализованных ответов API (лента, статистика), записей
+API_RESPONSE_CACHE_SIZE = int(os.getenv('API_RESPONSE_CACHE_SIZE', 256))
+
+# Сжатие ответов API (brotli при наличии пакета, иначе gzip)
+API_COMPRESS_MIN_SIZE = int(os.getenv('API_COMPRESS_MIN_SIZE', 1024))  # байты, меньше - без сжатия
+API_GZIP_LEVEL = int(os.getenv('API_GZIP_LEVEL', 6))
+API_BROTLI_QUALITY = int(os.getenv('API_BROTLI_QUALITY', 5))
+
+# Live-обновления ленты (SSE /api/feed/stream)
+FEED_EVENTS_POLL_INTERVAL = float(os.getenv('FEED_EVENTS_POLL_INTERVAL', 1))  # секунды
+FEED_EVENTS_TTL = int(os.getenv('FEED_EVENTS_TTL', 24 * 3600))  # хранение событий для продолжения
+FEED_STREAM_HEARTBEAT = int(os.getenv('FEED_STREAM_HEARTBEAT', 15))  # секунды между ping
+
+# Пул HTTP соединений клиента Bot API для уведомлений о реакциях
+NOTIFY_CONNECTION_POOL_SIZE = int(os.getenv('NOTIFY_CONNECTION_POOL_SIZE', 8))
+
+# Локальный кеш видеофайлов (стриминг в WebApp, повторная отправка без yt-dlp)
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', os.path.join(STORAGE_PATH, 'media'))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 0 - без ограничения
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 30 * 24 * 3600))  # секунды без обращений, 0 - без ограничения
+# Лимит скачивания (get_file): 20MB у публичного Bot API и сервера без --local.
+# Видео больше лимита в кеш не докачать - только если бот сам положил его туда
+TELEGRAM_GET_FILE_MAX_MB = 2000 if TELEGRAM_LOCAL_MODE else 20
+
+# Постеры и превью для ленты (ffmpeg)
+FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+POSTER_WIDTH = int(os.getenv('POSTER_WIDTH', 360))
+PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', 240))
+PREVIEW_SECONDS = int(os.getenv('PREVIEW_SECONDS', 3))
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 1))  # одновременных запусков ffmpeg для постеров/превью
+THUMBNAIL_THREADS = int(os.getenv('THUMBNAIL_THREADS', 1))  # потоков ffmpeg на один запуск
+
+# Перекодирование видео больше MAX_VIDEO_SIZE (ffmpeg в отдельном пуле процессов)
+TRANSCODE_ENABLED = os.getenv('TRANSCODE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', 1))  # одновременных перекодирований
+TRANSCODE_THREADS = int(os.getenv('TRANSCODE_THREADS', 2))  # потоков ffmpeg на одно перекодирование
+TRANSCODE_MAX_INPUT_SIZE = int(os.getenv('TRANSCODE_MAX_INPUT_SIZE', 500 * 1024 * 1024))
+TRANSCODE_MIN_VIDEO_KBPS = int(os.getenv('TRANSCODE_MIN_VIDEO_KBPS', 200))  # ниже - качество неприемлемо
+TRANSCODE_AUDIO_KBPS = int(os.getenv('TRANSCODE_AUDIO_KBPS', 96))
+
+# Выгрузка видео в Telegram потоком с диска
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 2))  # одновременных выгрузок
+UPLOAD_TIMEOUT = int(os.getenv('UPLOAD_TIMEOUT', 300))  # секунды на выгрузку, плюс время по размеру файла
+UPLOAD_MIN_SPEED_KBPS = int(os.getenv('UPLOAD_MIN_SPEED_KBPS', 512))  # медленнее - выгрузка считается зависшей
@@ -0,0 +1,867 @@
+#!/usr/bin/env python3
+"""
+SQLite хранилище метаданных (WAL режим)
+
+transaction() фиксирует изменение сразу своим коротким COMMIT: бот и API могут
+работать в разных процессах, и блокировку записи нельзя держать дольше
+самого изменения. В WAL с synchronous=NORMAL коммит не делает fsync -
+запись на диск пакетно происходит при checkpoint.
+
+Частые изменения с горячих путей (реакции, метаданные видео) идут через
+defer(): копятся в памяти и применяются фоновым потоком одним COMMIT раз в
+FLUSH_INTERVAL_MS или после FLUSH_MAX_MUTATIONS изменений. Блокировка записи
+берется только на время применения пакета, не на все окно ожидания.
+"""
+
+import atexit
+import json
+import os
+import sys
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.config import DATABASE_FILE, METADATA_FILE, FLUSH_INTERVAL_MS, FLUSH_MAX_MUTATIONS
+
+logger = logging.getLogger(__name__)
+
+# Счетчики, пересчитанные по исходным записям: (scope, name, value).
+# scope: 'global', 'chat:<id>', 'user:<id>', 'video:<file_id>';
+# name: 'videos', 'users', 'reactions' или тип реакции ('like', 'comment').
+# Реакции чата - реакции на видео этого чата
+COUNTERS_QUERY = """
+    SELECT 'global' AS scope, 'videos' AS name, COUNT(*) AS value FROM videos
+    UNION ALL SELECT 'chat:' || chat_id, 'videos', COUNT(*) FROM videos GROUP BY chat_id
+    UNION ALL SELECT 'user:' || user_id, 'videos', COUNT(*) FROM videos GROUP BY user_id
+    UNION ALL SELECT 'global', 'users', COUNT(*) FROM user_settings
+    UNION ALL SELECT 'global', 'reactions', COUNT(*) FROM reactions
+    UNION ALL SELECT 'global', type, COUNT(*) FROM reactions GROUP BY type
+    UNION ALL SELECT 'video:' || file_id, 'reactions', COUNT(*) FROM reactions GROUP BY file_id
+    UNION ALL SELECT 'video:' || file_id, type, COUNT(*) FROM reactions GROUP BY file_id, type
+    UNION ALL SELECT 'user:' || user_id, 'reactions', COUNT(*) FROM reactions GROUP BY user_id
+    UNION ALL SELECT 'user:' || user_id, type, COUNT(*) FROM reactions GROUP BY user_id, type
+    UNION ALL SELECT 'chat:' || v.chat_id, 'reactions', COUNT(*)
+        FROM reactions r JOIN videos v ON v.file_id = r.file_id GROUP BY v.chat_id
+    UNION ALL SELECT 'chat:' || v.chat_id, r.type, COUNT(*)
+        FROM reactions r JOIN videos v ON v.file_id = r.file_id GROUP BY v.chat_id, r.type
+"""
+
+# Миграции схемы: индекс в списке + 1 = PRAGMA user_version
+MIGRATIONS = [
+    """
+    CREATE TABLE videos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id TEXT NOT NULL UNIQUE,
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        timestamp INTEGER NOT NULL
+    );
+    CREATE INDEX idx_videos_chat ON videos(chat_id);
+    CREATE INDEX idx_videos_timestamp ON videos(timestamp);
+
+    CREATE TABLE reactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        file_id TEXT NOT NULL,
+        type TEXT NOT NULL,
+        timestamp INTEGER NOT NULL
+    );
+    CREATE INDEX idx_reactions_user ON reactions(user_id, timestamp);
+    CREATE INDEX idx_reactions_file ON reactions(file_id);
+
+    CREATE TABLE user_settings (
+        user_id INTEGER PRIMARY KEY,
+        settings TEXT NOT NULL DEFAULT '{}'
+    );
+
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """,
+    # Индекс ленты чата: chat_id -> видео по времени (курсорная пагинация)
+    """
+    DROP INDEX idx_videos_chat;
+    CREATE INDEX idx_videos_chat_time ON videos(chat_id, timestamp, id);
+    """,
+    # Кеш уже загруженных в Telegram видео: ID видео на платформе -> file_id
+    """
+    CREATE TABLE file_id_cache (
+        video_key TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        title TEXT,
+        created_at INTEGER NOT NULL,
+        last_used INTEGER NOT NULL
+    );
+    CREATE INDEX idx_file_id_cache_last_used ON file_id_cache(last_used);
+    """,
+    # Очередь загрузок (переживает перезапуск бота)
+    """
+    CREATE TABLE download_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        message_id INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at INTEGER NOT NULL DEFAULT 0,
+        status_message_id INTEGER,
+        file_id TEXT,
+        error TEXT,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+    );
+    CREATE INDEX idx_download_jobs_state ON download_jobs(state, next_attempt_at, id);
+    CREATE INDEX idx_download_jobs_chat ON download_jobs(chat_id, state);
+    """,
+    # Индекс локального кеша медиа (файлы в MEDIA_CACHE_DIR)
+    """
+    CREATE TABLE media_files (
+        name TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        video_key TEXT,
+        title TEXT,
+        size INTEGER NOT NULL,
+        duration INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL,
+        last_used INTEGER NOT NULL
+    );
+    CREATE UNIQUE INDEX idx_media_files_file_id ON media_files(file_id);
+    CREATE INDEX idx_media_files_video_key ON media_files(video_key);
+    CREATE INDEX idx_media_files_last_used ON media_files(last_used);
+    """,
+    # Постер и превью видео в кеше медиа (размер в байтах, 0 - нет)
+    """
+    ALTER TABLE media_files ADD COLUMN poster INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE media_files ADD COLUMN preview INTEGER NOT NULL DEFAULT 0;
+    """,
+    # Раскрытые короткие ссылки: 'tiktok-short:<код>' -> ключ и URL видео
+    """
+    CREATE TABLE short_links (
+        short_key TEXT PRIMARY KEY,
+        video_key TEXT NOT NULL,
+        url TEXT NOT NULL,
+        resolved_at INTEGER NOT NULL
+    );
+    """,
+    # Версии данных для кеша ответов API: 'feed:<chat_id>' и 'stats'.
+    # Счетчики увеличивают триггеры, поэтому их видят все процессы
+    """
+    CREATE TABLE data_versions (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+
+    CREATE TRIGGER trg_videos_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO data_versions (scope, version) VALUES ('feed:' || NEW.chat_id, 1), ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_videos_update AFTER UPDATE ON videos BEGIN
+        INSERT INTO data_versions (scope, version)
+        VALUES ('feed:' || OLD.chat_id, 1), ('feed:' || NEW.chat_id, 1), ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_videos_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO data_versions (scope, version) VALUES ('feed:' || OLD.chat_id, 1), ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER trg_reactions_insert AFTER INSERT ON reactions BEGIN
+        INSERT INTO data_versions (scope, version) VALUES ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_reactions_delete AFTER DELETE ON reactions BEGIN
+        INSERT INTO data_versions (scope, version) VALUES ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_user_settings_insert AFTER INSERT ON user_settings BEGIN
+        INSERT INTO data_versions (scope, version) VALUES ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER trg_media_files_insert AFTER INSERT ON media_files
+    WHEN NEW.poster > 0 OR NEW.preview > 0 BEGIN
+        INSERT INTO data_versions (scope, version)
+        SELECT 'feed:' || chat_id, 1 FROM videos WHERE file_id = NEW.file_id
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_media_files_update AFTER UPDATE OF file_id, poster, preview ON media_files
+    WHEN OLD.file_id IS NOT NEW.file_id
+        OR (OLD.poster > 0) IS NOT (NEW.poster > 0)
+        OR (OLD.preview > 0) IS NOT (NEW.preview > 0) BEGIN
+        INSERT INTO data_versions (scope, version)
+        SELECT DISTINCT 'feed:' || chat_id, 1 FROM videos WHERE file_id IN (OLD.file_id, NEW.file_id)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_media_files_delete AFTER DELETE ON media_files
+    WHEN OLD.poster > 0 OR OLD.preview > 0 BEGIN
+        INSERT INTO data_versions (scope, version)
+        SELECT 'feed:' || chat_id, 1 FROM videos WHERE file_id = OLD.file_id
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    """,
+    # Счетчики статистики (COUNTERS_QUERY), поддерживаются триггерами
+    # в той же транзакции, что и изменение данных
+    """
+    CREATE TABLE counters (
+        scope TEXT NOT NULL,
+        name TEXT NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (scope, name)
+    ) WITHOUT ROWID;
+
+    INSERT INTO counters (scope, name, value) SELECT * FROM (""" + COUNTERS_QUERY + """);
+
+    CREATE TRIGGER trg_counters_reactions_insert AFTER INSERT ON reactions BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('global', 'reactions', 1), ('global', NEW.type, 1),
+            ('video:' || NEW.file_id, 'reactions', 1), ('video:' || NEW.file_id, NEW.type, 1),
+            ('user:' || NEW.user_id, 'reactions', 1), ('user:' || NEW.user_id, NEW.type, 1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || v.chat_id, n.name, 1
+        FROM videos v, (SELECT 'reactions' AS name UNION ALL SELECT NEW.type) n
+        WHERE v.file_id = NEW.file_id
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+    CREATE TRIGGER trg_counters_reactions_delete AFTER DELETE ON reactions BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('global', 'reactions', -1), ('global', OLD.type, -1),
+            ('video:' || OLD.file_id, 'reactions', -1), ('video:' || OLD.file_id, OLD.type, -1),
+            ('user:' || OLD.user_id, 'reactions', -1), ('user:' || OLD.user_id, OLD.type, -1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || v.chat_id, n.name, -1
+        FROM videos v, (SELECT 'reactions' AS name UNION ALL SELECT OLD.type) n
+        WHERE v.file_id = OLD.file_id
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+
+    CREATE TRIGGER trg_counters_videos_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('global', 'videos', 1), ('chat:' || NEW.chat_id, 'videos', 1), ('user:' || NEW.user_id, 'videos', 1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || NEW.chat_id, n.name, n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = NEW.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = NEW.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+    CREATE TRIGGER trg_counters_videos_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('global', 'videos', -1), ('chat:' || OLD.chat_id, 'videos', -1), ('user:' || OLD.user_id, 'videos', -1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || OLD.chat_id, n.name, -n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = OLD.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = OLD.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+    CREATE TRIGGER trg_counters_videos_update AFTER UPDATE OF chat_id, user_id ON videos
+    WHEN OLD.chat_id IS NOT NEW.chat_id OR OLD.user_id IS NOT NEW.user_id BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('chat:' || OLD.chat_id, 'videos', -1), ('user:' || OLD.user_id, 'videos', -1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value) VALUES
+            ('chat:' || NEW.chat_id, 'videos', 1), ('user:' || NEW.user_id, 'videos', 1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || OLD.chat_id, n.name, -n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = NEW.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = NEW.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || NEW.chat_id, n.name, n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = NEW.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = NEW.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+
+    -- INSERT OR REPLACE не вызывает DELETE-триггер, поэтому считаем только новых
+    CREATE TRIGGER trg_counters_user_settings_insert BEFORE INSERT ON user_settings
+    WHEN NOT EXISTS (SELECT 1 FROM user_settings WHERE user_id = NEW.user_id) BEGIN
+        INSERT INTO counters (scope, name, value) VALUES ('global', 'users', 1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+    CREATE TRIGGER trg_counters_user_settings_delete AFTER DELETE ON user_settings BEGIN
+        INSERT INTO counters (scope, name, value) VALUES ('global', 'users', -1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+    """,
+    # Журнал изменений ленты для live-обновлений WebApp (id - Last-Event-ID).
+    # type: video_added, video_removed, video_updated (готов постер/превью), reaction
+    """
+    CREATE TABLE feed_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        detail TEXT,
+        created_at INTEGER NOT NULL
+    );
+    CREATE INDEX idx_feed_events_chat ON feed_events(chat_id, id);
+    CREATE INDEX idx_feed_events_created ON feed_events(created_at);
+
+    CREATE TRIGGER trg_feed_events_videos_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        VALUES (NEW.chat_id, 'video_added', NEW.file_id, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+    CREATE TRIGGER trg_feed_events_videos_update AFTER UPDATE ON videos BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        VALUES (OLD.chat_id, 'video_removed', OLD.file_id, CAST(strftime('%s', 'now') AS INTEGER)),
+               (NEW.chat_id, 'video_added', NEW.file_id, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+    CREATE TRIGGER trg_feed_events_videos_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        VALUES (OLD.chat_id, 'video_removed', OLD.file_id, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+    CREATE TRIGGER trg_feed_events_reactions_insert AFTER INSERT ON reactions BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, detail, created_at)
+        SELECT chat_id, 'reaction', NEW.file_id, NEW.type, CAST(strftime('%s', 'now') AS INTEGER)
+        FROM videos WHERE file_id = NEW.file_id;
+    END;
+    CREATE TRIGGER trg_feed_events_media_files_update AFTER UPDATE OF poster, preview ON media_files
+    WHEN (OLD.poster > 0) IS NOT (NEW.poster > 0) OR (OLD.preview > 0) IS NOT (NEW.preview > 0) BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        SELECT chat_id, 'video_updated', file_id, CAST(strftime('%s', 'now') AS INTEGER)
+        FROM videos WHERE file_id = NEW.file_id;
+    END;
+    """,
+    # Метрики, общие для всех процессов (перекодирование в боте видно API).
+    # Счетчик - сумма в sum (min/max NULL), наблюдение - количество/сумма/мин/макс
+    """
+    CREATE TABLE metrics (
+        name TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        min REAL,
+        max REAL
+    ) WITHOUT ROWID;
+    """,
+    # Все file_id файла кеша медиа: имя файла задает стабильный ключ
+    # (file_unique_id), переотправка видео добавляет псевдоним без
+    # переименования. Триггеры постеров/превью находят видео через псевдонимы
+    """
+    CREATE TABLE media_aliases (
+        file_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_media_aliases_name ON media_aliases(name);
+    INSERT INTO media_aliases (file_id, name) SELECT file_id, name FROM media_files;
+
+    DROP TRIGGER trg_media_files_insert;
+    DROP TRIGGER trg_media_files_update;
+    DROP TRIGGER trg_media_files_delete;
+    DROP TRIGGER trg_feed_events_media_files_update;
+
+    CREATE TRIGGER trg_media_files_insert AFTER INSERT ON media_files
+    WHEN NEW.poster > 0 OR NEW.preview > 0 BEGIN
+        INSERT INTO data_versions (scope, version)
+        SELECT DISTINCT 'feed:' || chat_id, 1 FROM videos
+        WHERE file_id IN (SELECT file_id FROM media_aliases WHERE name = NEW.name)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_media_files_update AFTER UPDATE OF poster, preview ON media_files
+    WHEN (OLD.poster > 0) IS NOT (NEW.poster > 0) OR (OLD.preview > 0) IS NOT (NEW.preview > 0) BEGIN
+        INSERT INTO data_versions (scope, version)
+        SELECT DISTINCT 'feed:' || chat_id, 1 FROM videos
+        WHERE file_id IN (SELECT file_id FROM media_aliases WHERE name = NEW.name)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_media_files_delete AFTER DELETE ON media_files
+    WHEN OLD.poster > 0 OR OLD.preview > 0 BEGIN
+        INSERT INTO data_versions (scope, version)
+        SELECT DISTINCT 'feed:' || chat_id, 1 FROM videos
+        WHERE file_id IN (SELECT file_id FROM media_aliases WHERE name = OLD.name)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER trg_media_aliases_insert AFTER INSERT ON media_aliases
+    WHEN EXISTS (SELECT 1 FROM media_files WHERE name = NEW.name AND (poster > 0 OR preview > 0)) BEGIN
+        INSERT INTO data_versions (scope, version)
+        SELECT DISTINCT 'feed:' || chat_id, 1 FROM videos WHERE file_id = NEW.file_id
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER trg_feed_events_media_files_update AFTER UPDATE OF poster, preview ON media_files
+    WHEN (OLD.poster > 0) IS NOT (NEW.poster > 0) OR (OLD.preview > 0) IS NOT (NEW.preview > 0) BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        SELECT chat_id, 'video_updated', file_id, CAST(strftime('%s', 'now') AS INTEGER) FROM videos
+        WHERE file_id IN (SELECT file_id FROM media_aliases WHERE name = NEW.name);
+    END;
+    CREATE TRIGGER trg_feed_events_media_aliases_insert AFTER INSERT ON media_aliases
+    WHEN EXISTS (SELECT 1 FROM media_files WHERE name = NEW.name AND (poster > 0 OR preview > 0)) BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        SELECT chat_id, 'video_updated', file_id, CAST(strftime('%s', 'now') AS INTEGER)
+        FROM videos WHERE file_id = NEW.file_id;
+    END;
+    """,
+    # Видео уникально в пределах чата (chat_id, file_id): переотправка
+    # закешированного file_id в другой чат добавляет строку, а не переносит
+    # видео из ленты первого чата. SQLite не удаляет ограничение UNIQUE,
+    # поэтому таблица пересобирается, и ее триггеры создаются заново
+    """
+    CREATE TABLE videos_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        timestamp INTEGER NOT NULL,
+        UNIQUE (chat_id, file_id)
+    );
+    INSERT INTO videos_new (id, file_id, chat_id, user_id, username, timestamp)
+    SELECT id, file_id, chat_id, user_id, username, timestamp FROM videos;
+
+    -- DROP TABLE удаляет и триггеры таблицы, не вызывая их
+    DROP TABLE videos;
+    -- Триггеры других таблиц ссылаются на videos - без legacy режима RENAME их отвергнет
+    PRAGMA legacy_alter_table = ON;
+    ALTER TABLE videos_new RENAME TO videos;
+    PRAGMA legacy_alter_table = OFF;
+
+    CREATE INDEX idx_videos_chat_time ON videos(chat_id, timestamp, id);
+    CREATE INDEX idx_videos_timestamp ON videos(timestamp);
+    CREATE INDEX idx_videos_file ON videos(file_id);
+
+    CREATE TRIGGER trg_videos_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO data_versions (scope, version) VALUES ('feed:' || NEW.chat_id, 1), ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_videos_update AFTER UPDATE ON videos BEGIN
+        INSERT INTO data_versions (scope, version)
+        VALUES ('feed:' || OLD.chat_id, 1), ('feed:' || NEW.chat_id, 1), ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER trg_videos_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO data_versions (scope, version) VALUES ('feed:' || OLD.chat_id, 1), ('stats', 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER trg_counters_videos_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('global', 'videos', 1), ('chat:' || NEW.chat_id, 'videos', 1), ('user:' || NEW.user_id, 'videos', 1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || NEW.chat_id, n.name, n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = NEW.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = NEW.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+    CREATE TRIGGER trg_counters_videos_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('global', 'videos', -1), ('chat:' || OLD.chat_id, 'videos', -1), ('user:' || OLD.user_id, 'videos', -1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || OLD.chat_id, n.name, -n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = OLD.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = OLD.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+    CREATE TRIGGER trg_counters_videos_update AFTER UPDATE OF chat_id, user_id ON videos
+    WHEN OLD.chat_id IS NOT NEW.chat_id OR OLD.user_id IS NOT NEW.user_id BEGIN
+        INSERT INTO counters (scope, name, value) VALUES
+            ('chat:' || OLD.chat_id, 'videos', -1), ('user:' || OLD.user_id, 'videos', -1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value) VALUES
+            ('chat:' || NEW.chat_id, 'videos', 1), ('user:' || NEW.user_id, 'videos', 1)
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || OLD.chat_id, n.name, -n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = NEW.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = NEW.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO counters (scope, name, value)
+        SELECT 'chat:' || NEW.chat_id, n.name, n.value FROM (
+            SELECT 'reactions' AS name, COUNT(*) AS value FROM reactions WHERE file_id = NEW.file_id
+            UNION ALL SELECT type, COUNT(*) FROM reactions WHERE file_id = NEW.file_id GROUP BY type
+        ) n WHERE n.value > 0
+        ON CONFLICT(scope, name) DO UPDATE SET value = value + excluded.value;
+    END;
+
+    CREATE TRIGGER trg_feed_events_videos_insert AFTER INSERT ON videos BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        VALUES (NEW.chat_id, 'video_added', NEW.file_id, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+    CREATE TRIGGER trg_feed_events_videos_update AFTER UPDATE ON videos BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        VALUES (OLD.chat_id, 'video_removed', OLD.file_id, CAST(strftime('%s', 'now') AS INTEGER)),
+               (NEW.chat_id, 'video_added', NEW.file_id, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+    CREATE TRIGGER trg_feed_events_videos_delete AFTER DELETE ON videos BEGIN
+        INSERT INTO feed_events (chat_id, type, file_id, created_at)
+        VALUES (OLD.chat_id, 'video_removed', OLD.file_id, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+    """,
+]
+
+_lock = threading.RLock()
+_connection: Optional[sqlite3.Connection] = None
+
+# Отложенные изменения (write-behind) и фоновый поток, который их применяет
+_pending: List[Callable[[sqlite3.Connection], None]] = []
+_pending_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+_flusher_wakeup = threading.Event()
+_flusher_stop = threading.Event()
+
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    """Открывает соединение и настраивает SQLite"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+        logger.info(f"Created storage directory: {directory}")
+
+    # Транзакциями управляем сами (BEGIN/COMMIT), поэтому isolation_level=None
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def _split_statements(script: str) -> Iterator[str]:
+    """Разбивает скрипт миграции на команды (';' внутри триггеров не разделяет)"""
+    statement = ''
+    for part in script.split(';'):
+        statement += part + ';'
+        if sqlite3.complete_statement(statement):
+            if statement.rstrip(';').strip():
+                yield statement
+            statement = ''
+
+
+def _migrate(conn: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции, возвращает исходную версию схемы"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in _split_statements(script):
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.info(f"Applied database migration {number}")
+
+    return version
+
+
+def get_connection() -> sqlite3.Connection:
+    """Возвращает общее соединение с базой (создает при первом обращении)"""
+    global _connection
+
+    with _lock:
+        if _connection is None:
+            conn = _open_connection(DATABASE_FILE)
+            initial_version = _migrate(conn)
+            _connection = conn
+            logger.info(f"Database opened: {DATABASE_FILE}")
+
+            # Новая база - переносим данные из старого metadata.json
+            if initial_version == 0 and os.path.exists(METADATA_FILE):
+                import_metadata_json(METADATA_FILE)
+
+        return _connection
+
+
+@contextmanager
+def read_connection() -> Iterator[sqlite3.Connection]:
+    """Соединение для чтения (под общей блокировкой)"""
+    with _lock:
+        yield get_connection()
+
+
+def _apply_pending(conn: sqlite3.Connection):
+    """Применяет отложенные изменения внутри уже открытой транзакции"""
+    with _pending_lock:
+        batch = _pending[:]
+        _pending.clear()
+
+    # Ошибка одного изменения откатывает только его savepoint
+    for mutation in batch:
+        conn.execute('SAVEPOINT mutation')
+        try:
+            mutation(conn)
+        except Exception as e:
+            conn.execute('ROLLBACK TO mutation')
+            logger.error(f"Deferred database write failed: {e}")
+        conn.execute('RELEASE mutation')
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Атомарное изменение данных
+
+    Блокировка записи берется на время блока и снимается COMMIT в конце.
+    Вложенный блок (в том же потоке) становится savepoint внешнего.
+    Отложенные через defer() изменения применяются перед блоком, чтобы
+    порядок записей процесса сохранялся.
+    """
+    with _lock:
+        conn = get_connection()
+
+        if conn.in_transaction:
+            conn.execute('SAVEPOINT mutation')
+            try:
+                yield conn
+            except Exception:
+                conn.execute('ROLLBACK TO mutation')
+                conn.execute('RELEASE mutation')
+                raise
+            conn.execute('RELEASE mutation')
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            _apply_pending(conn)
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+
+def defer(mutation: Callable[[sqlite3.Connection], None]):
+    """
+    Откладывает изменение: mutation(conn) будет применено пакетом
+
+    Изменение становится видно (в том числе другому процессу) не позже чем
+    через FLUSH_INTERVAL_MS. При FLUSH_INTERVAL_MS=0 применяется сразу.
+    """
+    if FLUSH_INTERVAL_MS <= 0:
+        with transaction() as conn:
+            mutation(conn)
+        return
+
+    with _pending_lock:
+        _pending.append(mutation)
+        count = len(_pending)
+
+    _ensure_flusher()
+    if count >= FLUSH_MAX_MUTATIONS:
+        _flusher_wakeup.set()
+
+
+def _commit_pending():
+    """Применяет накопленные изменения одним COMMIT"""
+    with _pending_lock:
+        if not _pending:
+            return
+
+    with _lock:
+        # Внутри открытой транзакции изменения применит ее transaction()
+        if _connection is not None and _connection.in_transaction:
+            return
+        with transaction():
+            pass
+
+
+def _flusher_loop():
+    """Фоновая запись: пакет раз в FLUSH_INTERVAL_MS или по заполнению"""
+    while not _flusher_stop.is_set():
+        _flusher_wakeup.wait(FLUSH_INTERVAL_MS / 1000)
+        _flusher_wakeup.clear()
+        try:
+            _commit_pending()
+        except Exception as e:
+            logger.error(f"Error flushing deferred writes: {e}")
+
+
+def _ensure_flusher():
+    """Запускает фоновый поток записи (один на процесс)"""
+    global _flusher
+
+    if _flusher is not None and _flusher.is_alive():
+        return
+
+    with _pending_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher_stop.clear()
+            _flusher = threading.Thread(target=_flusher_loop, name='db-flusher', daemon=True)
+            _flusher.start()
+
+
+def flush():
+    """
+    Записывает отложенные изменения и переносит WAL в основной файл базы
+
+    Вызывается при остановке и после массовых записей, чтобы WAL не разрастался.
+    """
+    _commit_pending()
+
+    with _lock:
+        if _connection is None or _connection.in_transaction:
+            return
+        _connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    logger.debug("Database WAL checkpointed")
+
+
+def close():
+    """Останавливает фоновую запись, записывает изменения и закрывает соединение"""
+    global _connection
+
+    _flusher_stop.set()
+    _flusher_wakeup.set()
+    if _flusher is not None and _flusher is not threading.current_thread():
+        _flusher.join(timeout=5)
+
+    with _lock:
+        if _connection is not None or _pending:
+            flush()
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+            logger.info("Database closed")
+
+
+# Checkpoint WAL и закрытие соединения при обычном завершении процесса
+atexit.register(close)
+
+
+def import_metadata_json(path: str = METADATA_FILE, force: bool = False) -> Optional[Dict[str, int]]:
+    """
+    Одноразовый импорт metadata.json в SQLite
+
+    Повторный импорт пропускается, если не указан force=True; при
+    force=True уже импортированные видео и реакции не дублируются.
+    Возвращает количество импортированных записей или None.
+    """
+    if not os.path.exists(path):
+        logger.warning(f"Metadata file not found: {path}")
+        return None
+
+    with read_connection() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'metadata_json_imported'").fetchone()
+    if row and not force:
+        logger.info(f"Metadata already imported at {row['value']}, skipping {path}")
+        return None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    videos = [
+        (
+            file_id,
+            info.get('chat_id'),
+            info.get('user_id'),
+            info.get('username'),
+            info.get('timestamp', 0),
+        )
+        for file_id, info in data.get('videos', {}).items()
+    ]
+    reactions = [
+        (
+            int(user_id),
+            reaction.get('file_id'),
+            reaction.get('type'),
+            reaction.get('timestamp', 0),
+        )
+        for user_id, user_reactions in data.get('reactions', {}).items()
+        for reaction in user_reactions
+    ]
+    settings = [
+        (int(user_id), json.dumps(user_settings, ensure_ascii=False))
+        for user_id, user_settings in data.get('user_settings', {}).items()
+    ]
+
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO videos (file_id, chat_id, user_id, username, timestamp) '
+            'VALUES (?, ?, ?, ?, ?)',
+            videos
+        )
+        # Повторный импорт (force) не дублирует уже перенесенные реакции
+        conn.executemany(
+            'INSERT INTO reactions (user_id, file_id, type, timestamp) '
+            'SELECT ?1, ?2, ?3, ?4 WHERE NOT EXISTS ('
+            'SELECT 1 FROM reactions WHERE user_id = ?1 AND timestamp = ?4 '
+            'AND file_id = ?2 AND type = ?3)',
+            reactions
+        )
+        conn.executemany(
+            'INSERT OR REPLACE INTO user_settings (user_id, settings) VALUES (?, ?)',
+            settings
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('metadata_json_imported', ?)",
+            (time.strftime('%Y-%m-%d %H:%M:%S'),)
+        )
+    flush()
+
+    counts = {
+        'videos': len(videos),
+        'reactions': len(reactions),
+        'user_settings': len(settings),
+    }
+    logger.info(f"Imported {path}: {counts}")
+    return counts
+
+
+def check_counters(repair: bool = False) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    """
+    Сверяет таблицу counters с пересчетом по исходным записям
+
+    Возвращает расхождения {(scope, name): (ожидается, в таблице)}.
+    С repair=True пересобирает таблицу, если расхождения есть.
+    """
+    with read_connection() as conn:
+        expected = {
+            (row['scope'], row['name']): row['value']
+            for row in conn.execute(COUNTERS_QUERY)
+        }
+        actual = {
+            (row['scope'], row['name']): row['value']
+            for row in conn.execute('SELECT scope, name, value FROM counters')
+        }
+
+    mismatches = {
+        key: (expected.get(key, 0), actual.get(key, 0))
+        for key in expected.keys() | actual.keys()
+        if expected.get(key, 0) != actual.get(key, 0)
+    }
+
+    if mismatches:
+        logger.warning(f"Found {len(mismatches)} inconsistent counters")
+        if repair:
+            with transaction() as conn:
+                conn.execute('DELETE FROM counters')
+                conn.execute(f'INSERT INTO counters (scope, name, value) SELECT * FROM ({COUNTERS_QUERY})')
+            flush()
+            logger.info("Counters rebuilt from raw records")
+
+    return mismatches
+
+
+if __name__ == '__main__':
+    # python -m utils.database [path/to/metadata.json] [--force]
+    # python -m utils.database --check-counters [--repair]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if '--check-counters' in sys.argv:
+        result = check_counters(repair='--repair' in sys.argv)
+        print(result or 'Counters are consistent')
+        sys.exit(1 if result and '--repair' not in sys.argv else 0)
+
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    result = import_metadata_json(args[0] if args else METADATA_FILE, force='--force' in sys.argv)
+    print(result)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Оповещение подписчиков live-ленты о новых событиях
+
+События пишут триггеры базы (таблица feed_events) в любом процессе, поэтому
+один фоновый опрос раз в FEED_EVENTS_POLL_INTERVAL находит чаты с новыми
+событиями и будит их подписчиков. Сами события подписчик читает из базы
+(get_feed_events), начиная со своего последнего ID.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from utils.cache import get_changed_feed_chats, get_last_feed_event_id, trim_feed_events
+from utils.config import FEED_EVENTS_POLL_INTERVAL, FEED_EVENTS_TTL
+
+logger = logging.getLogger(__name__)
+
+# Очистка старых событий не чаще раза в час
+TRIM_INTERVAL = 3600
+
+
+class FeedEventHub:
+    def __init__(self, poll_interval: float = FEED_EVENTS_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._subscribers: Dict[int, Set[asyncio.Event]] = {}
+        self._last_id = 0
+        self._last_trim = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def subscribe(self, chat_id: int) -> asyncio.Event:
+        """Подписка на события чата: событие выставляется при новых записях"""
+        wake = asyncio.Event()
+        self._subscribers.setdefault(chat_id, set()).add(wake)
+        return wake
+
+    def unsubscribe(self, chat_id: int, wake: asyncio.Event):
+        subscribers = self._subscribers.get(chat_id)
+        if subscribers is not None:
+            subscribers.discard(wake)
+            if not subscribers:
+                del self._subscribers[chat_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def poll(self):
+        """Проверяет новые события и будит подписчиков затронутых чатов"""
+        self._last_id, chats = get_changed_feed_chats(self._last_id)
+        for chat_id in chats:
+            for wake in self._subscribers.get(chat_id, ()):
+                wake.set()
+
+        if time.monotonic() - self._last_trim >= TRIM_INTERVAL:
+            self._last_trim = time.monotonic()
+            trim_feed_events(FEED_EVENTS_TTL)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error polling feed events: {e}")
+
+    def start(self):
+        """Запускает фоновый опрос (в цикле событий API сервера)"""
+        if self._task is None:
+            self.closed = False
+            self._last_id = get_last_feed_event_id()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Feed event hub started from event {self._last_id}")
+
+    async def stop(self):
+        """Останавливает опрос и отпускает все открытые потоки"""
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for subscribers in self._subscribers.values():
+            for wake in subscribers:
+                wake.set()
+        logger.info("Feed event hub stopped")
+
+
+feed_events = FeedEventHub()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Сериализация и сжатие ответов API
+
+JSON кодируется через orjson (если установлен), тело сжимается brotli или
+gzip по Accept-Encoding. Время сериализации и сжатия попадает только в
+заголовок Server-Timing и в метрики процесса по маршрутам (/api/metrics) -
+но не в тела ответов: замеры меняются на каждом запросе и сломали бы ETag.
+"""
+
+import gzip
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from aiohttp import web, web_request
+
+from utils.config import API_COMPRESS_MIN_SIZE, API_GZIP_LEVEL, API_BROTLI_QUALITY
+from utils.metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Поддерживаемые кодировки в порядке предпочтения сервера
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+# Сжимаем только текстовые ответы
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+# Замеры текущего запроса: этап -> миллисекунды
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('api_timings', default=None)
+
+
+def _record(stage: str, started: float):
+    """Добавляет длительность этапа к замерам текущего запроса"""
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0) + (time.perf_counter() - started) * 1000
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Сериализует ответ в компактный UTF-8 JSON"""
+    started = time.perf_counter()
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    _record('serialize', started)
+    return body
+
+
+def json_response(payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    """Замена web.json_response с быстрой сериализацией"""
+    return web.Response(body=dumps_json(payload), status=status,
+                        content_type='application/json', headers=headers)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Выбирает кодировку по Accept-Encoding (с учетом q), None - без сжатия"""
+    if not accept_encoding:
+        return None
+
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for coding in ENCODINGS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def response_encoding(request: web_request.Request, body: bytes) -> Optional[str]:
+    """Кодировка для тела ответа: маленькие тела не сжимаем"""
+    if len(body) < API_COMPRESS_MIN_SIZE:
+        return None
+    return negotiate_encoding(request.headers.get('Accept-Encoding'))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжимает тело ответа выбранной кодировкой"""
+    started = time.perf_counter()
+    if encoding == 'br':
+        body = brotli.compress(body, quality=API_BROTLI_QUALITY)
+    else:
+        body = gzip.compress(body, compresslevel=API_GZIP_LEVEL, mtime=0)
+    _record('compress', started)
+    return body
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """ETag сжатого представления (у каждого Content-Encoding свой)"""
+    if not encoding or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def add_vary(response: web.StreamResponse):
+    """Ответ зависит от Accept-Encoding (для промежуточных кешей)"""
+    vary = response.headers.get('Vary')
+    if not vary:
+        response.headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        response.headers['Vary'] = f'{vary}, Accept-Encoding'
+
+
+def _should_compress(response: web.StreamResponse) -> bool:
+    # FileResponse и прочие потоковые ответы отдаются как есть
+    if type(response) is not web.Response or response.status != 200:
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    return isinstance(response.body, bytes) and response.content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _route_name(request: web_request.Request) -> str:
+    resource = request.match_info.route.resource
+    return resource.canonical if resource is not None else 'unmatched'
+
+
+@web.middleware
+async def response_middleware(request: web_request.Request, handler) -> web.StreamResponse:
+    """Сжимает ответы по Accept-Encoding и отчитывается о затратах времени"""
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    started = time.perf_counter()
+    try:
+        response = await handler(request)
+
+        if _should_compress(response):
+            encoding = response_encoding(request, response.body)
+            if encoding:
+                response.body = compress(response.body, encoding)
+                response.headers['Content-Encoding'] = encoding
+                if 'ETag' in response.headers:
+                    response.headers['ETag'] = encoded_etag(response.headers['ETag'], encoding)
+            add_vary(response)
+    finally:
+        _timings.reset(token)
+
+    # Потоковый ответ (SSE) уже отправлен, его длительность - время подключения
+    if response.prepared:
+        return response
+
+    timings['total'] = (time.perf_counter() - started) * 1000
+
+    # Только в метрики процесса (отдаются без кеширования), не в тела ответов
+    route = _route_name(request)
+    for stage, duration in timings.items():
+        metrics.observe(f'api {route} {stage}_ms', duration)
+
+    response.headers['Server-Timing'] = ', '.join(
+        f'{stage};dur={duration:.2f}' for stage, duration in timings.items()
+    )
+    return response
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Локальный кеш видеофайлов по Telegram file_id
+
+Файлы попадают сюда сразу после загрузки ботом, а при промахе
+скачиваются из Telegram (get_file). Размер кеша ограничен
+MEDIA_CACHE_MAX_BYTES: вытесняются давно не использованные файлы,
+а также файлы без обращений дольше MEDIA_CACHE_MAX_AGE. Индекс
+(file_id, ID видео на платформе, размер, длительность) хранится в
+таблице media_files и сверяется с диском при запуске. Рядом с видео
+лежат его постер (<имя>.poster.jpg) и превью (<имя>.preview.mp4).
+
+Скачать из Telegram можно только файл до TELEGRAM_GET_FILE_MAX_MB (20MB
+у публичного Bot API, в local mode - без этого лимита): видео крупнее
+есть в кеше, только пока бот не вытеснил файл, загруженный им самим.
+
+Имя файла задает стабильный ключ (file_unique_id), а не file_id:
+у переотправленного видео новый file_id, и он добавляется псевдонимом
+в media_aliases - записи ленты со старым file_id тоже находят файл.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from telegram.error import BadRequest, TelegramError
+
+from downloader.singleflight import SingleFlight
+from utils.config import MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, MEDIA_CACHE_MAX_AGE, TELEGRAM_GET_FILE_MAX_MB
+from utils.database import read_connection, transaction, defer
+from utils.telegram_client import get_bot
+
+logger = logging.getLogger(__name__)
+
+# Недокачанные файлы старше этого возраста считаются брошенными
+STALE_PART_AGE = 3600
+
+# Файлы без записи в индексе моложе этого возраста не трогаем при сверке:
+# другой процесс мог только что записать файл и еще не добавить его в индекс
+SCAN_GRACE_PERIOD = 600
+
+# Время последнего обращения обновляется не чаще раза в столько секунд
+TOUCH_INTERVAL = 60
+
+# Производные файлы видео: тип -> суффикс имени
+ASSET_SUFFIXES = {
+    'poster': '.poster.jpg',
+    'preview': '.preview.mp4',
+}
+
+
+class MediaTooLargeError(Exception):
+    """Видео больше лимита get_file: из Telegram его не скачать"""
+
+
+class MediaStore:
+    def __init__(self, directory: str = MEDIA_CACHE_DIR,
+                 max_bytes: int = MEDIA_CACHE_MAX_BYTES,
+                 max_age: int = MEDIA_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._fetches = SingleFlight()
+        # file_id, которые Telegram отказался отдать из-за размера
+        self._too_large = set()
+
+    def _name_for(self, key: str) -> str:
+        """Имя файла в кеше (хеш стабильного ключа, безопасно для ФС)"""
+        return hashlib.sha256(key.encode('utf-8')).hexdigest() + '.mp4'
+
+    def _name_of(self, file_id: str) -> Optional[str]:
+        """Имя файла кеша, к которому привязан file_id"""
+        with read_connection() as conn:
+            row = conn.execute('SELECT name FROM media_aliases WHERE file_id = ?', (file_id,)).fetchone()
+        return row['name'] if row else None
+
+    def path_for(self, key: str) -> str:
+        """Путь к файлу видео в кеше по стабильному ключу (file_unique_id)"""
+        return os.path.join(self.directory, self._name_for(key))
+
+    def asset_path_for(self, file_id: str, asset: str) -> str:
+        """Путь к постеру ('poster') или превью ('preview') видео"""
+        name = self._name_of(file_id) or self._name_for(file_id)
+        return os.path.join(self.directory, name[:-len('.mp4')] + ASSET_SUFFIXES[asset])
+
+    def get_asset(self, file_id: str, asset: str) -> Optional[str]:
+        """Путь к готовому постеру/превью или None"""
+        path = self.asset_path_for(file_id, asset)
+        return path if os.path.exists(path) else None
+
+    def set_asset(self, file_id: str, asset: str, size: int):
+        """Отмечает в индексе готовый постер/превью видео"""
+        with transaction() as conn:
+            conn.execute(
+                f'UPDATE media_files SET {asset} = ? '
+                'WHERE name = (SELECT name FROM media_aliases WHERE file_id = ?)',
+                (size, file_id)
+            )
+        self.evict()
+
+    def _lookup(self, query: str, value: str) -> Optional[Dict[str, Any]]:
+        """Находит файл в индексе, проверяет его наличие и отмечает обращение"""
+        with read_connection() as conn:
+            row = conn.execute(query + ' ORDER BY m.last_used DESC LIMIT 1', (value,)).fetchone()
+
+        if not row:
+            return None
+
+        path = os.path.join(self.directory, row['name'])
+        if not os.path.exists(path):
+            self._forget(row['name'])
+            return None
+
+        # Каждый Range-запрос плеера - обращение: пишем редко и не в event loop
+        now = int(time.time())
+        if now - row['last_used'] >= TOUCH_INTERVAL:
+            defer(lambda conn: conn.execute(
+                'UPDATE media_files SET last_used = ? WHERE name = ?', (now, row['name'])
+            ))
+
+        entry = dict(row)
+        entry['path'] = path
+        return entry
+
+    def get(self, file_id: str) -> Optional[str]:
+        """Путь к закешированному видео (по любому его file_id) или None"""
+        entry = self._lookup(
+            'SELECT m.* FROM media_aliases a JOIN media_files m ON m.name = a.name WHERE a.file_id = ?',
+            file_id
+        )
+        return entry['path'] if entry else None
+
+    def get_by_key(self, video_key: str) -> Optional[Dict[str, Any]]:
+        """Запись кеша по ID видео на платформе: {'path', 'file_id', 'title', 'duration', ...}"""
+        return self._lookup('SELECT m.* FROM media_files m WHERE m.video_key = ?', video_key)
+
+    def put_file(self, file_id: str, source_path: str, unique_id: Optional[str] = None,
+                 video_key: Optional[str] = None, title: Optional[str] = None, duration: int = 0) -> str:
+        """
+        Перемещает загруженный файл в кеш (атомарно для читателей)
+
+        Имя файла - по unique_id (file_unique_id видео), без него - по file_id.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(unique_id or file_id)
+
+        # Сначала во временный файл в той же директории, затем os.replace
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        os.close(fd)
+        try:
+            shutil.move(source_path, temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self._index(file_id, path, video_key, title, duration)
+        logger.debug(f"Stored media for {file_id}: {path}")
+        self.evict()
+        return path
+
+    def _index(self, file_id: str, path: str, video_key: Optional[str] = None,
+               title: Optional[str] = None, duration: int = 0):
+        """Добавляет файл в индекс кеша"""
+        now = int(time.time())
+        name = os.path.basename(path)
+        with transaction() as conn:
+            # file_id уникален в индексе: прежняя запись под другим именем устарела
+            conn.execute('DELETE FROM media_files WHERE file_id = ? AND name != ?', (file_id, name))
+            # Повторная запись того же файла сохраняет его постер/превью и известные поля
+            conn.execute(
+                'INSERT INTO media_files '
+                '(name, file_id, video_key, title, size, duration, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET '
+                'file_id = excluded.file_id, '
+                'video_key = COALESCE(excluded.video_key, video_key), '
+                'title = COALESCE(excluded.title, title), '
+                'size = excluded.size, '
+                'duration = COALESCE(NULLIF(excluded.duration, 0), duration), '
+                'last_used = excluded.last_used',
+                (name, file_id, video_key, title,
+                 os.path.getsize(path), int(duration or 0), now, now)
+            )
+            conn.execute('INSERT OR REPLACE INTO media_aliases (file_id, name) VALUES (?, ?)', (file_id, name))
+
+    def add_file_id(self, path: str, file_id: str):
+        """Привязывает к файлу кеша еще один file_id (видео переотправлено), файл не переименовывается"""
+        name = os.path.basename(path)
+        with transaction() as conn:
+            # Файл могли вытеснить, пока видео отправлялось
+            if conn.execute('SELECT 1 FROM media_files WHERE name = ?', (name,)).fetchone():
+                conn.execute('INSERT OR REPLACE INTO media_aliases (file_id, name) VALUES (?, ?)', (file_id, name))
+
+    def link_unique_id(self, file_id: str, unique_id: str):
+        """Привязывает file_id к уже закешированному файлу с тем же file_unique_id"""
+        self.add_file_id(self.path_for(unique_id), file_id)
+
+    def _forget(self, name: str):
+        """Удаляет файл (вместе с постером и превью) и его запись из индекса"""
+        stem = name[:-len('.mp4')]
+        for path in [os.path.join(self.directory, name)] + [
+            os.path.join(self.directory, stem + suffix) for suffix in ASSET_SUFFIXES.values()
+        ]:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove media file {path}: {e}")
+
+        with transaction() as conn:
+            conn.execute('DELETE FROM media_files WHERE name = ?', (name,))
+            conn.execute('DELETE FROM media_aliases WHERE name = ?', (name,))
+
+    def evict(self):
+        """Вытесняет устаревшие файлы и давно не использованные сверх бюджета"""
+        evicted = []
+
+        with read_connection() as conn:
+            if self.max_age > 0:
+                evicted += [
+                    row['name'] for row in conn.execute(
+                        'SELECT name FROM media_files WHERE last_used < ?',
+                        (int(time.time()) - self.max_age,)
+                    )
+                ]
+
+            if self.max_bytes > 0:
+                total = conn.execute(
+                    'SELECT COALESCE(SUM(size + poster + preview), 0) FROM media_files'
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    for row in conn.execute(
+                        'SELECT name, size + poster + preview AS size FROM media_files ORDER BY last_used, name'
+                    ):
+                        if total <= self.max_bytes:
+                            break
+                        if row['name'] not in evicted:
+                            evicted.append(row['name'])
+                        total -= row['size']
+
+        for name in evicted:
+            self._forget(name)
+
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} media files")
+
+    def scan(self):
+        """
+        Сверяет индекс с диском при запуске
+
+        Удаляет записи без файлов, файлы без записей (их file_id
+        неизвестен) старше SCAN_GRACE_PERIOD и брошенные недокачанные
+        файлы, обновляет размеры.
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        with read_connection() as conn:
+            indexed = {
+                row['name']: (row['size'], row['poster'], row['preview'])
+                for row in conn.execute('SELECT name, size, poster, preview FROM media_files')
+            }
+
+        now = time.time()
+        sizes: Dict[str, Dict[str, int]] = {}
+        orphans = 0
+
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+
+            if entry.name.endswith('.part'):
+                if now - entry.stat().st_mtime > STALE_PART_AGE:
+                    os.remove(entry.path)
+                continue
+
+            # Постер/превью принадлежат видео с тем же префиксом имени
+            stem, _, suffix = entry.name.partition('.')
+            owner = stem + '.mp4'
+            kind = next((asset for asset, asset_suffix in ASSET_SUFFIXES.items()
+                         if '.' + suffix == asset_suffix), 'size')
+
+            if owner not in indexed or (kind == 'size' and owner != entry.name):
+                if now - entry.stat().st_mtime < SCAN_GRACE_PERIOD:
+                    continue
+                os.remove(entry.path)
+                orphans += 1
+                continue
+
+            sizes.setdefault(owner, {'size': 0, 'poster': 0, 'preview': 0})[kind] = entry.stat().st_size
+
+        missing = [name for name in indexed if not sizes.get(name, {}).get('size')]
+        if missing:
+            with transaction() as conn:
+                conn.executemany('DELETE FROM media_files WHERE name = ?', [(name,) for name in missing])
+
+        changed = [
+            (found['size'], found['poster'], found['preview'], name)
+            for name, found in sizes.items()
+            if found['size'] and (found['size'], found['poster'], found['preview']) != indexed[name]
+        ]
+        if changed:
+            with transaction() as conn:
+                conn.executemany(
+                    'UPDATE media_files SET size = ?, poster = ?, preview = ? WHERE name = ?',
+                    changed
+                )
+
+        # Постеры/превью видео, которых уже нет на диске
+        for name in missing:
+            self._forget(name)
+
+        with transaction() as conn:
+            conn.execute('DELETE FROM media_aliases WHERE name NOT IN (SELECT name FROM media_files)')
+
+        logger.info(
+            f"Media cache scanned: {len(indexed) - len(missing)} files, "
+            f"{len(missing)} missing removed from index, {orphans} orphans deleted"
+        )
+        self.evict()
+
+    async def ensure(self, file_id: str) -> Optional[str]:
+        """
+        Путь к видео в кеше, при промахе скачивает его из Telegram
+
+        Raises:
+            MediaTooLargeError: файла нет в кеше, а скачать его не дает лимит get_file
+        """
+        path = self.get(file_id)
+        if path:
+            return path
+
+        if file_id in self._too_large:
+            raise MediaTooLargeError(file_id)
+
+        # Одновременные запросы одного видео ждут одно скачивание
+        path, _ = await self._fetches.run(file_id, lambda: self._fetch(file_id))
+        return path
+
+    async def _fetch(self, file_id: str) -> Optional[str]:
+        """Скачивает видео из Telegram в кеш"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        os.close(fd)
+
+        try:
+            bot = await get_bot()
+            telegram_file = await bot.get_file(file_id)
+
+            # Тот же файл уже в кеше под другим file_id - только добавляем псевдоним
+            path = self.path_for(telegram_file.file_unique_id)
+            if os.path.exists(path):
+                self.link_unique_id(file_id, telegram_file.file_unique_id)
+                if self._name_of(file_id):
+                    logger.info(f"Linked media {file_id} to cached {os.path.basename(path)}")
+                    return path
+
+            await telegram_file.download_to_drive(temp_path)
+            os.replace(temp_path, path)
+        except BadRequest as e:
+            if 'too big' not in str(e).lower():
+                logger.warning(f"Could not fetch media {file_id} from Telegram: {e}")
+                return None
+            self._too_large.add(file_id)
+            logger.warning(
+                f"Media {file_id} is over the {TELEGRAM_GET_FILE_MAX_MB}MB get_file limit "
+                f"and is not in the cache"
+            )
+            raise MediaTooLargeError(file_id) from e
+        except TelegramError as e:
+            logger.warning(f"Could not fetch media {file_id} from Telegram: {e}")
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self._index(file_id, path)
+        self.evict()
+        logger.info(f"Fetched media {file_id} from Telegram")
+        return path
+
+
+# Глобальный экземпляр кеша медиа
+media_store = MediaStore()
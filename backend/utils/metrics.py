@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Простые метрики: счетчики и наблюдения (количество/сумма/мин/макс)
+
+metrics живут в памяти процесса (время ответов API). shared_metrics
+пишутся в базу и видны всем процессам - так метрики перекодирования
+из бота (и его процессов-воркеров) доходят до API.
+"""
+
+import threading
+from typing import Any, Dict
+
+from utils.database import read_connection, transaction
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._observations: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        """Увеличивает счетчик"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """Добавляет наблюдение (длительность, размер и т.п.)"""
+        with self._lock:
+            item = self._observations.get(name)
+            if item is None:
+                self._observations[name] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+            else:
+                item['count'] += 1
+                item['sum'] += value
+                item['min'] = min(item['min'], value)
+                item['max'] = max(item['max'], value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения всех метрик"""
+        with self._lock:
+            observations = {
+                name: dict(item, avg=item['sum'] / item['count'])
+                for name, item in self._observations.items()
+            }
+            return {'counters': dict(self._counters), 'observations': observations}
+
+
+class SharedMetrics:
+    """Метрики в таблице metrics: тот же интерфейс, что у Metrics, но общие для процессов"""
+
+    def incr(self, name: str, value: float = 1):
+        """Увеличивает счетчик"""
+        with transaction() as conn:
+            conn.execute(
+                'INSERT INTO metrics (name, count, sum) VALUES (?, 1, ?) '
+                'ON CONFLICT(name) DO UPDATE SET count = count + 1, sum = sum + excluded.sum',
+                (name, value)
+            )
+
+    def observe(self, name: str, value: float):
+        """Добавляет наблюдение (длительность, размер и т.п.)"""
+        with transaction() as conn:
+            conn.execute(
+                'INSERT INTO metrics (name, count, sum, min, max) VALUES (?, 1, ?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET count = count + 1, sum = sum + excluded.sum, '
+                'min = MIN(min, excluded.min), max = MAX(max, excluded.max)',
+                (name, value, value, value)
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения всех метрик"""
+        counters: Dict[str, float] = {}
+        observations: Dict[str, Dict[str, float]] = {}
+        with read_connection() as conn:
+            for row in conn.execute('SELECT name, count, sum, min, max FROM metrics ORDER BY name'):
+                if row['min'] is None:
+                    counters[row['name']] = row['sum']
+                else:
+                    observations[row['name']] = {
+                        'count': row['count'], 'sum': row['sum'], 'min': row['min'],
+                        'max': row['max'], 'avg': row['sum'] / row['count']
+                    }
+        return {'counters': counters, 'observations': observations}
+
+
+# Глобальные экземпляры метрик
+metrics = Metrics()
+shared_metrics = SharedMetrics()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Общий клиент Telegram Bot API для API сервера
+
+Один инициализированный Bot с пулом keep-alive соединений вместо нового
+клиента на каждое уведомление. При запуске через start_system.py
+используется бот из Application (set_shared_bot).
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from utils.config import (
+    BOT_TOKEN, NOTIFY_CONNECTION_POOL_SIZE,
+    TELEGRAM_BASE_URL, TELEGRAM_BASE_FILE_URL, TELEGRAM_LOCAL_MODE
+)
+
+logger = logging.getLogger(__name__)
+
+_bot: Optional[Bot] = None
+_owned = False  # True - клиент создан здесь и закрывается в close_bot()
+_lock: Optional[asyncio.Lock] = None
+
+
+def set_shared_bot(bot: Bot):
+    """Использовать для уведомлений уже инициализированный бот Application"""
+    global _bot, _owned
+
+    _bot = bot
+    _owned = False
+    logger.info("Using bot application client for notifications")
+
+
+async def get_bot() -> Bot:
+    """Возвращает общий инициализированный Bot (создает при первом обращении)"""
+    global _bot, _owned, _lock
+
+    if _bot is not None:
+        return _bot
+
+    if _lock is None:
+        _lock = asyncio.Lock()
+
+    async with _lock:
+        if _bot is None:
+            bot = Bot(
+                token=BOT_TOKEN,
+                base_url=TELEGRAM_BASE_URL,
+                base_file_url=TELEGRAM_BASE_FILE_URL,
+                local_mode=TELEGRAM_LOCAL_MODE,
+                request=HTTPXRequest(connection_pool_size=NOTIFY_CONNECTION_POOL_SIZE)
+            )
+            await bot.initialize()
+            _bot = bot
+            _owned = True
+            logger.info(f"Bot API client initialized (pool size {NOTIFY_CONNECTION_POOL_SIZE})")
+
+    return _bot
+
+
+async def close_bot():
+    """Закрывает соединения клиента, если он создан здесь"""
+    global _bot, _owned
+
+    if _bot is not None and _owned:
+        await _bot.shutdown()
+        logger.info("Bot API client closed")
+
+    _bot = None
+    _owned = False
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Выгрузка видео в Telegram потоком с диска
+
+python-telegram-bot читает файл целиком в память и собирает multipart
+в памяти, поэтому несколько параллельных выгрузок по 50MB раздувают RSS.
+Здесь sendVideo отправляется через aiohttp: файл читается кусками по
+64KB во время передачи, а число одновременных выгрузок ограничено
+UPLOAD_CONCURRENCY. Если бот работает через свой сервер Bot API в
+local mode, передается только путь к файлу (file://) - сервер читает
+файл с диска сам.
+
+Таймаут выгрузки растет с размером файла (UPLOAD_TIMEOUT плюс время
+передачи на скорости UPLOAD_MIN_SPEED_KBPS), иначе видео на несколько
+GB обрывались бы по фиксированному лимиту.
+"""
+
+import asyncio
+import json
+import os
+import logging
+from pathlib import Path
+from typing import Any, Optional
+
+import aiohttp
+from telegram import Bot, Message
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from utils.config import UPLOAD_CONCURRENCY, UPLOAD_TIMEOUT, UPLOAD_MIN_SPEED_KBPS
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[aiohttp.ClientSession] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """Сессия для выгрузок создается при первом обращении"""
+    global _session
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=UPLOAD_TIMEOUT))
+    return _session
+
+
+def upload_timeout(size: int) -> aiohttp.ClientTimeout:
+    """Таймаут выгрузки файла: базовый плюс передача на минимальной скорости"""
+    total = UPLOAD_TIMEOUT + size / (max(1, UPLOAD_MIN_SPEED_KBPS) * 1024)
+    return aiohttp.ClientTimeout(total=total, sock_connect=UPLOAD_TIMEOUT)
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Ограничение одновременных выгрузок"""
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, UPLOAD_CONCURRENCY))
+    return _semaphore
+
+
+def _form_value(value: Any) -> str:
+    """Значение параметра Bot API в multipart-форме"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _raise_for_error(status: int, data: dict):
+    """Преобразует ответ Bot API с ошибкой в исключение python-telegram-bot"""
+    description = data.get('description', f'HTTP {status}')
+    parameters = data.get('parameters') or {}
+
+    if parameters.get('retry_after'):
+        raise RetryAfter(parameters['retry_after'])
+    if status == 400:
+        raise BadRequest(description)
+    if status == 403:
+        raise Forbidden(description)
+    if status >= 500:
+        raise NetworkError(description)
+    raise TelegramError(description)
+
+
+async def _post(bot: Bot, form: aiohttp.FormData, timeout: aiohttp.ClientTimeout):
+    """Отправляет sendVideo, возвращает (JSON ответа, HTTP статус)"""
+    async with _get_session().post(f"{bot.base_url}/sendVideo", data=form, timeout=timeout) as response:
+        return await response.json(content_type=None), response.status
+
+
+async def send_video_file(bot: Bot, chat_id: int, path: str, **params) -> Message:
+    """
+    Отправляет видео из файла (аналог bot.send_video) без чтения файла в память
+
+    Args:
+        bot: бот (используется его base_url и для разбора ответа)
+        chat_id: чат назначения
+        path: путь к файлу видео
+        params: остальные параметры sendVideo (caption, reply_to_message_id, ...)
+    """
+    async with _get_semaphore():
+        form = aiohttp.FormData()
+        form.add_field('chat_id', str(chat_id))
+        for name, value in params.items():
+            if value is not None:
+                form.add_field(name, _form_value(value))
+
+        # В local mode файл передает в Telegram сам сервер - время тоже зависит от размера
+        timeout = upload_timeout(os.path.getsize(path))
+        try:
+            if bot.local_mode:
+                # Локальный сервер Bot API читает файл сам - тело запроса без файла
+                form.add_field('video', Path(path).resolve().as_uri())
+                data, status = await _post(bot, form, timeout)
+            else:
+                with open(path, 'rb') as video_file:
+                    form.add_field('video', video_file, filename=os.path.basename(path), content_type='video/mp4')
+                    data, status = await _post(bot, form, timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise NetworkError(f"Upload failed: {e}") from e
+
+    if not data.get('ok'):
+        _raise_for_error(status, data)
+
+    logger.debug(f"Uploaded {path} ({os.path.getsize(path)} bytes) to chat {chat_id}")
+    return Message.de_json(data['result'], bot)
+
+
+async def close_upload_session():
+    """Закрывает HTTP сессию выгрузок"""
+    global _session
+
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -1,16 +1,43 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import VideoFeed from './components/VideoFeed'
 import LoadingScreen from './components/LoadingScreen'
 import ErrorScreen from './components/ErrorScreen'
-import { fetchVideoFeed } from './api'
+import { fetchVideoFeed, getFeedStreamUrl, queueReaction } from './api'
 import './styles/App.css'
 
+// События потока ленты, меняющие список видео
+const FEED_EVENTS = ['video_added', 'video_removed', 'video_updated', 'reaction']
+
+// Применяет событие потока к списку видео (повторное применение безопасно)
+const applyFeedEvent = (videos, type, payload) => {
+  switch (type) {
+    case 'video_added':
+      if (!payload.video) return videos
+      return [payload.video, ...videos.filter(video => video.file_id !== payload.file_id)]
+    case 'video_removed':
+      return videos.filter(video => video.file_id !== payload.file_id)
+    case 'video_updated':
+      if (!payload.video) return videos
+      return videos.map(video => video.file_id === payload.file_id ? { ...video, ...payload.video } : video)
+    case 'reaction':
+      return videos.map(video => video.file_id === payload.file_id
+        ? { ...video, likes_count: payload.likes_count, comments_count: payload.comments_count }
+        : video)
+    default:
+      return videos
+  }
+}
+
 function App() {
   const [videos, setVideos] = useState([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [chatId, setChatId] = useState(null)
   const [userId, setUserId] = useState(null)
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
+  // События потока, пришедшие во время загрузки ленты (null - ничего не грузится)
+  const pendingEvents = useRef(null)
 
   useEffect(() => {
     // Получаем параметры от Telegram WebApp
@@ -50,28 +77,86 @@ function App() {
   }, [])
 
   useEffect(() => {
-    if (chatId) {
+    if (!chatId) return
+
+    if (!window.EventSource) {
       loadVideos()
+      return
     }
+
+    // Сначала открываем поток, потом читаем ленту - события между ними не теряются.
+    // После обрыва EventSource сам переподключается с Last-Event-ID
+    const source = new EventSource(getFeedStreamUrl(chatId))
+    let started = false
+    const startLoading = () => {
+      if (!started) {
+        started = true
+        loadVideos()
+      }
+    }
+
+    FEED_EVENTS.forEach(type => {
+      source.addEventListener(type, (event) => {
+        const payload = JSON.parse(event.data)
+        if (pendingEvents.current) {
+          pendingEvents.current.push([type, payload])
+        } else {
+          setVideos(prev => applyFeedEvent(prev, type, payload))
+        }
+      })
+    })
+    source.addEventListener('ready', startLoading)
+    // Пропущенные события уже удалены на сервере - перечитываем ленту
+    source.addEventListener('reset', () => loadVideos())
+    // Поток недоступен - лента хотя бы загрузится обычным запросом
+    source.onerror = startLoading
+
+    return () => source.close()
   }, [chatId])
 
   const loadVideos = async () => {
+    pendingEvents.current = []
     try {
       setLoading(true)
       setError(null)
       
       const data = await fetchVideoFeed(chatId)
-      setVideos(data.videos || [])
+      const pending = pendingEvents.current || []
+      setVideos(pending.reduce(
+        (list, [type, payload]) => applyFeedEvent(list, type, payload),
+        data.videos || []
+      ))
+      setNextCursor(data.next_cursor || null)
       
       console.log(`Loaded ${data.videos?.length || 0} videos for chat ${chatId}`)
     } catch (err) {
       console.error('Error loading videos:', err)
       setError('Не удалось загрузить видео. Попробуйте позже.')
     } finally {
+      pendingEvents.current = null
       setLoading(false)
     }
   }
 
+  // Подгружаем следующую страницу ленты по курсору
+  const loadMoreVideos = async () => {
+    if (!nextCursor || loadingMore) return
+
+    try {
+      setLoadingMore(true)
+
+      const data = await fetchVideoFeed(chatId, { before: nextCursor })
+      setVideos(prev => [...prev, ...(data.videos || [])])
+      setNextCursor(data.next_cursor || null)
+
+      console.log(`Loaded ${data.videos?.length || 0} more videos for chat ${chatId}`)
+    } catch (err) {
+      console.error('Error loading more videos:', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleReaction = async (fileId, type) => {
     if (!userId) {
       console.error('User ID not available')
@@ -79,29 +164,15 @@ function App() {
     }
 
     try {
-      // Отправляем реакцию через API
-      const response = await fetch('/api/react', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          user_id: userId,
-          file_id: fileId,
-          type: type
-        })
-      })
+      // Отправляем реакцию через API (пачками вместе с соседними)
+      await queueReaction(userId, fileId, type)
 
-      if (response.ok) {
-        console.log(`Reaction ${type} sent for video ${fileId}`)
-        
-        // Показываем уведомление через Telegram WebApp
-        if (window.Telegram?.WebApp) {
-          const message = type === 'like' ? '❤️ Лайк отправлен!' : '💬 Комментарий отправлен!'
-          window.Telegram.WebApp.showAlert(message)
-        }
-      } else {
-        throw new Error('Failed to send reaction')
+      console.log(`Reaction ${type} sent for video ${fileId}`)
+
+      // Показываем уведомление через Telegram WebApp
+      if (window.Telegram?.WebApp) {
+        const message = type === 'like' ? '❤️ Лайк отправлен!' : '💬 Комментарий отправлен!'
+        window.Telegram.WebApp.showAlert(message)
       }
     } catch (err) {
       console.error('Error sending reaction:', err)
@@ -124,6 +195,7 @@ function App() {
       <VideoFeed 
         videos={videos} 
         onReaction={handleReaction}
+        onEndReached={loadMoreVideos}
         userId={userId}
       />
     </div>
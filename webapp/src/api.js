@@ -23,9 +23,13 @@ const handleResponse = async (response) => {
   return await response.text()
 }
 
-export const fetchVideoFeed = async (chatId) => {
+export const fetchVideoFeed = async (chatId, { limit, before } = {}) => {
   try {
-    const response = await fetch(`${API_BASE_URL}/feed?chat_id=${chatId}`, {
+    const params = new URLSearchParams({ chat_id: chatId })
+    if (limit) params.set('limit', limit)
+    if (before) params.set('before', before)
+
+    const response = await fetch(`${API_BASE_URL}/feed?${params}`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
@@ -60,6 +64,92 @@ export const sendReaction = async (userId, fileId, type) => {
   }
 }
 
+// Реакции копятся короткое окно и уходят одним запросом /react/batch
+const REACTION_FLUSH_DELAY_MS = 300
+const REACTION_BATCH_SIZE = 50
+
+let reactionBuffer = []
+let reactionTimer = null
+
+export const flushReactions = async () => {
+  clearTimeout(reactionTimer)
+  reactionTimer = null
+
+  const batch = reactionBuffer
+  reactionBuffer = []
+  if (!batch.length) return
+
+  try {
+    const response = await fetch(`${API_BASE_URL}/react/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ reactions: batch.map(item => item.reaction) })
+    })
+
+    const data = await handleResponse(response)
+    batch.forEach((item, index) => {
+      if (data.results?.[index]) {
+        item.resolve(data)
+      } else {
+        item.reject(new ApiError('Failed to process reaction', 500))
+      }
+    })
+  } catch (error) {
+    console.error('Error sending reactions:', error)
+    batch.forEach(item => item.reject(error))
+  }
+}
+
+// Ставит реакцию в очередь; промис завершается после обработки пачки
+// (при закрытии страницы - после отправки beacon)
+export const queueReaction = (userId, fileId, type, username) =>
+  new Promise((resolve, reject) => {
+    reactionBuffer.push({
+      reaction: { user_id: userId, file_id: fileId, type, username },
+      resolve,
+      reject,
+    })
+
+    if (reactionBuffer.length >= REACTION_BATCH_SIZE) {
+      flushReactions()
+    } else if (!reactionTimer) {
+      reactionTimer = setTimeout(flushReactions, REACTION_FLUSH_DELAY_MS)
+    }
+  })
+
+// WebApp закрывают сразу после лайка - отправляем остаток, не дожидаясь окна.
+// text/plain не требует CORS preflight, сервер разбирает тело как JSON
+if (typeof window !== 'undefined') {
+  window.addEventListener('pagehide', () => {
+    if (!reactionBuffer.length || !navigator.sendBeacon) return
+
+    const batch = reactionBuffer
+    const body = JSON.stringify({ reactions: batch.map(item => item.reaction) })
+    if (navigator.sendBeacon(`${API_BASE_URL}/react/batch`, new Blob([body], { type: 'text/plain' }))) {
+      clearTimeout(reactionTimer)
+      reactionTimer = null
+      reactionBuffer = []
+      // Ответа на beacon не будет: завершаем промисы при отправке
+      // (страница может вернуться из bfcache и ждать их)
+      batch.forEach(item => item.resolve({ success: true, beacon: true }))
+    }
+  })
+}
+
+// Полный URL для путей из ответов API (poster_url, preview_url)
+export const resolveApiUrl = (path) =>
+  path ? new URL(path, new URL(API_BASE_URL, window.location.href)).toString() : undefined
+
+// URL файла видео для <video> (сервер поддерживает Range - перемотка без полной загрузки)
+export const getVideoStreamUrl = (fileId) =>
+  `${API_BASE_URL}/video/${encodeURIComponent(fileId)}/stream`
+
+// URL потока live-обновлений ленты (Server-Sent Events для EventSource)
+export const getFeedStreamUrl = (chatId) =>
+  resolveApiUrl(`${API_BASE_URL}/feed/stream?chat_id=${encodeURIComponent(chatId)}`)
+
 export const fetchVideoInfo = async (fileId) => {
   try {
     const response = await fetch(`${API_BASE_URL}/video/${fileId}`, {
@@ -3,7 +3,10 @@ import VideoPlayer from './VideoPlayer'
 import EmptyState from './EmptyState'
 import '../styles/VideoFeed.css'
 
-const VideoFeed = ({ videos, onReaction, userId }) => {
+// За сколько видео до конца ленты подгружать следующую страницу
+const PRELOAD_THRESHOLD = 3
+
+const VideoFeed = ({ videos, onReaction, onEndReached, userId }) => {
   const [currentVideoIndex, setCurrentVideoIndex] = useState(0)
   const containerRef = useRef(null)
   const videoRefs = useRef([])
@@ -27,6 +30,13 @@ const VideoFeed = ({ videos, onReaction, userId }) => {
     })
   }, [currentVideoIndex])
 
+  useEffect(() => {
+    // Подгружаем следующую страницу, когда пользователь близко к концу
+    if (onEndReached && videos.length - currentVideoIndex <= PRELOAD_THRESHOLD) {
+      onEndReached()
+    }
+  }, [currentVideoIndex, videos.length])
+
   const handleScroll = (e) => {
     const container = e.target
     const scrollTop = container.scrollTop
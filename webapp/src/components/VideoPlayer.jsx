@@ -1,6 +1,7 @@
 import React, { forwardRef, useRef, useState, useEffect } from 'react'
 import VideoOverlay from './VideoOverlay'
 import ReactionButtons from './ReactionButtons'
+import { getVideoStreamUrl, resolveApiUrl } from '../api'
 import '../styles/VideoPlayer.css'
 
 const VideoPlayer = forwardRef(({ video, isActive, onReaction, userId }, ref) => {
@@ -84,9 +85,10 @@ const VideoPlayer = forwardRef(({ video, isActive, onReaction, userId }, ref) =>
     return 'только что'
   }
 
-  // Для демонстрации используем placeholder видео
-  // В реальном приложении здесь будет URL видео из Telegram
-  const videoUrl = `https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4`
+  // Видео отдает API сервер из локального кеша медиа
+  const videoUrl = getVideoStreamUrl(video.file_id)
+  // Постер готовит сервер - до воспроизведения грузится только картинка
+  const posterUrl = resolveApiUrl(video.poster_url)
 
   return (
     <div className="video-player">
@@ -95,10 +97,11 @@ const VideoPlayer = forwardRef(({ video, isActive, onReaction, userId }, ref) =>
           ref={videoRef}
           className="video-element"
           src={videoUrl}
+          poster={posterUrl}
           loop
           muted={isMuted}
           playsInline
-          preload="metadata"
+          preload={isActive || !posterUrl ? 'metadata' : 'none'}
         />
         
         {/* Индикатор воспроизведения */}